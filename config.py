@@ -7,6 +7,29 @@ class Settings(BaseSettings):
     ADMIN_IDS: str = ""        # "123456789,987654321" — через запятую
     TIMEZONE: str = "Europe/Berlin"
     DB_PATH: str = "salon.db"
+    DB_READERS: int = 4        # read-only connections in the reader pool
+    DB_COMMIT_WINDOW_MS: int = 5     # group-commit window; 0 = commit immediately
+    DB_COMMIT_MAX_BATCH: int = 64    # flush early once this many commits wait
+    DB_MIGRATION_BATCH: int = 5000   # rows per transaction in migration backfills
+    DB_INSTRUMENT: bool = True       # per-query latency stats (see /dbstats)
+    DB_SLOW_QUERY_MS: float = 100.0  # log statements slower than this
+    DB_BUSY_RETRIES: int = 5         # BEGIN IMMEDIATE retries on SQLITE_BUSY
+    DB_BUSY_BACKOFF_MS: int = 20     # first retry delay, doubled each time
+    USER_CACHE_TTL_SEC: int = 600    # identity cache used by AuthMiddleware
+    USER_CACHE_SIZE: int = 10000
+    FSM_DURABILITY: str = "write_back"   # or "write_through"
+    FSM_CACHE_SIZE: int = 5000           # FSM records kept in memory
+    FSM_FLUSH_INTERVAL_SEC: float = 2.0  # write_back flush period
+    FSM_TTL_HOURS: int = 48              # abandoned FSM rows expire after this
+    FSM_GC_INTERVAL_SEC: int = 3600
+    FSM_GC_BATCH: int = 500
+    ARCHIVE_AFTER_DAYS: int = 90         # appointments older than this move to the archive
+    ARCHIVE_BATCH: int = 500
+    ARCHIVE_INTERVAL_SEC: int = 3600
+    AVAILABILITY_CACHE_SIZE: int = 20000  # cached (master, date, duration) slot lists
+    SLOT_HOLD_SEC: int = 300             # a picked time is held this long while booking
+    EXPORT_BATCH: int = 1000             # rows per fetch / CSV write in exports
+    APPOINTMENTS_PAGE_SIZE: int = 10     # buttons per page in appointment lists
     CONTACT_INFO: str = "📍 Адрес: ул. Примерная, 1\n📞 Телефон: +7 (999) 123-45-67"
 
     @property
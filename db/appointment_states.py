@@ -0,0 +1,163 @@
+"""
+Appointment state machine.
+
+Each action is a compare-and-swap: one UPDATE … WHERE status IN (allowed
+from-states) AND the caller owns the row, RETURNING the row together with
+the display fields handlers and notifications use.  A double tap, or a
+master confirming what the client cancelled a moment earlier, finds the row
+in another state and is rejected; there is no read-then-write window.
+
+Results are (appointment | None, reason) with reason one of
+"ok", "not_found", "conflict" (row exists but not in an allowed state),
+"overlap" or "error" (accept_reschedule only).
+"""
+from __future__ import annotations
+import logging
+
+import aiosqlite
+
+from db import events
+from db.coalescer import commit
+from db.transactions import transaction
+from services.slots import t2m
+
+log = logging.getLogger(__name__)
+
+# action → (allowed from-states, SET clause); :date / :start / :end are action params
+TRANSITIONS: dict[str, tuple[tuple[str, ...], str]] = {
+    "confirm": (("pending",), "status='confirmed'"),
+    "decline": (("pending",), "status='declined'"),
+    "cancel": (("pending", "confirmed"), "status='cancelled'"),
+    "offer_reschedule": (
+        ("pending", "confirmed"),
+        """status='reschedule_offered',
+           status_before_reschedule=status,
+           proposed_date=:date,
+           proposed_start_time=:start,
+           proposed_end_time=:end""",
+    ),
+    "decline_reschedule": (
+        ("reschedule_offered",),
+        """status=CASE status_before_reschedule WHEN 'confirmed' THEN 'confirmed' ELSE 'declined' END,
+           proposed_date=NULL,
+           proposed_start_time=NULL,
+           proposed_end_time=NULL,
+           status_before_reschedule=NULL""",
+    ),
+    "accept_reschedule": (("reschedule_offered",), "status='rescheduled'"),
+}
+
+# Same fields as repositories.get_appointment_by_id, as correlated subqueries
+_RETURNING = """
+    RETURNING *,
+        (SELECT u.tg_id FROM users u WHERE u.id = appointments.client_id)      AS client_tg_id,
+        (SELECT u.full_name FROM users u WHERE u.id = appointments.client_id)  AS client_full_name,
+        (SELECT u.username FROM users u WHERE u.id = appointments.client_id)   AS client_username,
+        (SELECT m.display_name FROM masters m WHERE m.id = appointments.master_id) AS master_display_name,
+        (SELECT mu.tg_id FROM masters m JOIN users mu ON m.user_id = mu.id
+         WHERE m.id = appointments.master_id)                                  AS master_tg_id,
+        (SELECT s.title FROM services s WHERE s.id = appointments.service_id)  AS service_title
+"""
+
+
+def _owner(master_id: int | None, client_id: int | None) -> tuple[str, int]:
+    if (master_id is None) == (client_id is None):
+        raise ValueError("pass exactly one of master_id / client_id")
+    return ("master_id", master_id) if master_id is not None else ("client_id", client_id)
+
+
+def _update_sql(action: str, owner_column: str) -> str:
+    from_states, assignments = TRANSITIONS[action]
+    states = ",".join(f"'{s}'" for s in from_states)
+    return (
+        f"UPDATE appointments SET {assignments} "
+        f"WHERE id=:apt_id AND {owner_column}=:owner_id AND status IN ({states})"
+        f"{_RETURNING}"
+    )
+
+
+async def _rejection(db: aiosqlite.Connection, apt_id: int, owner_column: str, owner_id: int) -> str:
+    """Why a CAS matched nothing; only runs on the rejected path."""
+    cur = await db.execute(
+        f"SELECT 1 FROM appointments WHERE id=? AND {owner_column}=?", (apt_id, owner_id)
+    )
+    return "conflict" if await cur.fetchone() else "not_found"
+
+
+async def apply(
+    db: aiosqlite.Connection,
+    action: str,
+    apt_id: int,
+    *,
+    master_id: int | None = None,
+    client_id: int | None = None,
+    **params,
+) -> tuple[dict | None, str]:
+    """
+    Run `action` on an appointment owned by `master_id` or `client_id`.
+    offer_reschedule needs date / start / end params.
+    """
+    owner_column, owner_id = _owner(master_id, client_id)
+    cur = await db.execute(
+        _update_sql(action, owner_column), {"apt_id": apt_id, "owner_id": owner_id, **params}
+    )
+    row = await cur.fetchone()
+    await commit(db)
+    if not row:
+        return None, await _rejection(db, apt_id, owner_column, owner_id)
+    apt = dict(row)
+    events.emit(events.APPOINTMENTS, master_id=apt["master_id"], date=apt["date"])
+    return apt, "ok"
+
+
+async def accept_reschedule(
+    db: aiosqlite.Connection, apt_id: int, client_id: int
+) -> tuple[dict | None, dict | None, str]:
+    """
+    Retire the offered appointment and book the proposed slot as a new
+    confirmed one, in one transaction.  Returns (old, new, reason).
+    """
+    try:
+        async with transaction(db) as tx:
+            # Retire the original first: the new slot may share its start time
+            cur = await db.execute(
+                _update_sql("accept_reschedule", "client_id"), {"apt_id": apt_id, "owner_id": client_id}
+            )
+            old = await cur.fetchone()
+            if not old:
+                tx.rollback()
+                rejected = True
+            else:
+                old = dict(old)
+                cur = await db.execute(
+                    """SELECT id FROM appointments
+                       WHERE master_id=? AND date=?
+                         AND status IN ('pending','confirmed','reschedule_offered')
+                         AND start_min < ? AND end_min > ?""",
+                    (old["master_id"], old["proposed_date"],
+                     t2m(old["proposed_end_time"]), t2m(old["proposed_start_time"])),
+                )
+                if await cur.fetchone():
+                    tx.rollback()
+                    return None, None, "overlap"
+                cur = await db.execute(
+                    f"""INSERT INTO appointments
+                        (client_id, master_id, service_id, date, start_time, end_time,
+                         client_name, client_phone, status, start_min, end_min)
+                        VALUES (?,?,?,?,?,?,?,?,'confirmed',?,?)
+                        {_RETURNING}""",
+                    (old["client_id"], old["master_id"], old["service_id"],
+                     old["proposed_date"], old["proposed_start_time"], old["proposed_end_time"],
+                     old["client_name"], old["client_phone"],
+                     t2m(old["proposed_start_time"]), t2m(old["proposed_end_time"])),
+                )
+                new = dict(await cur.fetchone())
+                rejected = False
+    except Exception:
+        log.exception("accept_reschedule failed for appointment %s", apt_id)
+        return None, None, "error"
+    if rejected:
+        return None, None, await _rejection(db, apt_id, "client_id", client_id)
+    events.emit(events.APPOINTMENTS, master_id=old["master_id"], date=old["date"])
+    events.emit(events.APPOINTMENTS, master_id=old["master_id"], date=old["proposed_date"])
+    return old, new, "ok"
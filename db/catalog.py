@@ -0,0 +1,96 @@
+"""
+In-memory snapshot of the catalog: services, masters and master_services.
+
+These tables change only when an admin edits them, yet the booking screens
+read them on every tap.  The repository read functions for them are served
+from one immutable `Catalog` built with three queries.  Any catalog
+mutation drops the snapshot; the next read rebuilds it and swaps it in as a
+whole, so readers never see a half-updated catalog.
+"""
+from __future__ import annotations
+import asyncio
+from dataclasses import dataclass
+
+import aiosqlite
+
+from db import events
+
+
+@dataclass(frozen=True)
+class Catalog:
+    services: dict[int, dict]                          # id → services row
+    masters: dict[int, dict]                           # id → masters row + user fields
+    master_services: dict[tuple[int, int], dict]       # (master_id, service_id) → row
+    services_by_title: tuple[dict, ...]
+    masters_by_name: tuple[dict, ...]
+    master_user_ids: frozenset[int]
+
+    def effective(self, master_id: int, service_id: int) -> dict:
+        """{eff_duration, eff_price, ms_active} for a master × service pair."""
+        service = self.services[service_id]
+        ms = self.master_services.get((master_id, service_id)) or {}
+        duration, price, active = ms.get("duration_min"), ms.get("price_text"), ms.get("is_active")
+        return {
+            "eff_duration": duration if duration is not None else service["default_duration_min"],
+            "eff_price": price if price is not None else service["default_price_text"],
+            "ms_active": active if active is not None else 1,
+        }
+
+
+_snapshot: Catalog | None = None
+_generation = 0
+_build_lock = asyncio.Lock()
+
+
+async def _build(db: aiosqlite.Connection) -> Catalog:
+    cur = await db.execute("SELECT * FROM services ORDER BY title")
+    services = [dict(r) for r in await cur.fetchall()]
+    cur = await db.execute(
+        """SELECT m.*, u.tg_id, u.username, u.full_name, u.phone
+           FROM masters m JOIN users u ON m.user_id = u.id
+           ORDER BY m.display_name"""
+    )
+    masters = [dict(r) for r in await cur.fetchall()]
+    cur = await db.execute("SELECT * FROM master_services")
+    master_services = {(r["master_id"], r["service_id"]): dict(r) for r in await cur.fetchall()}
+    return Catalog(
+        services={s["id"]: s for s in services},
+        masters={m["id"]: m for m in masters},
+        master_services=master_services,
+        services_by_title=tuple(services),
+        masters_by_name=tuple(masters),
+        master_user_ids=frozenset(m["user_id"] for m in masters),
+    )
+
+
+async def get_catalog(db: aiosqlite.Connection) -> Catalog:
+    global _snapshot
+    snapshot = _snapshot
+    if snapshot is not None:
+        return snapshot
+    async with _build_lock:
+        if _snapshot is not None:
+            return _snapshot
+        generation = _generation
+        snapshot = await _build(db)
+        if generation == _generation:
+            _snapshot = snapshot
+        # else: invalidated mid-build; serve it once, rebuild on the next read
+        return snapshot
+
+
+def invalidate(**_) -> None:
+    global _snapshot, _generation
+    _generation += 1
+    _snapshot = None
+
+
+def _on_user_changed(user_id: int, **_) -> None:
+    # Master rows carry username / full_name / phone; clients don't matter here
+    if _snapshot is None or user_id in _snapshot.master_user_ids:
+        invalidate()
+
+
+events.subscribe(events.CATALOG, invalidate)
+events.subscribe(events.MASTERS, invalidate)
+events.subscribe(events.USERS, _on_user_changed)
@@ -0,0 +1,94 @@
+"""
+Group commit for the writer connection.
+
+Mutations call `await commit(db)` instead of `db.commit()`.  Commits that
+arrive within DB_COMMIT_WINDOW_MS of each other (or until DB_COMMIT_MAX_BATCH
+callers are waiting) are folded into a single COMMIT, i.e. a single fsync.
+Every caller still awaits the COMMIT that covers its own statements, so
+durability semantics for the caller are unchanged.
+"""
+from __future__ import annotations
+import asyncio
+
+import aiosqlite
+
+from config import settings
+
+
+class WriteCoalescer:
+    def __init__(self, db: aiosqlite.Connection, window_ms: int, max_batch: int):
+        self._db = db
+        self._window = window_ms / 1000
+        self._max_batch = max(1, max_batch)
+        self._waiters: list[asyncio.Future] = []
+        self._timer: asyncio.Task | None = None
+
+    async def commit(self) -> None:
+        if self._window <= 0:
+            await self._db.commit()
+            return
+        fut = asyncio.get_running_loop().create_future()
+        self._waiters.append(fut)
+        if len(self._waiters) >= self._max_batch:
+            await self.flush()
+        elif self._timer is None:
+            self._timer = asyncio.create_task(self._flush_later())
+        await fut
+
+    async def _flush_later(self) -> None:
+        await asyncio.sleep(self._window)
+        self._timer = None
+        await self.flush()
+
+    async def flush(self) -> None:
+        """Commit everything queued so far right now."""
+        if self._timer is not None and self._timer is not asyncio.current_task():
+            self._timer.cancel()
+            self._timer = None
+        waiters, self._waiters = self._waiters, []
+        if not waiters and not self._db.in_transaction:
+            return
+        try:
+            await self._db.commit()
+        except Exception as exc:
+            try:
+                await self._db.rollback()
+            except Exception:
+                pass
+            for fut in waiters:
+                if not fut.done():
+                    fut.set_exception(exc)
+        else:
+            for fut in waiters:
+                if not fut.done():
+                    fut.set_result(None)
+
+
+_coalescers: dict[aiosqlite.Connection, WriteCoalescer] = {}
+
+
+def _get(db: aiosqlite.Connection) -> WriteCoalescer:
+    co = _coalescers.get(db)
+    if co is None:
+        co = _coalescers[db] = WriteCoalescer(
+            db, settings.DB_COMMIT_WINDOW_MS, settings.DB_COMMIT_MAX_BATCH
+        )
+    return co
+
+
+async def commit(db: aiosqlite.Connection) -> None:
+    """Group-committed replacement for `await db.commit()`."""
+    await _get(db).commit()
+
+
+async def flush(db: aiosqlite.Connection) -> None:
+    """Commit pending writes now (before an explicit transaction or close)."""
+    co = _coalescers.get(db)
+    if co is not None:
+        await co.flush()
+
+
+async def forget(db: aiosqlite.Connection) -> None:
+    co = _coalescers.pop(db, None)
+    if co is not None:
+        await co.flush()
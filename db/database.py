@@ -1,35 +1,79 @@
 from __future__ import annotations
 import aiosqlite
 import asyncio
-from pathlib import Path
 from config import settings
+from db import coalescer
+from db.instrumentation import instrument
+from db.migrations import migrate
+from db.transactions import serialize
 
 _db: aiosqlite.Connection | None = None
+_readers: list[aiosqlite.Connection] = []
+_next_reader = 0
 _lock = asyncio.Lock()
 
 
-async def get_db() -> aiosqlite.Connection:
+async def _connect(read_only: bool = False) -> aiosqlite.Connection:
+    db = await aiosqlite.connect(settings.DB_PATH)
+    db.row_factory = aiosqlite.Row
+    await db.execute("PRAGMA foreign_keys = ON")
+    if read_only:
+        await db.execute("PRAGMA query_only = ON")
+    else:
+        await db.execute("PRAGMA journal_mode = WAL")
+    if settings.DB_INSTRUMENT:
+        db = instrument(db)
+    # The writer is shared by every task: gate it for explicit transactions
+    return db if read_only else serialize(db)
+
+
+async def write_db() -> aiosqlite.Connection:
+    """The single connection that performs all writes."""
     global _db
     if _db is None:
         async with _lock:
             if _db is None:
-                _db = await aiosqlite.connect(settings.DB_PATH)
-                _db.row_factory = aiosqlite.Row
-                await _db.execute("PRAGMA foreign_keys = ON")
-                await _db.execute("PRAGMA journal_mode = WAL")
+                _db = await _connect()
     return _db
 
 
+async def get_db() -> aiosqlite.Connection:
+    """Kept for compatibility: same as `write_db()`."""
+    return await write_db()
+
+
+async def read_db() -> aiosqlite.Connection:
+    """
+    A read-only connection from the reader pool (round-robin).
+    WAL lets readers run concurrently with the writer, so SELECTs no longer
+    queue behind writes in the writer's worker thread.
+    """
+    global _readers, _next_reader
+    if not _readers:
+        writer = await write_db()  # creates the file and switches it to WAL first
+        async with _lock:
+            if not _readers:
+                if settings.DB_PATH == ":memory:" or settings.DB_READERS < 1:
+                    # A private in-memory DB cannot be shared between connections
+                    _readers = [writer]
+                else:
+                    _readers = [await _connect(read_only=True) for _ in range(settings.DB_READERS)]
+    _next_reader = (_next_reader + 1) % len(_readers)
+    return _readers[_next_reader]
+
+
 async def init_db():
-    db = await get_db()
-    sql_path = Path(__file__).parent.parent / "init.sql"
-    sql = sql_path.read_text(encoding="utf-8")
-    await db.executescript(sql)
-    await db.commit()
+    """Bring the schema up to date; a no-op beyond one query when it already is."""
+    await migrate(await write_db())
 
 
 async def close_db():
-    global _db
+    global _db, _readers
+    for reader in _readers:
+        if reader is not _db:
+            await reader.close()
+    _readers = []
     if _db is not None:
+        await coalescer.forget(_db)
         await _db.close()
         _db = None
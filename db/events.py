@@ -0,0 +1,27 @@
+"""
+In-process change notifications.
+
+Repositories emit an event once a mutation is committed; in-memory caches
+subscribe and drop whatever the mutation made stale.
+"""
+from __future__ import annotations
+from collections import defaultdict
+from typing import Any, Callable
+
+USERS = "users"                # payload: user_id
+MASTERS = "masters"            # payload: master_id (None = unknown / several)
+APPOINTMENTS = "appointments"  # payload: master_id, date
+BLOCKS = "blocks"              # payload: master_id (None = global block), date
+SCHEDULE = "schedule"          # payload: master_id (None = salon-wide rules/breaks)
+CATALOG = "catalog"            # services / master_services changed; no payload
+
+_listeners: dict[str, list[Callable[..., None]]] = defaultdict(list)
+
+
+def subscribe(event: str, listener: Callable[..., None]) -> None:
+    _listeners[event].append(listener)
+
+
+def emit(event: str, **payload: Any) -> None:
+    for listener in list(_listeners[event]):
+        listener(**payload)
@@ -0,0 +1,202 @@
+"""
+Query latency instrumentation for aiosqlite connections.
+
+`instrument(db)` wraps a connection so every statement is timed and folded
+into per-shape stats: the SQL with whitespace collapsed and `IN (?,?,…)`
+lists shortened, so one repository query is one shape whatever its
+parameters.  Each shape keeps call and row counts, total / max time and a
+latency histogram; statements slower than DB_SLOW_QUERY_MS are logged.
+
+For statements that return rows (SELECT / RETURNING) the first fetch is
+included in the sample, so a sample covers execute + fetchone / fetchall.
+
+`snapshot()` is the dump API; `report()` renders it for /dbstats.
+"""
+from __future__ import annotations
+import logging
+import re
+import time
+from dataclasses import dataclass, field
+
+import aiosqlite
+
+from config import settings
+
+log = logging.getLogger(__name__)
+
+# Upper bounds of the histogram buckets, in milliseconds (last one is open)
+BUCKETS_MS = (0.5, 1, 2, 5, 10, 20, 50, 100, 200, 500, 1000, 2000, float("inf"))
+
+
+@dataclass
+class QueryStats:
+    shape: str
+    calls: int = 0
+    rows: int = 0
+    total_ms: float = 0.0
+    max_ms: float = 0.0
+    buckets: list[int] = field(default_factory=lambda: [0] * len(BUCKETS_MS))
+
+    def add(self, ms: float, rows: int) -> None:
+        self.calls += 1
+        self.rows += rows
+        self.total_ms += ms
+        self.max_ms = max(self.max_ms, ms)
+        for i, bound in enumerate(BUCKETS_MS):
+            if ms <= bound:
+                self.buckets[i] += 1
+                break
+
+    def percentile(self, p: float) -> float:
+        """Upper bucket bound below which `p` (0..1) of the samples fall."""
+        if not self.calls:
+            return 0.0
+        rank, seen = p * self.calls, 0
+        for count, bound in zip(self.buckets, BUCKETS_MS):
+            seen += count
+            if seen >= rank:
+                return min(bound, self.max_ms)
+        return self.max_ms
+
+
+_stats: dict[str, QueryStats] = {}
+
+_WS = re.compile(r"\s+")
+_IN_LIST = re.compile(r"\(\s*\?(?:\s*,\s*\?)+\s*\)")
+_RETURNS_ROWS = re.compile(r"^\s*(SELECT|WITH|PRAGMA)\b|\bRETURNING\b", re.IGNORECASE)
+
+
+def query_shape(sql: str) -> str:
+    return _IN_LIST.sub("(?…)", _WS.sub(" ", sql).strip())
+
+
+def _record(shape: str, ms: float, rows: int) -> None:
+    stats = _stats.get(shape)
+    if stats is None:
+        stats = _stats[shape] = QueryStats(shape)
+    stats.add(ms, rows)
+    if ms >= settings.DB_SLOW_QUERY_MS:
+        log.warning("Slow query (%.1f ms, %d rows): %s", ms, rows, shape)
+
+
+def observe(name: str, ms: float) -> None:
+    """Record a non-SQL timing (e.g. transaction lock wait) under `name`."""
+    _record(name, ms, 0)
+
+
+class _Cursor:
+    """Cursor proxy that completes the sample on the first fetch."""
+
+    def __init__(self, cursor: aiosqlite.Cursor, shape: str, elapsed: float | None):
+        self._cursor = cursor
+        self._shape = shape
+        self._elapsed = elapsed  # None once the sample is recorded
+
+    def __getattr__(self, name):
+        return getattr(self._cursor, name)
+
+    async def _fetch(self, method: str, *args):
+        start = time.perf_counter()
+        result = await getattr(self._cursor, method)(*args)
+        rows = (1 if result is not None else 0) if method == "fetchone" else len(result)
+        if self._elapsed is not None:
+            _record(self._shape, (self._elapsed + time.perf_counter() - start) * 1000, rows)
+            self._elapsed = None
+        elif rows:
+            # Missing after a reset between fetches: those rows belong to the
+            # statement's sample from before the reset
+            stats = _stats.get(self._shape)
+            if stats is not None:
+                stats.rows += rows
+        return result
+
+    async def fetchone(self):
+        return await self._fetch("fetchone")
+
+    async def fetchall(self):
+        return await self._fetch("fetchall")
+
+    async def fetchmany(self, size: int | None = None):
+        return await self._fetch("fetchmany", *(() if size is None else (size,)))
+
+
+class InstrumentedConnection:
+    """Drop-in proxy for aiosqlite.Connection that times every statement."""
+
+    def __init__(self, db: aiosqlite.Connection):
+        object.__setattr__(self, "_db", db)
+
+    def __getattr__(self, name):
+        return getattr(self._db, name)
+
+    def __setattr__(self, name, value):
+        setattr(self._db, name, value)
+
+    async def execute(self, sql: str, parameters=None):
+        shape = query_shape(sql)
+        start = time.perf_counter()
+        cursor = await self._db.execute(sql, parameters)
+        elapsed = time.perf_counter() - start
+        if _RETURNS_ROWS.search(sql):
+            return _Cursor(cursor, shape, elapsed)
+        _record(shape, elapsed * 1000, max(cursor.rowcount, 0))
+        return cursor
+
+    async def executemany(self, sql: str, parameters):
+        start = time.perf_counter()
+        cursor = await self._db.executemany(sql, parameters)
+        _record(query_shape(sql), (time.perf_counter() - start) * 1000, max(cursor.rowcount, 0))
+        return cursor
+
+    async def executescript(self, sql_script: str):
+        start = time.perf_counter()
+        cursor = await self._db.executescript(sql_script)
+        _record("<script>", (time.perf_counter() - start) * 1000, 0)
+        return cursor
+
+    async def commit(self):
+        start = time.perf_counter()
+        await self._db.commit()
+        _record("COMMIT", (time.perf_counter() - start) * 1000, 0)
+
+
+def instrument(db: aiosqlite.Connection) -> aiosqlite.Connection:
+    return InstrumentedConnection(db)  # type: ignore[return-value]
+
+
+def snapshot() -> list[dict]:
+    """Per-shape stats, slowest total time first."""
+    return [
+        {
+            "shape": s.shape,
+            "calls": s.calls,
+            "rows": s.rows,
+            "total_ms": round(s.total_ms, 2),
+            "avg_ms": round(s.total_ms / s.calls, 3) if s.calls else 0.0,
+            "p50_ms": s.percentile(0.50),
+            "p95_ms": s.percentile(0.95),
+            "p99_ms": s.percentile(0.99),
+            "max_ms": round(s.max_ms, 2),
+            "histogram": dict(zip((str(b) for b in BUCKETS_MS), s.buckets)),
+        }
+        for s in sorted(_stats.values(), key=lambda s: s.total_ms, reverse=True)
+    ]
+
+
+def reset() -> None:
+    _stats.clear()
+
+
+def report(top: int = 10, order_by: str = "total_ms") -> str:
+    """Plain-text summary of the `top` shapes by `order_by`."""
+    rows = sorted(snapshot(), key=lambda r: r[order_by], reverse=True)[:top]
+    if not rows:
+        return "No queries recorded."
+    lines = []
+    for r in rows:
+        shape = r["shape"] if len(r["shape"]) <= 120 else r["shape"][:117] + "…"
+        lines.append(
+            f"{r['calls']}× total {r['total_ms']:.0f} ms, avg {r['avg_ms']:.2f}, "
+            f"p99 ≤{r['p99_ms']:.1f}, max {r['max_ms']:.1f} ms, {r['rows']} rows\n  {shape}"
+        )
+    return "\n".join(lines)
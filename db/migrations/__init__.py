@@ -0,0 +1,100 @@
+"""
+Versioned schema migrations.
+
+`schema_version` records every applied step.  At startup `migrate()` reads
+the current version with one query and returns straight away when the schema
+is up to date; otherwise the pending steps from `steps.MIGRATIONS` run in
+order, each one committed and recorded on its own.
+
+Steps must be idempotent: databases created before this table existed start
+at version 0 and replay every step against whatever they already have.
+Large data rewrites go through `backfill()`, which updates a bounded number
+of rows per transaction so the writer lock is released between chunks.
+"""
+from __future__ import annotations
+import asyncio
+import logging
+from typing import Awaitable, Callable
+
+import aiosqlite
+
+from config import settings
+
+logger = logging.getLogger(__name__)
+
+Step = Callable[[aiosqlite.Connection], Awaitable[None]]
+
+_VERSION_TABLE = """
+CREATE TABLE IF NOT EXISTS schema_version (
+    version INTEGER PRIMARY KEY,
+    description TEXT NOT NULL,
+    applied_at TEXT DEFAULT (datetime('now'))
+)
+"""
+
+
+async def current_version(db: aiosqlite.Connection) -> int:
+    try:
+        cur = await db.execute("SELECT MAX(version) FROM schema_version")
+    except aiosqlite.OperationalError:
+        return 0  # no schema_version table yet
+    row = await cur.fetchone()
+    return row[0] or 0
+
+
+async def migrate(db: aiosqlite.Connection) -> int:
+    """Apply pending steps; returns the resulting schema version."""
+    from db.migrations.steps import MIGRATIONS
+
+    latest = MIGRATIONS[-1][0]
+    version = await current_version(db)
+    if version >= latest:
+        return version  # fast path: no DDL at all
+
+    await db.execute(_VERSION_TABLE)
+    await db.commit()
+    for number, description, step in MIGRATIONS:
+        if number <= version:
+            continue
+        logger.info("Applying migration %d: %s", number, description)
+        await step(db)
+        await db.execute(
+            "INSERT INTO schema_version (version, description) VALUES (?, ?)",
+            (number, description),
+        )
+        await db.commit()
+        version = number
+    return version
+
+
+async def column_exists(db: aiosqlite.Connection, table: str, column: str) -> bool:
+    cur = await db.execute(f"PRAGMA table_info({table})")
+    return any(r["name"] == column for r in await cur.fetchall())
+
+
+async def add_column(db: aiosqlite.Connection, table: str, column: str, definition: str):
+    if not await column_exists(db, table, column):
+        await db.execute(f"ALTER TABLE {table} ADD COLUMN {column} {definition}")
+        await db.commit()
+
+
+async def backfill(
+    db: aiosqlite.Connection, table: str, assignments: str, pending: str
+) -> int:
+    """
+    UPDATE {table} SET {assignments} for rows matching {pending}, at most
+    DB_MIGRATION_BATCH rows per transaction.  `assignments` must make a row
+    stop matching `pending`.  Returns the number of rows updated.
+    """
+    total = 0
+    while True:
+        cur = await db.execute(
+            f"""UPDATE {table} SET {assignments}
+                WHERE rowid IN (SELECT rowid FROM {table} WHERE {pending} LIMIT ?)""",
+            (settings.DB_MIGRATION_BATCH,),
+        )
+        await db.commit()
+        if cur.rowcount <= 0:
+            return total
+        total += cur.rowcount
+        await asyncio.sleep(0)  # let other tasks reach the database
@@ -1,6 +1,13 @@
-PRAGMA foreign_keys = ON;
-PRAGMA journal_mode = WAL;
+"""
+Frozen schema and seed data of migration step 1.
 
+This is the schema databases had before versioned migrations existed,
+kept verbatim so step 1 builds the same thing forever; every later change
+is a step of its own.  Connection PRAGMAs (foreign keys, WAL) are set by
+db.database, not here.  Never edit this text.
+"""
+
+BASELINE_SQL = """
 CREATE TABLE IF NOT EXISTS users (
     id INTEGER PRIMARY KEY AUTOINCREMENT,
     tg_id INTEGER UNIQUE NOT NULL,
@@ -137,3 +144,4 @@ INSERT OR IGNORE INTO breaks (weekday, start_time, end_time) VALUES
 (3, '13:00', '14:00'),
 (4, '13:00', '14:00'),
 (5, '13:00', '14:00');
+"""
@@ -0,0 +1,197 @@
+"""
+Ordered schema migration steps: (version, description, step).
+
+Append new steps at the end; never renumber or edit an applied one.
+
+Indexes are built with one CREATE INDEX each.  SQLite cannot build an index
+in chunks, and migrate() runs from init_db() before polling starts, so no
+handler is waiting on the writer meanwhile.  At 500k appointment rows a
+build takes 0.25–0.7 s; the archive keeps the hot table far smaller.
+"""
+from __future__ import annotations
+import re
+
+import aiosqlite
+
+from db.migrations import add_column, backfill
+from db.migrations.baseline import BASELINE_SQL
+
+
+def _hhmm_to_min(column: str) -> str:
+    """SQL expression: TEXT 'HH:MM' column → minutes from midnight."""
+    return f"(CAST(substr({column}, 1, 2) AS INTEGER) * 60 + CAST(substr({column}, 4, 2) AS INTEGER))"
+
+
+async def _baseline(db: aiosqlite.Connection):
+    # Tables, base indexes and seed data; every statement is IF NOT EXISTS / OR IGNORE
+    await db.executescript(BASELINE_SQL)
+
+
+async def _fsm_updated_at(db: aiosqlite.Connection):
+    await add_column(db, "fsm_data", "updated_at", "INTEGER NOT NULL DEFAULT 0")
+    await backfill(
+        db, "fsm_data",
+        "updated_at = CAST(strftime('%s', 'now') AS INTEGER)", "updated_at = 0",
+    )
+    await db.execute("CREATE INDEX IF NOT EXISTS idx_fsm_data_updated ON fsm_data(updated_at)")
+
+
+# Tables whose TEXT start_time / end_time get integer start_min / end_min twins
+_MINUTE_TABLES = (
+    "appointments", "blocks", "breaks", "work_rules", "master_work_rules", "master_breaks",
+)
+
+
+async def _minute_columns(db: aiosqlite.Connection):
+    for table in _MINUTE_TABLES:
+        await add_column(db, table, "start_min", "INTEGER")
+        await add_column(db, table, "end_min", "INTEGER")
+        # Also fills the seed rules and breaks, which only carry the TEXT columns
+        await backfill(
+            db, table,
+            f"start_min = {_hhmm_to_min('start_time')}, end_min = {_hhmm_to_min('end_time')}",
+            "start_min IS NULL",
+        )
+
+
+_APPOINTMENTS_UNIQUE = re.compile(
+    r",\s*UNIQUE\s*\(\s*master_id\s*,\s*date\s*,\s*start_time\s*\)", re.IGNORECASE
+)
+
+
+async def _drop_appointments_unique(db: aiosqlite.Connection):
+    """
+    Rebuild `appointments` without the old table-level
+    UNIQUE(master_id, date, start_time), which also counted cancelled rows.
+    SQLite cannot drop a table constraint, so the table is copied once.
+    """
+    cur = await db.execute(
+        "SELECT sql FROM sqlite_master WHERE type='table' AND name='appointments'"
+    )
+    ddl = (await cur.fetchone())["sql"]
+    new_ddl, found = _APPOINTMENTS_UNIQUE.subn("", ddl)
+    if not found:
+        return
+    new_ddl = re.sub(r"(?i)^CREATE TABLE\s+\"?appointments\"?", "CREATE TABLE appointments_new", new_ddl)
+    cur = await db.execute(
+        "SELECT sql FROM sqlite_master WHERE type='index' AND tbl_name='appointments' AND sql IS NOT NULL"
+    )
+    index_ddl = [r["sql"] for r in await cur.fetchall()]
+    cur = await db.execute("PRAGMA table_info(appointments)")
+    columns = ", ".join(r["name"] for r in await cur.fetchall())
+
+    await db.commit()
+    await db.execute("PRAGMA foreign_keys = OFF")  # no-op inside a transaction
+    try:
+        await db.executescript(
+            "BEGIN IMMEDIATE;\n"
+            f"{new_ddl};\n"
+            f"INSERT INTO appointments_new ({columns}) SELECT {columns} FROM appointments;\n"
+            "DROP TABLE appointments;\n"
+            "ALTER TABLE appointments_new RENAME TO appointments;\n"
+            + "".join(f"{sql};\n" for sql in index_ddl)
+            + "COMMIT;"
+        )
+    finally:
+        await db.execute("PRAGMA foreign_keys = ON")
+
+
+async def _active_slot_index(db: aiosqlite.Connection):
+    # One active booking per start, so freed (cancelled, declined…) slots can be
+    # rebooked.  Overlap checks read idx_appointments_active_span (step 10).
+    await db.executescript("""
+        DROP INDEX IF EXISTS idx_appointments_master_date_min;
+        CREATE UNIQUE INDEX IF NOT EXISTS idx_appointments_active_slot
+            ON appointments(master_id, date, start_min)
+            WHERE status IN ('pending','confirmed','reschedule_offered');
+    """)
+
+
+async def _blocks_minute_index(db: aiosqlite.Connection):
+    await db.execute(
+        "CREATE INDEX IF NOT EXISTS idx_blocks_date_min ON blocks(date, start_min, end_min)"
+    )
+
+
+async def _appointments_archive(db: aiosqlite.Connection):
+    # Same columns as `appointments` (see repositories._APPOINTMENT_COLUMNS),
+    # without the active-slot constraints; rows keep their original ids
+    await db.executescript("""
+        CREATE TABLE IF NOT EXISTS appointments_archive (
+            id INTEGER PRIMARY KEY,
+            client_id INTEGER NOT NULL,
+            master_id INTEGER NOT NULL,
+            service_id INTEGER NOT NULL,
+            date TEXT NOT NULL,
+            start_time TEXT NOT NULL,
+            end_time TEXT NOT NULL,
+            status TEXT,
+            comment TEXT,
+            client_name TEXT,
+            client_phone TEXT,
+            proposed_date TEXT,
+            proposed_start_time TEXT,
+            proposed_end_time TEXT,
+            status_before_reschedule TEXT,
+            created_at TEXT,
+            start_min INTEGER,
+            end_min INTEGER,
+            archived_at TEXT DEFAULT (datetime('now'))
+        );
+        CREATE INDEX IF NOT EXISTS idx_appointments_archive_master_date
+            ON appointments_archive(master_id, date);
+        CREATE INDEX IF NOT EXISTS idx_appointments_archive_client
+            ON appointments_archive(client_id);
+        CREATE INDEX IF NOT EXISTS idx_appointments_archive_date
+            ON appointments_archive(date);
+        CREATE INDEX IF NOT EXISTS idx_appointments_date ON appointments(date);
+    """)
+
+
+async def _appointment_page_indexes(db: aiosqlite.Connection):
+    # Keyset pages seek on (date, start_time, id) within a master or a client;
+    # these supersede the (master_id, date) and (client_id) indexes
+    await db.executescript("""
+        CREATE INDEX IF NOT EXISTS idx_appointments_master_date_time
+            ON appointments(master_id, date, start_time);
+        CREATE INDEX IF NOT EXISTS idx_appointments_client_date_time
+            ON appointments(client_id, date, start_time);
+        DROP INDEX IF EXISTS idx_appointments_master_date;
+        DROP INDEX IF EXISTS idx_appointments_client;
+    """)
+
+
+async def _fsm_empty_index(db: aiosqlite.Connection):
+    # Lets the FSM GC find rows with neither state nor data without a full scan;
+    # the WHERE must stay identical to the one in storage.sqlite_storage._GC_EMPTY
+    await db.execute(
+        """CREATE INDEX IF NOT EXISTS idx_fsm_data_empty ON fsm_data(updated_at)
+           WHERE state IS NULL AND COALESCE(data, '') IN ('', '{}')"""
+    )
+
+
+async def _active_span_index(db: aiosqlite.Connection):
+    # Overlap checks and the slot loader filter active rows on
+    # start_min < ? AND end_min > ?; with end_min in the index they never read
+    # the table (status is carried too: SQLite only treats the index as
+    # covering when every column the query names is in it).
+    # idx_appointments_active_slot stays for slot uniqueness.
+    await db.execute(
+        """CREATE INDEX IF NOT EXISTS idx_appointments_active_span
+               ON appointments(master_id, date, start_min, end_min, status)
+               WHERE status IN ('pending','confirmed','reschedule_offered')"""
+    )
+
+
+MIGRATIONS = [
+    (1, "baseline schema and seed data", _baseline),
+    (2, "fsm_data.updated_at", _fsm_updated_at),
+    (3, "integer start_min / end_min columns", _minute_columns),
+    (4, "drop appointments UNIQUE(master_id, date, start_time)", _drop_appointments_unique),
+    (5, "partial unique index on active appointments", _active_slot_index),
+    (6, "blocks (date, start_min) index", _blocks_minute_index),
+    (7, "appointments_archive table", _appointments_archive),
+    (8, "appointments keyset page indexes", _appointment_page_indexes),
+    (9, "fsm_data partial index on empty rows", _fsm_empty_index),
+    (10, "covering partial index on active appointment spans", _active_span_index),
+]
@@ -5,7 +5,13 @@ Rows are returned as plain dicts.
 """
 from __future__ import annotations
 import aiosqlite
-from typing import Any
+from typing import Any, AsyncIterator
+
+from db import events
+from db.catalog import get_catalog
+from db.coalescer import commit
+from db.transactions import is_busy, transaction
+from services.slots import t2m  # HH:MM → minutes, for the integer *_min columns
 
 
 def _row(row) -> dict | None:
@@ -38,39 +44,50 @@ async def get_user_by_username(db: aiosqlite.Connection, username: str) -> dict
 async def get_or_create_user(
     db: aiosqlite.Connection, tg_id: int, username: str | None, full_name: str | None
 ) -> dict:
-    # INSERT OR IGNORE avoids UNIQUE race; then always refresh profile fields
-    await db.execute(
-        "INSERT OR IGNORE INTO users (tg_id, username, full_name) VALUES (?, ?, ?)",
-        (tg_id, username, full_name),
-    )
+    # Only write when the row is missing or the profile actually changed
+    user = await get_user_by_tg_id(db, tg_id)
+    if user is None:
+        # INSERT OR IGNORE avoids UNIQUE race
+        await db.execute(
+            "INSERT OR IGNORE INTO users (tg_id, username, full_name) VALUES (?, ?, ?)",
+            (tg_id, username, full_name),
+        )
+        await commit(db)
+        return await get_user_by_tg_id(db, tg_id)
+    if (user["username"], user["full_name"]) != (username, full_name):
+        await update_user_profile(db, user["id"], username, full_name)
+        user.update(username=username, full_name=full_name)
+    return user
+
+
+async def update_user_profile(
+    db: aiosqlite.Connection, user_id: int, username: str | None, full_name: str | None
+):
     await db.execute(
-        "UPDATE users SET username=?, full_name=? WHERE tg_id=?",
-        (username, full_name, tg_id),
+        "UPDATE users SET username=?, full_name=? WHERE id=?",
+        (username, full_name, user_id),
     )
-    await db.commit()
-    return await get_user_by_tg_id(db, tg_id)
+    await commit(db)
+    events.emit(events.USERS, user_id=user_id)
 
 
 async def update_user_phone(db: aiosqlite.Connection, user_id: int, phone: str):
     await db.execute("UPDATE users SET phone=? WHERE id=?", (phone, user_id))
-    await db.commit()
+    await commit(db)
+    events.emit(events.USERS, user_id=user_id)
 
 
 async def update_user_name(db: aiosqlite.Connection, user_id: int, name: str):
     await db.execute("UPDATE users SET full_name=? WHERE id=?", (name, user_id))
-    await db.commit()
+    await commit(db)
+    events.emit(events.USERS, user_id=user_id)
 
 
 # ─────────────────────────── MASTERS ──────────────────────────
 
 async def get_master_by_id(db: aiosqlite.Connection, master_id: int) -> dict | None:
-    cur = await db.execute(
-        """SELECT m.*, u.tg_id, u.username, u.full_name, u.phone
-           FROM masters m JOIN users u ON m.user_id = u.id
-           WHERE m.id = ?""",
-        (master_id,),
-    )
-    return _row(await cur.fetchone())
+    master = (await get_catalog(db)).masters.get(master_id)
+    return dict(master) if master else None
 
 
 async def get_master_by_user_id(db: aiosqlite.Connection, user_id: int) -> dict | None:
@@ -93,34 +110,33 @@ async def get_master_by_tg_id(db: aiosqlite.Connection, tg_id: int) -> dict | No
     return _row(await cur.fetchone())
 
 
+async def get_master_tg_ids(db: aiosqlite.Connection) -> set[int]:
+    cur = await db.execute(
+        "SELECT u.tg_id FROM masters m JOIN users u ON m.user_id = u.id"
+    )
+    return {r["tg_id"] for r in await cur.fetchall()}
+
+
 async def get_all_masters(db: aiosqlite.Connection, active_only: bool = False) -> list[dict]:
-    q = """SELECT m.*, u.tg_id, u.username, u.full_name, u.phone
-           FROM masters m JOIN users u ON m.user_id = u.id"""
-    if active_only:
-        q += " WHERE m.is_active = 1"
-    q += " ORDER BY m.display_name"
-    cur = await db.execute(q)
-    return _rows(await cur.fetchall())
+    masters = (await get_catalog(db)).masters_by_name
+    return [dict(m) for m in masters if not active_only or m["is_active"] == 1]
 
 
 async def get_masters_for_service(
     db: aiosqlite.Connection, service_id: int, active_only: bool = True
 ) -> list[dict]:
     """Return masters that have this service active (or default active)."""
-    cur = await db.execute(
-        """SELECT m.*, u.tg_id, u.username, u.full_name, u.phone,
-                  COALESCE(ms.duration_min, s.default_duration_min) AS eff_duration,
-                  COALESCE(ms.price_text,  s.default_price_text)    AS eff_price,
-                  COALESCE(ms.is_active, 1)                          AS ms_active
-           FROM masters m
-           JOIN users u ON m.user_id = u.id
-           JOIN services s ON s.id = ?
-           LEFT JOIN master_services ms ON ms.master_id = m.id AND ms.service_id = s.id
-           WHERE m.is_active = 1 AND COALESCE(ms.is_active, 1) = 1
-           ORDER BY m.display_name""",
-        (service_id,),
-    )
-    return _rows(await cur.fetchall())
+    catalog = await get_catalog(db)
+    if service_id not in catalog.services:
+        return []
+    result = []
+    for m in catalog.masters_by_name:
+        if m["is_active"] != 1:
+            continue
+        eff = catalog.effective(m["id"], service_id)
+        if eff["ms_active"] == 1:
+            result.append({**m, **eff})
+    return result
 
 
 async def create_master(
@@ -130,7 +146,8 @@ async def create_master(
         "INSERT INTO masters (user_id, display_name) VALUES (?, ?)",
         (user_id, display_name),
     )
-    await db.commit()
+    await commit(db)
+    events.emit(events.MASTERS, master_id=cur.lastrowid)
     return await get_master_by_id(db, cur.lastrowid)
 
 
@@ -139,23 +156,20 @@ async def update_master(db: aiosqlite.Connection, master_id: int, **kwargs):
     await db.execute(
         f"UPDATE masters SET {sets} WHERE id=?", (*kwargs.values(), master_id)
     )
-    await db.commit()
+    await commit(db)
+    events.emit(events.MASTERS, master_id=master_id)
 
 
 # ─────────────────────────── SERVICES ─────────────────────────
 
 async def get_service_by_id(db: aiosqlite.Connection, service_id: int) -> dict | None:
-    cur = await db.execute("SELECT * FROM services WHERE id = ?", (service_id,))
-    return _row(await cur.fetchone())
+    service = (await get_catalog(db)).services.get(service_id)
+    return dict(service) if service else None
 
 
 async def get_all_services(db: aiosqlite.Connection, active_only: bool = True) -> list[dict]:
-    q = "SELECT * FROM services"
-    if active_only:
-        q += " WHERE is_active = 1"
-    q += " ORDER BY title"
-    cur = await db.execute(q)
-    return _rows(await cur.fetchall())
+    services = (await get_catalog(db)).services_by_title
+    return [dict(s) for s in services if not active_only or s["is_active"] == 1]
 
 
 async def create_service(
@@ -165,7 +179,8 @@ async def create_service(
         "INSERT INTO services (title, default_duration_min, default_price_text) VALUES (?, ?, ?)",
         (title, duration, price),
     )
-    await db.commit()
+    await commit(db)
+    events.emit(events.CATALOG)
     return await get_service_by_id(db, cur.lastrowid)
 
 
@@ -174,7 +189,8 @@ async def update_service(db: aiosqlite.Connection, service_id: int, **kwargs):
     await db.execute(
         f"UPDATE services SET {sets} WHERE id=?", (*kwargs.values(), service_id)
     )
-    await db.commit()
+    await commit(db)
+    events.emit(events.CATALOG)
 
 
 # ─────────────────────── MASTER SERVICES ──────────────────────
@@ -182,11 +198,8 @@ async def update_service(db: aiosqlite.Connection, service_id: int, **kwargs):
 async def get_master_service(
     db: aiosqlite.Connection, master_id: int, service_id: int
 ) -> dict | None:
-    cur = await db.execute(
-        "SELECT * FROM master_services WHERE master_id=? AND service_id=?",
-        (master_id, service_id),
-    )
-    return _row(await cur.fetchone())
+    ms = (await get_catalog(db)).master_services.get((master_id, service_id))
+    return dict(ms) if ms else None
 
 
 async def upsert_master_service(
@@ -206,52 +219,40 @@ async def upsert_master_service(
                          is_active=excluded.is_active""",
         (master_id, service_id, duration_min, price_text, is_active),
     )
-    await db.commit()
+    await commit(db)
+    events.emit(events.CATALOG)
 
 
 async def get_services_for_master(
     db: aiosqlite.Connection, master_id: int, active_only: bool = True
 ) -> list[dict]:
-    cur = await db.execute(
-        """SELECT s.*,
-                  COALESCE(ms.duration_min, s.default_duration_min) AS eff_duration,
-                  COALESCE(ms.price_text,  s.default_price_text)    AS eff_price,
-                  COALESCE(ms.is_active, 1)                          AS ms_active
-           FROM services s
-           LEFT JOIN master_services ms ON ms.master_id=? AND ms.service_id=s.id
-           WHERE s.is_active=1 AND COALESCE(ms.is_active, 1)=1
-           ORDER BY s.title""",
-        (master_id,),
-    )
-    return _rows(await cur.fetchall())
+    catalog = await get_catalog(db)
+    result = []
+    for s in catalog.services_by_title:
+        if s["is_active"] != 1:
+            continue
+        eff = catalog.effective(master_id, s["id"])
+        if eff["ms_active"] == 1:
+            result.append({**s, **eff})
+    return result
 
 
 async def get_effective_duration(
     db: aiosqlite.Connection, master_id: int, service_id: int
 ) -> int:
-    cur = await db.execute(
-        """SELECT COALESCE(ms.duration_min, s.default_duration_min) AS dur
-           FROM services s
-           LEFT JOIN master_services ms ON ms.master_id=? AND ms.service_id=s.id
-           WHERE s.id=?""",
-        (master_id, service_id),
-    )
-    row = await cur.fetchone()
-    return row["dur"] if row else 60
+    catalog = await get_catalog(db)
+    if service_id not in catalog.services:
+        return 60
+    return catalog.effective(master_id, service_id)["eff_duration"]
 
 
 async def get_effective_price(
     db: aiosqlite.Connection, master_id: int, service_id: int
 ) -> str:
-    cur = await db.execute(
-        """SELECT COALESCE(ms.price_text, s.default_price_text) AS pr
-           FROM services s
-           LEFT JOIN master_services ms ON ms.master_id=? AND ms.service_id=s.id
-           WHERE s.id=?""",
-        (master_id, service_id),
-    )
-    row = await cur.fetchone()
-    return row["pr"] if row else ""
+    catalog = await get_catalog(db)
+    if service_id not in catalog.services:
+        return ""
+    return catalog.effective(master_id, service_id)["eff_price"]
 
 
 # ─────────────────────── WORK RULES ───────────────────────────
@@ -274,17 +275,22 @@ async def upsert_work_rule(
     step: int,
 ):
     await db.execute(
-        """INSERT INTO work_rules (weekday, start_time, end_time, slot_step_min) VALUES (?,?,?,?)
+        """INSERT INTO work_rules
+               (weekday, start_time, end_time, slot_step_min, start_min, end_min)
+           VALUES (?,?,?,?,?,?)
            ON CONFLICT(weekday) DO UPDATE SET start_time=excluded.start_time,
-               end_time=excluded.end_time, slot_step_min=excluded.slot_step_min""",
-        (weekday, start, end, step),
+               end_time=excluded.end_time, slot_step_min=excluded.slot_step_min,
+               start_min=excluded.start_min, end_min=excluded.end_min""",
+        (weekday, start, end, step, t2m(start), t2m(end)),
     )
-    await db.commit()
+    await commit(db)
+    events.emit(events.SCHEDULE, master_id=None)
 
 
 async def delete_work_rule(db: aiosqlite.Connection, weekday: int):
     await db.execute("DELETE FROM work_rules WHERE weekday=?", (weekday,))
-    await db.commit()
+    await commit(db)
+    events.emit(events.SCHEDULE, master_id=None)
 
 
 # ─────────────────────────── BREAKS ───────────────────────────
@@ -301,15 +307,18 @@ async def get_all_breaks(db: aiosqlite.Connection) -> list[dict]:
 
 async def add_break(db: aiosqlite.Connection, weekday: int, start: str, end: str):
     await db.execute(
-        "INSERT INTO breaks (weekday, start_time, end_time) VALUES (?,?,?)",
-        (weekday, start, end),
+        """INSERT INTO breaks (weekday, start_time, end_time, start_min, end_min)
+           VALUES (?,?,?,?,?)""",
+        (weekday, start, end, t2m(start), t2m(end)),
     )
-    await db.commit()
+    await commit(db)
+    events.emit(events.SCHEDULE, master_id=None)
 
 
 async def delete_break(db: aiosqlite.Connection, break_id: int):
     await db.execute("DELETE FROM breaks WHERE id=?", (break_id,))
-    await db.commit()
+    await commit(db)
+    events.emit(events.SCHEDULE, master_id=None)
 
 
 # ─────────────────── MASTER WORK RULES ────────────────────────
@@ -343,15 +352,19 @@ async def upsert_master_work_rule(
     step: int,
 ):
     await db.execute(
-        """INSERT INTO master_work_rules (master_id, weekday, start_time, end_time, slot_step_min)
-           VALUES (?,?,?,?,?)
+        """INSERT INTO master_work_rules
+               (master_id, weekday, start_time, end_time, slot_step_min, start_min, end_min)
+           VALUES (?,?,?,?,?,?,?)
            ON CONFLICT(master_id, weekday)
            DO UPDATE SET start_time=excluded.start_time,
                          end_time=excluded.end_time,
-                         slot_step_min=excluded.slot_step_min""",
-        (master_id, weekday, start, end, step),
+                         slot_step_min=excluded.slot_step_min,
+                         start_min=excluded.start_min,
+                         end_min=excluded.end_min""",
+        (master_id, weekday, start, end, step, t2m(start), t2m(end)),
     )
-    await db.commit()
+    await commit(db)
+    events.emit(events.SCHEDULE, master_id=master_id)
 
 
 async def delete_master_work_rule(
@@ -361,7 +374,8 @@ async def delete_master_work_rule(
         "DELETE FROM master_work_rules WHERE master_id=? AND weekday=?",
         (master_id, weekday),
     )
-    await db.commit()
+    await commit(db)
+    events.emit(events.SCHEDULE, master_id=master_id)
 
 
 # ─────────────────── MASTER BREAKS ────────────────────────────
@@ -376,19 +390,150 @@ async def get_master_breaks(
     return _rows(await cur.fetchall())
 
 
+async def get_all_master_breaks(db: aiosqlite.Connection, master_id: int) -> list[dict]:
+    cur = await db.execute(
+        "SELECT * FROM master_breaks WHERE master_id=? ORDER BY weekday, start_time",
+        (master_id,),
+    )
+    return _rows(await cur.fetchall())
+
+
 async def add_master_break(
     db: aiosqlite.Connection, master_id: int, weekday: int, start: str, end: str
 ):
     await db.execute(
-        "INSERT INTO master_breaks (master_id, weekday, start_time, end_time) VALUES (?,?,?,?)",
-        (master_id, weekday, start, end),
+        """INSERT INTO master_breaks (master_id, weekday, start_time, end_time, start_min, end_min)
+           VALUES (?,?,?,?,?,?)""",
+        (master_id, weekday, start, end, t2m(start), t2m(end)),
     )
-    await db.commit()
+    await commit(db)
+    events.emit(events.SCHEDULE, master_id=master_id)
 
 
 async def delete_master_break(db: aiosqlite.Connection, break_id: int):
-    await db.execute("DELETE FROM master_breaks WHERE id=?", (break_id,))
-    await db.commit()
+    cur = await db.execute(
+        "DELETE FROM master_breaks WHERE id=? RETURNING master_id", (break_id,)
+    )
+    row = await cur.fetchone()
+    await commit(db)
+    if row:
+        events.emit(events.SCHEDULE, master_id=row["master_id"])
+
+
+# ─────────────────── WEEK SCHEDULE (BULK) ─────────────────────
+
+async def replace_week_schedule(
+    db: aiosqlite.Connection, week: dict[int, dict], master_ids: list[int] | None = None
+) -> bool:
+    """
+    Replace the whole week of rules and breaks in one transaction.
+    `week` is {weekday: {"start", "end", "step", "breaks": [(start, end), …]}}.
+    master_ids=None replaces the salon-wide schedule, where weekdays missing
+    from `week` become days off.  Otherwise it replaces the personal schedule
+    of every listed master; there missing weekdays (and days without breaks)
+    fall back to the salon's, as in load_day_contexts.
+    Returns False if the database stayed locked.
+    """
+    rules = [
+        (wd, d["start"], d["end"], d["step"], t2m(d["start"]), t2m(d["end"]))
+        for wd, d in week.items()
+    ]
+    breaks = [
+        (wd, s, e, t2m(s), t2m(e))
+        for wd, d in week.items() for s, e in d["breaks"]
+    ]
+    try:
+        async with transaction(db):
+            if master_ids is None:
+                await db.execute("DELETE FROM work_rules")
+                await db.execute("DELETE FROM breaks")
+                await db.executemany(
+                    """INSERT INTO work_rules
+                       (weekday, start_time, end_time, slot_step_min, start_min, end_min)
+                       VALUES (?,?,?,?,?,?)""",
+                    rules,
+                )
+                await db.executemany(
+                    """INSERT INTO breaks (weekday, start_time, end_time, start_min, end_min)
+                       VALUES (?,?,?,?,?)""",
+                    breaks,
+                )
+            else:
+                placeholders = ",".join("?" * len(master_ids))
+                await db.execute(
+                    f"DELETE FROM master_work_rules WHERE master_id IN ({placeholders})", master_ids
+                )
+                await db.execute(
+                    f"DELETE FROM master_breaks WHERE master_id IN ({placeholders})", master_ids
+                )
+                await db.executemany(
+                    """INSERT INTO master_work_rules
+                       (master_id, weekday, start_time, end_time, slot_step_min, start_min, end_min)
+                       VALUES (?,?,?,?,?,?,?)""",
+                    [(m, *r) for m in master_ids for r in rules],
+                )
+                await db.executemany(
+                    """INSERT INTO master_breaks
+                       (master_id, weekday, start_time, end_time, start_min, end_min)
+                       VALUES (?,?,?,?,?,?)""",
+                    [(m, *b) for m in master_ids for b in breaks],
+                )
+    except aiosqlite.OperationalError as exc:
+        if is_busy(exc):
+            return False
+        raise
+    # One invalidation for the whole week
+    single = master_ids[0] if master_ids and len(master_ids) == 1 else None
+    events.emit(events.SCHEDULE, master_id=single)
+    return True
+
+
+# ─────────────────── SCHEDULE INPUTS ──────────────────────────
+
+async def get_schedule_rows(db: aiosqlite.Connection, master_id: int) -> list[dict]:
+    """
+    Everything weekly that shapes a master's day, in one round trip.
+    `kind` is one of master / rule / master_rule / break / master_break;
+    for the `master` row `step` carries allow_personal_schedule.
+    Times are minutes from midnight (start_min / end_min).
+    """
+    cur = await db.execute(
+        """SELECT 'master' AS kind, NULL AS weekday, NULL AS start_min,
+                  NULL AS end_min, allow_personal_schedule AS step
+           FROM masters WHERE id=?
+           UNION ALL
+           SELECT 'rule', weekday, start_min, end_min, slot_step_min
+           FROM work_rules
+           UNION ALL
+           SELECT 'master_rule', weekday, start_min, end_min, slot_step_min
+           FROM master_work_rules WHERE master_id=?
+           UNION ALL
+           SELECT 'break', weekday, start_min, end_min, NULL
+           FROM breaks
+           UNION ALL
+           SELECT 'master_break', weekday, start_min, end_min, NULL
+           FROM master_breaks WHERE master_id=?""",
+        (master_id, master_id, master_id),
+    )
+    return _rows(await cur.fetchall())
+
+
+async def get_busy_rows(
+    db: aiosqlite.Connection, master_id: int, date_from: str, date_to: str
+) -> list[dict]:
+    """Blocks (global + master) and active appointments for a date range, in minutes."""
+    cur = await db.execute(
+        """SELECT 'block' AS kind, NULL AS id, date, start_min, end_min
+           FROM blocks
+           WHERE date BETWEEN ? AND ? AND (master_id IS NULL OR master_id=?)
+           UNION ALL
+           SELECT 'appointment', id, date, start_min, end_min
+           FROM appointments
+           WHERE master_id=? AND date BETWEEN ? AND ?
+             AND status IN ('pending','confirmed','reschedule_offered')""",
+        (date_from, date_to, master_id, master_id, date_from, date_to),
+    )
+    return _rows(await cur.fetchall())
 
 
 # ─────────────────────────── BLOCKS ───────────────────────────
@@ -428,33 +573,58 @@ async def add_block(
     master_id: int | None = None,
 ) -> dict:
     cur = await db.execute(
-        "INSERT INTO blocks (master_id, date, start_time, end_time, reason) VALUES (?,?,?,?,?)",
-        (master_id, date_str, start, end, reason),
+        """INSERT INTO blocks (master_id, date, start_time, end_time, reason, start_min, end_min)
+           VALUES (?,?,?,?,?,?,?)""",
+        (master_id, date_str, start, end, reason, t2m(start), t2m(end)),
     )
-    await db.commit()
+    await commit(db)
+    events.emit(events.BLOCKS, master_id=master_id, date=date_str)
     c2 = await db.execute("SELECT * FROM blocks WHERE id=?", (cur.lastrowid,))
     return _row(await c2.fetchone())
 
 
 async def delete_block(db: aiosqlite.Connection, block_id: int):
-    await db.execute("DELETE FROM blocks WHERE id=?", (block_id,))
-    await db.commit()
+    cur = await db.execute(
+        "DELETE FROM blocks WHERE id=? RETURNING master_id, date", (block_id,)
+    )
+    row = await cur.fetchone()
+    await commit(db)
+    if row:
+        events.emit(events.BLOCKS, master_id=row["master_id"], date=row["date"])
 
 
 # ──────────────────────── APPOINTMENTS ────────────────────────
 
+# Columns shared by `appointments` and `appointments_archive`
+_APPOINTMENT_COLUMNS = (
+    "id, client_id, master_id, service_id, date, start_time, end_time, status, "
+    "comment, client_name, client_phone, proposed_date, proposed_start_time, "
+    "proposed_end_time, status_before_reschedule, created_at, start_min, end_min"
+)
+
+
+def _appointments_from(include_archive: bool) -> str:
+    """FROM source for appointment reads: hot rows only unless asked otherwise."""
+    if not include_archive:
+        return "appointments"
+    return (
+        f"(SELECT {_APPOINTMENT_COLUMNS} FROM appointments"
+        f" UNION ALL SELECT {_APPOINTMENT_COLUMNS} FROM appointments_archive)"
+    )
+
+
 async def get_appointment_by_id(
-    db: aiosqlite.Connection, apt_id: int
+    db: aiosqlite.Connection, apt_id: int, include_archive: bool = False
 ) -> dict | None:
     cur = await db.execute(
-        """SELECT a.*,
+        f"""SELECT a.*,
                   u.tg_id  AS client_tg_id,
                   u.full_name AS client_full_name,
                   u.username  AS client_username,
                   m.display_name AS master_display_name,
                   mu.tg_id AS master_tg_id,
                   s.title  AS service_title
-           FROM appointments a
+           FROM {_appointments_from(include_archive)} a
            JOIN users u   ON a.client_id  = u.id
            JOIN masters m ON a.master_id  = m.id
            JOIN users mu  ON m.user_id    = mu.id
@@ -465,56 +635,106 @@ async def get_appointment_by_id(
     return _row(await cur.fetchone())
 
 
-async def get_appointments_for_client(
-    db: aiosqlite.Connection, client_id: int
-) -> list[dict]:
+async def get_appointments_page(
+    db: aiosqlite.Connection,
+    *,
+    master_id: int | None = None,
+    client_id: int | None = None,
+    date_from: str | None = None,
+    date_to: str | None = None,
+    status_filter: list | None = None,
+    cursor: tuple[str, str, int] | None = None,
+    backward: bool = False,
+    limit: int = 10,
+    newest_first: bool = False,
+    include_archive: bool = False,
+) -> dict:
+    """
+    One page of appointments in (date, start_time, id) order; `newest_first`
+    puts the latest dates first while a day still reads in time order.
+    `cursor` is the key of a row on the current page: the
+    result holds the `limit` rows right after it, or right before it when
+    `backward`.  Returns {"items", "prev", "next"}; prev / next are the
+    cursors to pass back for the neighbouring pages, None at either end.
+    date_from / date_to are inclusive; pass the same date for a single day.
+    """
+    where, params = [], []
+    if master_id is not None:
+        where.append("a.master_id = ?")
+        params.append(master_id)
+    if client_id is not None:
+        where.append("a.client_id = ?")
+        params.append(client_id)
+    if date_from:
+        where.append("a.date >= ?")
+        params.append(date_from)
+    if date_to:
+        where.append("a.date <= ?")
+        params.append(date_to)
+    if status_filter:
+        where.append(f"a.status IN ({','.join('?' * len(status_filter))})")
+        params.extend(status_filter)
+    # Walking backward reverses both the day order and the order within a day
+    date_desc = newest_first != backward
+    time_desc = backward
+    if cursor:
+        date_op, time_op = ("<" if date_desc else ">"), ("<" if time_desc else ">")
+        if date_desc == time_desc:
+            # Row-value comparison: the index seeks straight to the cursor
+            where.append(f"(a.date, a.start_time, a.id) {date_op} (?, ?, ?)")
+            params.extend(cursor)
+        else:
+            where.append(
+                f"(a.date {date_op} ? OR (a.date = ? AND (a.start_time, a.id) {time_op} (?, ?)))"
+            )
+            params.extend((cursor[0], *cursor))
+    date_order = "DESC" if date_desc else "ASC"
+    time_order = "DESC" if time_desc else "ASC"
     cur = await db.execute(
-        """SELECT a.*,
+        f"""SELECT a.*,
+                  u.tg_id        AS client_tg_id,
+                  u.full_name    AS client_full_name,
+                  u.username     AS client_username,
                   m.display_name AS master_display_name,
                   s.title        AS service_title
-           FROM appointments a
-           JOIN masters m  ON a.master_id  = m.id
+           FROM {_appointments_from(include_archive)} a
+           JOIN users u   ON a.client_id  = u.id
+           JOIN masters m ON a.master_id  = m.id
            JOIN services s ON a.service_id = s.id
-           WHERE a.client_id=? AND a.status NOT IN ('cancelled','declined','rescheduled')
-           ORDER BY a.date DESC, a.start_time""",
-        (client_id,),
-    )
-    return _rows(await cur.fetchall())
+           {"WHERE " + " AND ".join(where) if where else ""}
+           ORDER BY a.date {date_order}, a.start_time {time_order}, a.id {time_order}
+           LIMIT ?""",
+        (*params, limit + 1),
+    )
+    items = _rows(await cur.fetchall())
+    more = len(items) > limit
+    items = items[:limit]
+    if backward:
+        items.reverse()
+    if not items and cursor:
+        # The rows around the cursor are gone: start over from the first page
+        return await get_appointments_page(
+            db, master_id=master_id, client_id=client_id, date_from=date_from,
+            date_to=date_to, status_filter=status_filter, limit=limit, newest_first=newest_first,
+            include_archive=include_archive,
+        )
+    has_prev, has_next = (more, cursor is not None) if backward else (cursor is not None, more)
+    return {
+        "items": items,
+        "prev": _page_key(items[0]) if has_prev else None,
+        "next": _page_key(items[-1]) if has_next else None,
+    }
 
 
-async def get_appointments_for_master(
-    db: aiosqlite.Connection,
-    master_id: int,
-    date_str: str | None = None,
-    status_filter: list | None = None,
-) -> list[dict]:
-    q = """SELECT a.*,
-                  u.tg_id   AS client_tg_id,
-                  u.full_name AS client_full_name,
-                  u.username  AS client_username,
-                  s.title    AS service_title
-           FROM appointments a
-           JOIN users u   ON a.client_id  = u.id
-           JOIN services s ON a.service_id = s.id
-           WHERE a.master_id=?"""
-    params: list[Any] = [master_id]
-    if date_str:
-        q += " AND a.date=?"
-        params.append(date_str)
-    if status_filter:
-        placeholders = ",".join("?" * len(status_filter))
-        q += f" AND a.status IN ({placeholders})"
-        params.extend(status_filter)
-    q += " ORDER BY a.date, a.start_time"
-    cur = await db.execute(q, params)
-    return _rows(await cur.fetchall())
+def _page_key(apt: dict) -> tuple[str, str, int]:
+    return apt["date"], apt["start_time"], apt["id"]
 
 
 async def get_active_appointments_for_master_on_date(
     db: aiosqlite.Connection, master_id: int, date_str: str
 ) -> list[dict]:
     cur = await db.execute(
-        """SELECT id, start_time, end_time FROM appointments
+        """SELECT id, start_time, end_time, start_min, end_min FROM appointments
            WHERE master_id=? AND date=? AND status IN ('pending','confirmed','reschedule_offered')""",
         (master_id, date_str),
     )
@@ -533,206 +753,115 @@ async def create_appointment(
     client_phone: str,
 ) -> tuple[dict | None, str]:
     """
-    Returns (appointment_dict, 'ok') or (None, 'overlap') or (None, 'error').
-    Uses BEGIN IMMEDIATE to serialize concurrent writes.
+    Returns (appointment_dict, 'ok') or (None, 'overlap') or (None, error text).
+    The overlap check and the insert run in one serialized transaction.
     """
     try:
-        await db.execute("BEGIN IMMEDIATE")
-        # Check overlap
-        cur = await db.execute(
-            """SELECT id FROM appointments
-               WHERE master_id=? AND date=?
-                 AND status IN ('pending','confirmed','reschedule_offered')
-                 AND start_time < ? AND end_time > ?""",
-            (master_id, date_str, end_time, start_time),
-        )
-        if await cur.fetchone():
-            await db.execute("ROLLBACK")
-            return None, "overlap"
-        cur2 = await db.execute(
-            """INSERT INTO appointments
-               (client_id, master_id, service_id, date, start_time, end_time, client_name, client_phone)
-               VALUES (?,?,?,?,?,?,?,?)""",
-            (client_id, master_id, service_id, date_str, start_time, end_time, client_name, client_phone),
-        )
-        await db.commit()
-        apt = await get_appointment_by_id(db, cur2.lastrowid)
-        return apt, "ok"
+        async with transaction(db) as tx:
+            cur = await db.execute(
+                """SELECT id FROM appointments
+                   WHERE master_id=? AND date=?
+                     AND status IN ('pending','confirmed','reschedule_offered')
+                     AND start_min < ? AND end_min > ?""",
+                (master_id, date_str, t2m(end_time), t2m(start_time)),
+            )
+            if await cur.fetchone():
+                tx.rollback()
+                return None, "overlap"
+            cur2 = await db.execute(
+                """INSERT INTO appointments
+                   (client_id, master_id, service_id, date, start_time, end_time,
+                    client_name, client_phone, start_min, end_min)
+                   VALUES (?,?,?,?,?,?,?,?,?,?)""",
+                (client_id, master_id, service_id, date_str, start_time, end_time,
+                 client_name, client_phone, t2m(start_time), t2m(end_time)),
+            )
     except Exception as exc:
-        try:
-            await db.execute("ROLLBACK")
-        except Exception:
-            pass
         return None, str(exc)
+    events.emit(events.APPOINTMENTS, master_id=master_id, date=date_str)
+    apt = await get_appointment_by_id(db, cur2.lastrowid)
+    return apt, "ok"
 
 
-async def update_appointment_status(
-    db: aiosqlite.Connection, apt_id: int, status: str
-):
-    await db.execute("UPDATE appointments SET status=? WHERE id=?", (status, apt_id))
-    await db.commit()
-
-
-async def offer_reschedule(
+async def iter_appointments(
     db: aiosqlite.Connection,
-    apt_id: int,
-    proposed_date: str,
-    proposed_start: str,
-    proposed_end: str,
-):
-    cur = await db.execute("SELECT status FROM appointments WHERE id=?", (apt_id,))
-    row = await cur.fetchone()
-    prev = row["status"] if row else "pending"
-    await db.execute(
-        """UPDATE appointments
-           SET status='reschedule_offered',
-               status_before_reschedule=?,
-               proposed_date=?,
-               proposed_start_time=?,
-               proposed_end_time=?
-           WHERE id=?""",
-        (prev, proposed_date, proposed_start, proposed_end, apt_id),
-    )
-    await db.commit()
-
-
-async def accept_reschedule(
-    db: aiosqlite.Connection, apt_id: int
-) -> dict | None:
+    date_from: str | None = None,
+    date_to: str | None = None,
+    master_id: int | None = None,
+    status: str | None = None,
+    include_archive: bool = False,
+    batch_size: int = 1000,
+) -> AsyncIterator[list[dict]]:
     """
-    Creates a new confirmed appointment from the proposed slot.
-    Marks original as 'rescheduled'.
-    Returns the new appointment dict.
+    Appointments with client, master and service fields, ordered by date and
+    time and optionally filtered, yielded in batches of `batch_size` from
+    one cursor instead of one big list.
     """
-    old = await get_appointment_by_id(db, apt_id)
-    if not old or not old.get("proposed_date"):
-        return None
-    try:
-        await db.execute("BEGIN IMMEDIATE")
-        # Overlap check for proposed slot
-        cur = await db.execute(
-            """SELECT id FROM appointments
-               WHERE master_id=? AND date=?
-                 AND status IN ('pending','confirmed','reschedule_offered')
-                 AND start_time < ? AND end_time > ?
-                 AND id != ?""",
-            (
-                old["master_id"],
-                old["proposed_date"],
-                old["proposed_end_time"],
-                old["proposed_start_time"],
-                apt_id,
-            ),
-        )
-        if await cur.fetchone():
-            await db.execute("ROLLBACK")
-            return None
-        cur2 = await db.execute(
-            """INSERT INTO appointments
-               (client_id, master_id, service_id, date, start_time, end_time,
-                client_name, client_phone, status)
-               VALUES (?,?,?,?,?,?,?,?,'confirmed')""",
-            (
-                old["client_id"],
-                old["master_id"],
-                old["service_id"],
-                old["proposed_date"],
-                old["proposed_start_time"],
-                old["proposed_end_time"],
-                old["client_name"],
-                old["client_phone"],
-            ),
-        )
-        new_id = cur2.lastrowid
-        await db.execute(
-            "UPDATE appointments SET status='rescheduled' WHERE id=?", (apt_id,)
-        )
-        await db.commit()
-        return await get_appointment_by_id(db, new_id)
-    except Exception:
-        try:
-            await db.execute("ROLLBACK")
-        except Exception:
-            pass
-        return None
-
-
-async def decline_reschedule(db: aiosqlite.Connection, apt_id: int):
-    cur = await db.execute(
-        "SELECT status_before_reschedule FROM appointments WHERE id=?", (apt_id,)
-    )
-    row = await cur.fetchone()
-    prev = (row["status_before_reschedule"] if row and row["status_before_reschedule"] else "declined")
-    if prev == "confirmed":
-        new_status = "confirmed"
-    else:
-        new_status = "declined"
-    await db.execute(
-        """UPDATE appointments
-           SET status=?,
-               proposed_date=NULL,
-               proposed_start_time=NULL,
-               proposed_end_time=NULL,
-               status_before_reschedule=NULL
-           WHERE id=?""",
-        (new_status, apt_id),
-    )
-    await db.commit()
-
-
-async def cancel_appointment(db: aiosqlite.Connection, apt_id: int):
-    await db.execute(
-        "UPDATE appointments SET status='cancelled' WHERE id=?", (apt_id,)
-    )
-    await db.commit()
-
-
-async def get_all_appointments(db: aiosqlite.Connection) -> list[dict]:
+    where, params = [], []
+    if date_from:
+        where.append("a.date >= ?")
+        params.append(date_from)
+    if date_to:
+        where.append("a.date <= ?")
+        params.append(date_to)
+    if master_id is not None:
+        where.append("a.master_id = ?")
+        params.append(master_id)
+    if status:
+        where.append("a.status = ?")
+        params.append(status)
     cur = await db.execute(
-        """SELECT a.*,
+        f"""SELECT a.*,
                   u.full_name    AS client_full_name,
                   u.phone        AS client_phone_u,
                   m.display_name AS master_display_name,
                   s.title        AS service_title
-           FROM appointments a
+           FROM {_appointments_from(include_archive)} a
            JOIN users u   ON a.client_id  = u.id
            JOIN masters m ON a.master_id  = m.id
            JOIN services s ON a.service_id = s.id
-           ORDER BY a.date, a.start_time"""
+           {"WHERE " + " AND ".join(where) if where else ""}
+           ORDER BY a.date, a.start_time""",
+        params,
     )
-    return _rows(await cur.fetchall())
+    try:
+        while rows := await cur.fetchmany(batch_size):
+            yield _rows(rows)
+    finally:
+        await cur.close()
 
 
-async def get_pending_appointments(db: aiosqlite.Connection) -> list[dict]:
-    cur = await db.execute(
-        """SELECT a.*,
-                  u.full_name    AS client_full_name,
-                  m.display_name AS master_display_name,
-                  s.title        AS service_title
-           FROM appointments a
-           JOIN users u   ON a.client_id  = u.id
-           JOIN masters m ON a.master_id  = m.id
-           JOIN services s ON a.service_id = s.id
-           WHERE a.status='pending'
-           ORDER BY a.date, a.start_time"""
-    )
-    return _rows(await cur.fetchall())
-
+async def archive_appointments(
+    db: aiosqlite.Connection, before_date: str, batch_size: int
+) -> int:
+    """
+    Move up to `batch_size` finished appointments dated before `before_date`
+    into `appointments_archive` in one transaction.  Returns the number moved.
 
-async def get_appointments_by_date(
-    db: aiosqlite.Connection, date_str: str
-) -> list[dict]:
-    cur = await db.execute(
-        """SELECT a.*,
-                  u.full_name    AS client_full_name,
-                  m.display_name AS master_display_name,
-                  s.title        AS service_title
-           FROM appointments a
-           JOIN users u   ON a.client_id  = u.id
-           JOIN masters m ON a.master_id  = m.id
-           JOIN services s ON a.service_id = s.id
-           WHERE a.date=?
-           ORDER BY a.start_time""",
-        (date_str,),
-    )
-    return _rows(await cur.fetchall())
+    A reschedule offer stays while its proposed date is not past the cutoff
+    too: the client can still accept it.  Pending rows that old are past
+    any confirmation and are archived as they are.
+    """
+    try:
+        async with transaction(db):
+            cur = await db.execute(
+                """SELECT id FROM appointments
+                   WHERE date < ?
+                     AND (status != 'reschedule_offered' OR proposed_date < ?)
+                   ORDER BY date LIMIT ?""",
+                (before_date, before_date, batch_size),
+            )
+            ids = [r["id"] for r in await cur.fetchall()]
+            if ids:
+                placeholders = ",".join("?" * len(ids))
+                await db.execute(
+                    f"""INSERT OR REPLACE INTO appointments_archive ({_APPOINTMENT_COLUMNS})
+                        SELECT {_APPOINTMENT_COLUMNS} FROM appointments WHERE id IN ({placeholders})""",
+                    ids,
+                )
+                await db.execute(f"DELETE FROM appointments WHERE id IN ({placeholders})", ids)
+    except aiosqlite.OperationalError as exc:
+        if is_busy(exc):
+            return 0  # still locked after retries; the next run picks these up
+        raise
+    return len(ids)
@@ -0,0 +1,162 @@
+"""
+Serialized explicit transactions on the shared writer connection.
+
+Every coroutine writes through the same aiosqlite connection, so an explicit
+BEGIN IMMEDIATE … COMMIT used to be exposed to whatever else ran during its
+awaits: another handler's UPDATE landed inside it, a group commit could
+COMMIT it halfway, and a second BEGIN failed with "cannot start a
+transaction within a transaction".
+
+`serialize(db)` wraps the writer in a gate.  `transaction(db)` takes the gate
+(an asyncio.Lock, so transactions queue in FIFO order), flushes the group
+commit, and runs BEGIN IMMEDIATE, retrying SQLITE_BUSY with exponential
+backoff.  Until it commits or rolls back, statements from other tasks wait
+at the gate instead of joining the transaction.  The time spent waiting for
+the gate plus BEGIN shows up in /dbstats as "<tx wait>", the time the
+transaction is held as "<tx hold>".
+
+Do not spawn tasks that use the writer inside a transaction: they would wait
+for the gate their parent holds.
+"""
+from __future__ import annotations
+import asyncio
+import time
+from contextlib import asynccontextmanager
+from typing import AsyncIterator
+
+import aiosqlite
+
+from config import settings
+from db import instrumentation
+from db.coalescer import flush
+
+
+class SerializedConnection:
+    """Writer proxy whose statements wait while another task holds a transaction."""
+
+    def __init__(self, db: aiosqlite.Connection):
+        object.__setattr__(self, "_db", db)
+        object.__setattr__(self, "_lock", asyncio.Lock())
+        object.__setattr__(self, "_owner", None)  # task running the open transaction
+
+    def __getattr__(self, name):
+        return getattr(self._db, name)
+
+    def __setattr__(self, name, value):
+        setattr(self._db, name, value)
+
+    async def _wait_turn(self) -> None:
+        if self._owner is not None and self._owner is not asyncio.current_task():
+            async with self._lock:
+                pass
+
+    async def execute(self, sql: str, parameters=None):
+        await self._wait_turn()
+        return await self._db.execute(sql, parameters)
+
+    async def executemany(self, sql: str, parameters):
+        await self._wait_turn()
+        return await self._db.executemany(sql, parameters)
+
+    async def executescript(self, sql_script: str):
+        await self._wait_turn()
+        return await self._db.executescript(sql_script)
+
+    async def commit(self):
+        await self._wait_turn()
+        await self._db.commit()
+
+    async def rollback(self):
+        await self._wait_turn()
+        await self._db.rollback()
+
+
+def serialize(db: aiosqlite.Connection) -> aiosqlite.Connection:
+    return SerializedConnection(db)  # type: ignore[return-value]
+
+
+class Transaction:
+    def __init__(self, db: aiosqlite.Connection):
+        self.db = db
+        self.rolled_back = False
+
+    def rollback(self) -> None:
+        """Roll back instead of committing when the block exits."""
+        self.rolled_back = True
+
+
+def is_busy(exc: Exception) -> bool:
+    """SQLITE_BUSY / "database is locked" as raised by sqlite3."""
+    message = str(exc).lower()
+    return "locked" in message or "busy" in message
+
+
+async def _begin(db: aiosqlite.Connection) -> None:
+    delay = settings.DB_BUSY_BACKOFF_MS / 1000
+    for attempt in range(settings.DB_BUSY_RETRIES + 1):
+        try:
+            await db.execute("BEGIN IMMEDIATE")
+            return
+        except aiosqlite.OperationalError as exc:
+            if not is_busy(exc) or attempt == settings.DB_BUSY_RETRIES:
+                raise
+        await asyncio.sleep(delay)
+        delay *= 2
+
+
+@asynccontextmanager
+async def transaction(db: aiosqlite.Connection) -> AsyncIterator[Transaction]:
+    """
+    BEGIN IMMEDIATE … COMMIT as a unit of work on the writer:
+
+        async with transaction(db) as tx:
+            ...
+            if conflict:
+                tx.rollback()
+                return
+
+    Commits when the block exits normally, rolls back on tx.rollback() or
+    an exception (which propagates).  Raises if BEGIN keeps failing.
+    """
+    if not isinstance(db, SerializedConnection):
+        raise TypeError("transaction() needs the writer connection from write_db()")
+    task = asyncio.current_task()
+    if db._owner is task:
+        raise RuntimeError("transaction() is not reentrant")
+    requested = time.perf_counter()
+    async with db._lock:
+        object.__setattr__(db, "_owner", task)
+        try:
+            # Statements other tasks ran before we took the gate: commit them
+            # now, BEGIN cannot run inside their implicit transaction.  flush()
+            # settles the group-commit waiters; the extra COMMIT covers statements
+            # still queued in the worker thread, which in_transaction can't see yet.
+            await flush(db)
+            await db.commit()
+            await _begin(db)
+            started = time.perf_counter()
+            instrumentation.observe("<tx wait>", (started - requested) * 1000)
+            tx = Transaction(db)
+            try:
+                yield tx
+            except BaseException:
+                await _rollback(db)
+                raise
+            if tx.rolled_back:
+                await _rollback(db)
+            else:
+                try:
+                    await db.commit()
+                except BaseException:
+                    await _rollback(db)
+                    raise
+            instrumentation.observe("<tx hold>", (time.perf_counter() - started) * 1000)
+        finally:
+            object.__setattr__(db, "_owner", None)
+
+
+async def _rollback(db: aiosqlite.Connection) -> None:
+    try:
+        await db.execute("ROLLBACK")
+    except Exception:
+        pass
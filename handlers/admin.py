@@ -3,30 +3,39 @@ Admin panel handlers.
 All actions protected by is_admin flag from middleware.
 """
 from __future__ import annotations
-import csv
-import io
+import asyncio
+import html
+import os
+import time
 from datetime import date as date_type
 
 from aiogram import Router, F
+from aiogram.filters import Command, CommandObject
 from aiogram.fsm.context import FSMContext
 from aiogram.fsm.state import State, StatesGroup
 from aiogram.types import (
-    Message, CallbackQuery, BufferedInputFile, InlineKeyboardMarkup, InlineKeyboardButton
+    Message, CallbackQuery, FSInputFile, InlineKeyboardMarkup, InlineKeyboardButton
 )
 
-from db.database import get_db
+from config import settings
+from db.database import get_db, read_db
+from db import instrumentation
 from db import repositories as repo
+from storage.sqlite_storage import transition
 from services.validation import validate_time, validate_date
+from services.week_schedule import parse_week, format_week
+from services.export import export_appointments_csv
 from keyboards.admin_kb import (
     admin_menu_kb,
     masters_list_kb, master_detail_kb,
     services_list_kb, service_detail_kb,
     ms_masters_kb, ms_services_kb,
-    schedule_kb, breaks_list_kb,
+    schedule_kb, breaks_list_kb, week_targets_kb,
     blocks_menu_kb, global_blocks_kb, master_blocks_select_kb, master_blocks_kb,
     appointments_filter_kb, appointments_list_kb, apts_master_select_kb,
 )
-from utils.formatting import fmt_date, fmt_appointment, WEEKDAY_SHORT
+from utils.formatting import fmt_date, fmt_appointment, STATUS_LABELS, WEEKDAY_SHORT
+from utils.paging import page_nav_row, parse_page_callback
 
 router = Router()
 
@@ -48,6 +57,7 @@ class AdminStates(StatesGroup):
     sched_start            = State()
     sched_end              = State()
     sched_step             = State()
+    sched_week             = State()   # data: {week_target: "salon" | "all" | master_id}
     # Break
     break_wd               = State()
     break_start            = State()
@@ -87,7 +97,7 @@ async def masters_section(callback: CallbackQuery, is_admin: bool):
     if not _guard(is_admin):
         await callback.answer("⛔ Нет доступа.", show_alert=True)
         return
-    db = await get_db()
+    db = await read_db()
     masters = await repo.get_all_masters(db, active_only=False)
     await callback.message.edit_text(
         "👩‍🎨 <b>Мастера:</b>", reply_markup=masters_list_kb(masters), parse_mode="HTML"
@@ -100,7 +110,7 @@ async def services_section(callback: CallbackQuery, is_admin: bool):
     if not _guard(is_admin):
         await callback.answer("⛔ Нет доступа.", show_alert=True)
         return
-    db = await get_db()
+    db = await read_db()
     services = await repo.get_all_services(db, active_only=False)
     await callback.message.edit_text(
         "💅 <b>Услуги:</b>", reply_markup=services_list_kb(services), parse_mode="HTML"
@@ -113,7 +123,7 @@ async def ms_section(callback: CallbackQuery, is_admin: bool):
     if not _guard(is_admin):
         await callback.answer("⛔ Нет доступа.", show_alert=True)
         return
-    db = await get_db()
+    db = await read_db()
     masters = await repo.get_all_masters(db, active_only=True)
     await callback.message.edit_text(
         "🎚️ Выберите мастера:", reply_markup=ms_masters_kb(masters)
@@ -126,7 +136,7 @@ async def schedule_section(callback: CallbackQuery, is_admin: bool):
     if not _guard(is_admin):
         await callback.answer("⛔ Нет доступа.", show_alert=True)
         return
-    db = await get_db()
+    db = await read_db()
     rules = await repo.get_all_work_rules(db)
     await callback.message.edit_text(
         "🗓️ <b>Расписание салона:</b>", reply_markup=schedule_kb(rules), parse_mode="HTML"
@@ -156,30 +166,76 @@ async def appointments_section(callback: CallbackQuery, is_admin: bool):
     await callback.answer()
 
 
+@router.message(Command("dbstats"))
+async def cmd_dbstats(message: Message, command: CommandObject, is_admin: bool):
+    """/dbstats [p99|calls|reset] — slowest query shapes since start (or last reset)."""
+    if not _guard(is_admin):
+        await message.answer("⛔ Нет доступа.")
+        return
+    arg = (command.args or "").strip()
+    if arg == "reset":
+        instrumentation.reset()
+        await message.answer("🧹 Статистика запросов сброшена.")
+        return
+    order_by = {"p99": "p99_ms", "calls": "calls"}.get(arg, "total_ms")
+    text = instrumentation.report(top=10, order_by=order_by)
+    await message.answer(f"<pre>{html.escape(text[:3900])}</pre>", parse_mode="HTML")
+
+
+async def _send_export(message: Message, **filters):
+    """Stream the export to a temp file, report progress, upload it from disk."""
+    progress = await message.answer("⏳ Экспорт: 0 записей…")
+    last_edit = time.monotonic()
+
+    async def on_progress(rows: int):
+        nonlocal last_edit
+        if time.monotonic() - last_edit >= 2:  # stay well under Telegram's edit rate limit
+            last_edit = time.monotonic()
+            await progress.edit_text(f"⏳ Экспорт: {rows} записей…")
+
+    path, total = await export_appointments_csv(**filters, on_progress=on_progress)
+    try:
+        await message.answer_document(
+            FSInputFile(path, filename="appointments.csv"),
+            caption=f"📊 Экспорт: {total} записей",
+        )
+    finally:
+        await asyncio.to_thread(os.unlink, path)
+    await progress.delete()
+
+
 @router.callback_query(F.data == "ad_menu:csv")
 async def export_csv_cb(callback: CallbackQuery, is_admin: bool):
     if not _guard(is_admin):
         await callback.answer("⛔ Нет доступа.", show_alert=True)
         return
-    db = await get_db()
-    apts = await repo.get_all_appointments(db)
-    output = io.StringIO()
-    writer = csv.writer(output)
-    writer.writerow(["ID", "Дата", "Начало", "Конец", "Клиент", "Телефон", "Мастер", "Услуга", "Статус", "Создано"])
-    for apt in apts:
-        writer.writerow([
-            apt["id"], apt["date"], apt["start_time"], apt["end_time"],
-            apt.get("client_name") or apt.get("client_full_name", ""),
-            apt.get("client_phone") or apt.get("client_phone_u", ""),
-            apt.get("master_display_name", ""),
-            apt.get("service_title", ""),
-            apt["status"],
-            apt.get("created_at", ""),
-        ])
-    output.seek(0)
-    file = BufferedInputFile(output.getvalue().encode("utf-8-sig"), filename="appointments.csv")
-    await callback.message.answer_document(file, caption=f"📊 Экспорт: {len(apts)} записей")
     await callback.answer()
+    await _send_export(callback.message)
+
+
+@router.message(Command("export"))
+async def cmd_export(message: Message, command: CommandObject, is_admin: bool):
+    """/export [С [ПО]] [master=ID] [status=STATUS] — filtered CSV export."""
+    if not _guard(is_admin):
+        await message.answer("⛔ Нет доступа.")
+        return
+    filters, dates = {}, []
+    for arg in (command.args or "").split():
+        key, _, value = arg.partition("=")
+        if key == "master" and value.isdigit():
+            filters["master_id"] = int(value)
+        elif key == "status" and value in STATUS_LABELS:
+            filters["status"] = value
+        elif not value and validate_date(key) and len(dates) < 2:
+            dates.append(key)
+        else:
+            await message.answer(
+                "❗ Формат: /export [ГГГГ-ММ-ДД [ГГГГ-ММ-ДД]] [master=ID] [status=СТАТУС]\n"
+                f"Статусы: {', '.join(STATUS_LABELS)}"
+            )
+            return
+    filters.update(zip(("date_from", "date_to"), dates))
+    await _send_export(message, **filters)
 
 
 #MASTERS
@@ -188,7 +244,7 @@ async def export_csv_cb(callback: CallbackQuery, is_admin: bool):
 async def masters_list(callback: CallbackQuery, is_admin: bool):
     if not _guard(is_admin):
         return
-    db = await get_db()
+    db = await read_db()
     masters = await repo.get_all_masters(db, active_only=False)
     await callback.message.edit_text("👩‍🎨 <b>Мастера:</b>", reply_markup=masters_list_kb(masters), parse_mode="HTML")
 
@@ -198,7 +254,7 @@ async def master_detail(callback: CallbackQuery, is_admin: bool):
     if not _guard(is_admin):
         return
     master_id = int(callback.data.split(":")[1])
-    db = await get_db()
+    db = await read_db()
     master = await repo.get_master_by_id(db, master_id)
     if not master:
         await callback.answer("Мастер не найден.", show_alert=True)
@@ -256,8 +312,7 @@ async def add_master_tg_id(message: Message, state: FSMContext):
         )
         await state.clear()
         return
-    await state.update_data(new_master_user_id=user["id"], new_master_tg_id=user["tg_id"])
-    await state.set_state(AdminStates.add_master_display)
+    await transition(state, AdminStates.add_master_display, new_master_user_id=user["id"], new_master_tg_id=user["tg_id"])
     await message.answer(
         f"✅ Пользователь найден: {user.get('full_name') or user['tg_id']}\n\n"
         "Введите отображаемое имя мастера:"
@@ -351,7 +406,7 @@ async def toggle_personal_schedule(callback: CallbackQuery, is_admin: bool):
 async def services_list_cb(callback: CallbackQuery, is_admin: bool):
     if not _guard(is_admin):
         return
-    db = await get_db()
+    db = await read_db()
     services = await repo.get_all_services(db, active_only=False)
     await callback.message.edit_text(
         "💅 <b>Услуги:</b>", reply_markup=services_list_kb(services), parse_mode="HTML"
@@ -363,7 +418,7 @@ async def service_detail(callback: CallbackQuery, is_admin: bool):
     if not _guard(is_admin):
         return
     svc_id = int(callback.data.split(":")[1])
-    db = await get_db()
+    db = await read_db()
     svc = await repo.get_service_by_id(db, svc_id)
     if not svc:
         await callback.answer("Услуга не найдена.", show_alert=True)
@@ -392,8 +447,7 @@ async def add_svc_title(message: Message, state: FSMContext):
     if not title:
         await message.answer("❗ Название не может быть пустым.")
         return
-    await state.update_data(svc_title=title)
-    await state.set_state(AdminStates.add_svc_duration)
+    await transition(state, AdminStates.add_svc_duration, svc_title=title)
     await message.answer("⏱️ Введите длительность в минутах:")
 
 
@@ -405,8 +459,7 @@ async def add_svc_duration(message: Message, state: FSMContext):
     except (ValueError, AssertionError):
         await message.answer("❗ Введите положительное число.")
         return
-    await state.update_data(svc_duration=dur)
-    await state.set_state(AdminStates.add_svc_price)
+    await transition(state, AdminStates.add_svc_price, svc_duration=dur)
     await message.answer("💰 Введите цену (например, «1 500 ₽»):")
 
 
@@ -441,8 +494,7 @@ async def edit_svc_start(callback: CallbackQuery, state: FSMContext, is_admin: b
         "ad_svc_ed_price": ("default_price_text", "цену"),
     }
     field, label = field_map[action]
-    await state.update_data(edit_svc_id=svc_id, edit_svc_field=field)
-    await state.set_state(AdminStates.edit_svc_value)
+    await transition(state, AdminStates.edit_svc_value, edit_svc_id=svc_id, edit_svc_field=field)
     await callback.message.edit_text(f"✏️ Введите новое {label}:")
 
 
@@ -492,7 +544,7 @@ async def ms_choose_service(callback: CallbackQuery, state: FSMContext, is_admin
     if not _guard(is_admin):
         return
     master_id = int(callback.data.split(":")[1])
-    db = await get_db()
+    db = await read_db()
     services = await repo.get_all_services(db, active_only=False)
     await callback.message.edit_text(
         "🎚️ Выберите услугу для настройки:",
@@ -506,14 +558,13 @@ async def ms_set_start(callback: CallbackQuery, state: FSMContext, is_admin: boo
         return
     parts = callback.data.split(":")
     master_id, svc_id = int(parts[1]), int(parts[2])
-    db = await get_db()
+    db = await read_db()
     master = await repo.get_master_by_id(db, master_id)
     svc = await repo.get_service_by_id(db, svc_id)
     existing = await repo.get_master_service(db, master_id, svc_id)
     cur_dur = existing["duration_min"] if existing and existing["duration_min"] else svc["default_duration_min"]
     cur_price = existing["price_text"] if existing and existing["price_text"] else svc["default_price_text"]
-    await state.update_data(ms_master_id=master_id, ms_service_id=svc_id)
-    await state.set_state(AdminStates.ms_set_duration)
+    await transition(state, AdminStates.ms_set_duration, ms_master_id=master_id, ms_service_id=svc_id)
     await callback.message.edit_text(
         f"🎚️ <b>{master['display_name']}</b> — <b>{svc['title']}</b>\n\n"
         f"Текущая длительность: {cur_dur} мин\n"
@@ -561,8 +612,7 @@ async def edit_sched_wd(callback: CallbackQuery, state: FSMContext, is_admin: bo
     if not _guard(is_admin):
         return
     wd = int(callback.data.split(":")[1])
-    await state.update_data(sched_wd=wd)
-    await state.set_state(AdminStates.sched_start)
+    await transition(state, AdminStates.sched_start, sched_wd=wd)
     await callback.message.edit_text(
         f"🗓️ <b>{WEEKDAY_SHORT[wd]}</b>\n\n"
         "Введите время начала (ЧЧ:ММ) или /dayoff для выходного:",
@@ -583,8 +633,7 @@ async def admin_sched_start(message: Message, state: FSMContext):
     if not validate_time(text):
         await message.answer("❗ Введите ЧЧ:ММ или /dayoff.")
         return
-    await state.update_data(sched_start=text)
-    await state.set_state(AdminStates.sched_end)
+    await transition(state, AdminStates.sched_end, sched_start=text)
     await message.answer("🕐 Введите время окончания (ЧЧ:ММ):")
 
 
@@ -594,8 +643,7 @@ async def admin_sched_end(message: Message, state: FSMContext):
     if not validate_time(text):
         await message.answer("❗ Введите ЧЧ:ММ.")
         return
-    await state.update_data(sched_end=text)
-    await state.set_state(AdminStates.sched_step)
+    await transition(state, AdminStates.sched_step, sched_end=text)
     await message.answer("⏱️ Введите шаг слотов в минутах (например, 30):")
 
 
@@ -614,13 +662,123 @@ async def admin_sched_step(message: Message, state: FSMContext, is_admin: bool):
     await message.answer("✅ Расписание обновлено.", reply_markup=admin_menu_kb())
 
 
+#Whole week as text
+
+_WEEK_HELP = (
+    "Отправьте неделю одним сообщением, например:\n"
+    "<code>Пн-Пт 09:00-19:00/30; перерыв 13:00-14:00\n"
+    "Сб 10:00-16:00\n"
+    "Вс выходной</code>\n\n"
+    "/30 — шаг слотов (по умолчанию 30 мин). "
+    "Не указанные дни станут выходными."
+)
+
+_PERSONAL_WEEK_HELP = (
+    "Отправьте неделю одним сообщением, например:\n"
+    "<code>Пн-Пт 09:00-19:00/30; перерыв 13:00-14:00\n"
+    "Сб 10:00-16:00\n"
+    "Вс салон</code>\n\n"
+    "/30 — шаг слотов (по умолчанию 30 мин). "
+    "Дни, которых нет в тексте или с пометкой «салон», идут по расписанию салона; "
+    "день без «перерыв» — с перерывами салона."
+)
+
+
+@router.callback_query(F.data == "ad_week")
+async def week_targets(callback: CallbackQuery, is_admin: bool):
+    if not _guard(is_admin):
+        return
+    db = await read_db()
+    masters = await repo.get_all_masters(db)
+    await callback.message.edit_text(
+        "📝 <b>Чьё расписание заменить?</b>",
+        reply_markup=week_targets_kb(masters), parse_mode="HTML",
+    )
+
+
+@router.callback_query(F.data.startswith("ad_week_t:"))
+async def week_target_chosen(callback: CallbackQuery, state: FSMContext, is_admin: bool):
+    if not _guard(is_admin):
+        return
+    target = callback.data.split(":")[1]
+    db = await read_db()
+    if target == "salon":
+        title = "Салон"
+        current = format_week(await repo.get_all_work_rules(db), await repo.get_all_breaks(db))
+    elif target == "all":
+        allowed = [m for m in await repo.get_all_masters(db) if m["allow_personal_schedule"]]
+        if not allowed:
+            await callback.answer("Нет мастеров с разрешённым личным расписанием.", show_alert=True)
+            return
+        title = f"Все мастера с личным расписанием ({len(allowed)})"
+        current = None
+    else:
+        master = await repo.get_master_by_id(db, int(target))
+        if not master:
+            await callback.answer("Мастер не найден.", show_alert=True)
+            return
+        title = master["display_name"]
+        current = format_week(
+            await repo.get_all_master_work_rules(db, master["id"]),
+            await repo.get_all_master_breaks(db, master["id"]),
+            personal=True,
+        )
+        if not master["allow_personal_schedule"]:
+            title += " (личное расписание сейчас запрещено)"
+    await transition(state, AdminStates.sched_week, week_target=target)
+    text = f"📝 <b>{html.escape(title)}</b>\n\n"
+    if current is not None:
+        text += f"Сейчас:\n<code>{html.escape(current)}</code>\n\n"
+    help_text = _WEEK_HELP if target == "salon" else _PERSONAL_WEEK_HELP
+    await callback.message.edit_text(text + help_text, parse_mode="HTML")
+    await callback.answer()
+
+
+@router.message(AdminStates.sched_week)
+async def week_entered(message: Message, state: FSMContext, is_admin: bool):
+    target = (await state.get_data())["week_target"]
+    try:
+        week = parse_week(message.text or "", personal=target != "salon")
+    except ValueError as exc:
+        await message.answer(f"❗ {exc}")
+        return
+    db = await get_db()
+    if target == "salon":
+        master_ids = None
+    elif target == "all":
+        # Personal rules of masters without the permission would be ignored
+        master_ids = [
+            m["id"] for m in await repo.get_all_masters(db) if m["allow_personal_schedule"]
+        ]
+    else:
+        master_ids = [int(target)]
+    if master_ids == []:
+        await state.clear()
+        await message.answer(
+            "❗ Нет мастеров с разрешённым личным расписанием.", reply_markup=admin_menu_kb()
+        )
+        return
+    if not await repo.replace_week_schedule(db, week, master_ids):
+        await message.answer("❗ Не удалось сохранить расписание, попробуйте ещё раз.")
+        return
+    await state.clear()
+    if master_ids is None:
+        done = f"✅ Неделя сохранена: рабочих дней {len(week)}."
+    else:
+        done = (
+            f"✅ Неделя сохранена для мастеров: {len(master_ids)}, "
+            f"дней с личными часами {len(week)}."
+        )
+    await message.answer(done, reply_markup=admin_menu_kb())
+
+
 #Breaks
 
 @router.callback_query(F.data == "ad_breaks_list")
 async def breaks_list(callback: CallbackQuery, is_admin: bool):
     if not _guard(is_admin):
         return
-    db = await get_db()
+    db = await read_db()
     breaks = await repo.get_all_breaks(db)
     await callback.message.edit_text(
         "🍽️ <b>Перерывы:</b>", reply_markup=breaks_list_kb(breaks), parse_mode="HTML"
@@ -631,7 +789,7 @@ async def breaks_list(callback: CallbackQuery, is_admin: bool):
 async def sched_back(callback: CallbackQuery, is_admin: bool):
     if not _guard(is_admin):
         return
-    db = await get_db()
+    db = await read_db()
     rules = await repo.get_all_work_rules(db)
     await callback.message.edit_text(
         "🗓️ <b>Расписание салона:</b>", reply_markup=schedule_kb(rules), parse_mode="HTML"
@@ -653,8 +811,7 @@ async def add_break_start(callback: CallbackQuery, state: FSMContext, is_admin:
 @router.callback_query(AdminStates.break_wd, F.data.startswith("ad_brk_wd:"))
 async def break_wd_chosen(callback: CallbackQuery, state: FSMContext):
     wd = int(callback.data.split(":")[1])
-    await state.update_data(break_wd=wd)
-    await state.set_state(AdminStates.break_start)
+    await transition(state, AdminStates.break_start, break_wd=wd)
     await callback.message.edit_text(f"🍽️ {WEEKDAY_SHORT[wd]}\n🕐 Введите время начала перерыва (ЧЧ:ММ):")
 
 
@@ -663,8 +820,7 @@ async def break_start_entered(message: Message, state: FSMContext):
     if not validate_time(message.text or ""):
         await message.answer("❗ Введите ЧЧ:ММ.")
         return
-    await state.update_data(break_start=message.text.strip())
-    await state.set_state(AdminStates.break_end)
+    await transition(state, AdminStates.break_end, break_start=message.text.strip())
     await message.answer("🕐 Введите время окончания (ЧЧ:ММ):")
 
 
@@ -708,7 +864,7 @@ async def blk_menu(callback: CallbackQuery, is_admin: bool):
 async def blk_global(callback: CallbackQuery, is_admin: bool):
     if not _guard(is_admin):
         return
-    db = await get_db()
+    db = await read_db()
     blocks = await repo.get_all_blocks(db, master_id=None)
     await callback.message.edit_text(
         "🌐 <b>Общие блокировки:</b>",
@@ -721,7 +877,7 @@ async def blk_global(callback: CallbackQuery, is_admin: bool):
 async def blk_master_select(callback: CallbackQuery, is_admin: bool):
     if not _guard(is_admin):
         return
-    db = await get_db()
+    db = await read_db()
     masters = await repo.get_all_masters(db, active_only=True)
     await callback.message.edit_text(
         "👤 Выберите мастера:", reply_markup=master_blocks_select_kb(masters)
@@ -733,7 +889,7 @@ async def blk_master_blocks(callback: CallbackQuery, is_admin: bool):
     if not _guard(is_admin):
         return
     master_id = int(callback.data.split(":")[1])
-    db = await get_db()
+    db = await read_db()
     blocks = await repo.get_all_blocks(db, master_id=master_id)
     master = await repo.get_master_by_id(db, master_id)
     await callback.message.edit_text(
@@ -748,8 +904,7 @@ async def blk_add_start(callback: CallbackQuery, state: FSMContext, is_admin: bo
         return
     target = callback.data.split(":")[1]
     master_id = None if target == "global" else int(target)
-    await state.update_data(blk_master_id=master_id)
-    await state.set_state(AdminStates.blk_date)
+    await transition(state, AdminStates.blk_date, blk_master_id=master_id)
     await callback.message.edit_text("🗓️ Введите дату блокировки (ГГГГ-ММ-ДД):")
 
 
@@ -758,8 +913,7 @@ async def blk_date_entered(message: Message, state: FSMContext):
     if not validate_date(message.text or ""):
         await message.answer("❗ Введите дату ГГГГ-ММ-ДД.")
         return
-    await state.update_data(blk_date=message.text.strip())
-    await state.set_state(AdminStates.blk_start)
+    await transition(state, AdminStates.blk_start, blk_date=message.text.strip())
     await message.answer("🕐 Введите время начала (ЧЧ:ММ):")
 
 
@@ -768,8 +922,7 @@ async def blk_start_entered(message: Message, state: FSMContext):
     if not validate_time(message.text or ""):
         await message.answer("❗ Введите ЧЧ:ММ.")
         return
-    await state.update_data(blk_start=message.text.strip())
-    await state.set_state(AdminStates.blk_end)
+    await transition(state, AdminStates.blk_end, blk_start=message.text.strip())
     await message.answer("🕐 Введите время окончания (ЧЧ:ММ):")
 
 
@@ -778,8 +931,7 @@ async def blk_end_entered(message: Message, state: FSMContext):
     if not validate_time(message.text or ""):
         await message.answer("❗ Введите ЧЧ:ММ.")
         return
-    await state.update_data(blk_end=message.text.strip())
-    await state.set_state(AdminStates.blk_reason)
+    await transition(state, AdminStates.blk_reason, blk_end=message.text.strip())
     await message.answer("📝 Введите причину (или /skip):")
 
 
@@ -821,6 +973,30 @@ async def blk_delete(callback: CallbackQuery, is_admin: bool):
 
 #APPOINTMENTS
 
+async def _apts_page(
+    kind: str, cursor: tuple | None = None, backward: bool = False
+) -> tuple[str, InlineKeyboardMarkup]:
+    """
+    Title and keyboard for one page of an appointment list.  `kind` is
+    d{YYYYMMDD} (by date), m{master_id} (by master) or p (all pending).
+    """
+    db = await read_db()
+    if kind.startswith("d"):
+        date_str = f"{kind[1:5]}-{kind[5:7]}-{kind[7:]}"
+        title = f"📋 Записи на {fmt_date(date_str)}:"
+        filters = {"date_from": date_str, "date_to": date_str}
+    elif kind.startswith("m"):
+        master = await repo.get_master_by_id(db, int(kind[1:]))
+        title = f"📋 Записи мастера {master['display_name'] if master else '?'}:"
+        filters = {"master_id": int(kind[1:])}
+    else:
+        title, filters = "⏳ Все pending записи:", {"status_filter": ["pending"]}
+    page = await repo.get_appointments_page(
+        db, cursor=cursor, backward=backward, limit=settings.APPOINTMENTS_PAGE_SIZE, **filters
+    )
+    return title, appointments_list_kb(page["items"], page_nav_row(page, f"ad_pg:{kind}"))
+
+
 @router.callback_query(F.data == "ad_apts_date")
 async def apts_by_date_start(callback: CallbackQuery, state: FSMContext, is_admin: bool):
     if not _guard(is_admin):
@@ -835,20 +1011,16 @@ async def apts_by_date(message: Message, state: FSMContext, is_admin: bool):
         await message.answer("❗ Введите дату ГГГГ-ММ-ДД.")
         return
     date_str = message.text.strip()
-    db = await get_db()
-    apts = await repo.get_appointments_by_date(db, date_str)
     await state.clear()
-    await message.answer(
-        f"📋 Записи на {fmt_date(date_str)}:",
-        reply_markup=appointments_list_kb(apts),
-    )
+    title, kb = await _apts_page(f"d{date_str.replace('-', '')}")
+    await message.answer(title, reply_markup=kb)
 
 
 @router.callback_query(F.data == "ad_apts_master")
 async def apts_by_master_select(callback: CallbackQuery, is_admin: bool):
     if not _guard(is_admin):
         return
-    db = await get_db()
+    db = await read_db()
     masters = await repo.get_all_masters(db, active_only=False)
     await callback.message.edit_text(
         "👤 Выберите мастера:", reply_markup=apts_master_select_kb(masters)
@@ -859,25 +1031,26 @@ async def apts_by_master_select(callback: CallbackQuery, is_admin: bool):
 async def apts_by_master(callback: CallbackQuery, is_admin: bool):
     if not _guard(is_admin):
         return
-    master_id = int(callback.data.split(":")[1])
-    db = await get_db()
-    apts = await repo.get_appointments_for_master(db, master_id)
-    master = await repo.get_master_by_id(db, master_id)
-    await callback.message.edit_text(
-        f"📋 Записи мастера {master['display_name']}:",
-        reply_markup=appointments_list_kb(apts),
-    )
+    title, kb = await _apts_page(f"m{callback.data.split(':')[1]}")
+    await callback.message.edit_text(title, reply_markup=kb)
 
 
 @router.callback_query(F.data == "ad_apts_pending")
 async def apts_pending(callback: CallbackQuery, is_admin: bool):
     if not _guard(is_admin):
         return
-    db = await get_db()
-    apts = await repo.get_pending_appointments(db)
-    await callback.message.edit_text(
-        "⏳ Все pending записи:", reply_markup=appointments_list_kb(apts)
-    )
+    title, kb = await _apts_page("p")
+    await callback.message.edit_text(title, reply_markup=kb)
+
+
+@router.callback_query(F.data.startswith("ad_pg:"))
+async def apts_page(callback: CallbackQuery, is_admin: bool):
+    if not _guard(is_admin):
+        return
+    kind, cursor, backward = parse_page_callback(callback.data)
+    title, kb = await _apts_page(kind, cursor, backward)
+    await callback.message.edit_text(title, reply_markup=kb)
+    await callback.answer()
 
 
 @router.callback_query(F.data.startswith("ad_apt:"))
@@ -885,7 +1058,7 @@ async def apt_detail_admin(callback: CallbackQuery, is_admin: bool):
     if not _guard(is_admin):
         return
     apt_id = int(callback.data.split(":")[1])
-    db = await get_db()
+    db = await read_db()
     apt = await repo.get_appointment_by_id(db, apt_id)
     if not apt:
         await callback.answer("Запись не найдена.", show_alert=True)
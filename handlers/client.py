@@ -17,9 +17,13 @@ from aiogram.types import (
 )
 
 from config import settings
-from db.database import get_db
+from db.database import get_db, read_db
+from db import appointment_states
 from db import repositories as repo
-from services.slots import compute_free_slots
+from storage.sqlite_storage import transition
+from services.slots import compute_free_slots, compute_month_availability, m2t, t2m
+from services.search import find_earliest_any_master, find_next_free_slots
+from services.slot_holds import slot_holds
 from services.calendar_utils import build_calendar, current_ym
 from services.notifications import (
     notify_new_booking, notify_confirmed,
@@ -27,11 +31,12 @@ from services.notifications import (
 )
 from services.validation import validate_name, validate_phone
 from keyboards.client_kb import (
-    main_menu_kb, services_kb, masters_kb, slots_kb,
+    main_menu_kb, services_kb, masters_kb, slots_kb, any_master_slots_kb, next_slots_kb,
     confirm_booking_kb, my_appointments_kb,
     appointment_detail_kb, cancel_confirm_kb,
 )
-from utils.formatting import fmt_date, fmt_appointment
+from utils.formatting import fmt_date, fmt_appointment, TRANSITION_ERRORS
+from utils.paging import page_nav_row, parse_page_callback
 
 router = Router()
 
@@ -46,11 +51,38 @@ class ClientBooking(StatesGroup):
     confirming       = State()
 
 
+async def _booking_calendar(
+    master_id: int, duration: int, year: int, month: int, holder_id: int
+) -> InlineKeyboardMarkup:
+    """Calendar with fully booked days greyed out and a "nearest time" shortcut."""
+    availability = await compute_month_availability(
+        master_id, duration, year, month, holder_id=holder_id
+    )
+    kb = build_calendar(year, month, prefix="cl_cal", availability=availability)
+    kb.inline_keyboard.append(
+        [InlineKeyboardButton(text="⚡ Ближайшее время", callback_data="cl_next")]
+    )
+    return kb
+
+
+async def _hold_slot(
+    callback: CallbackQuery, user: dict, master_id: int, date_str: str, start: str, end: str
+) -> bool:
+    """Hold the picked time while the client fills in the form; alert if someone else holds it."""
+    if slot_holds.place(user["id"], master_id, date_str, t2m(start), t2m(end)):
+        return True
+    await callback.answer(
+        "😔 Это время только что выбрал другой клиент. Выберите другое.", show_alert=True
+    )
+    return False
+
+
 # ─────────────────── ENTRY: "Записаться" ──────────────────────
 
 @router.callback_query(F.data == "cl_menu:book")
-async def start_booking(callback: CallbackQuery, state: FSMContext):
-    db = await get_db()
+async def start_booking(callback: CallbackQuery, state: FSMContext, user: dict):
+    slot_holds.release(user["id"])
+    db = await read_db()
     services = await repo.get_all_services(db, active_only=True)
     if not services:
         await callback.answer("😔 К сожалению, услуги временно недоступны.", show_alert=True)
@@ -63,7 +95,7 @@ async def start_booking(callback: CallbackQuery, state: FSMContext):
 @router.callback_query(ClientBooking.choosing_service, F.data.startswith("cl_svc:"))
 async def choose_service(callback: CallbackQuery, state: FSMContext):
     service_id = int(callback.data.split(":")[1])
-    db = await get_db()
+    db = await read_db()
     service = await repo.get_service_by_id(db, service_id)
     if not service:
         await callback.answer("Услуга не найдена.", show_alert=True)
@@ -72,12 +104,12 @@ async def choose_service(callback: CallbackQuery, state: FSMContext):
     if not masters:
         await callback.answer("Нет доступных мастеров для этой услуги.", show_alert=True)
         return
-    await state.update_data(
+    await transition(
+        state, ClientBooking.choosing_master,
         service_id=service_id,
         service_title=service["title"],
         service_duration=service["default_duration_min"],
     )
-    await state.set_state(ClientBooking.choosing_master)
     await callback.message.edit_text(
         f"💅 Услуга: <b>{service['title']}</b>\n\n👤 Выберите мастера:",
         reply_markup=masters_kb(masters),
@@ -93,10 +125,71 @@ async def booking_back_main(callback: CallbackQuery, state: FSMContext):
     await callback.answer()
 
 
+@router.callback_query(ClientBooking.choosing_master, F.data == "cl_mst:any")
+async def choose_any_master(callback: CallbackQuery, state: FSMContext, user: dict):
+    data = await state.get_data()
+    slots = await find_earliest_any_master(data["service_id"], holder_id=user["id"])
+    if not slots:
+        await callback.answer("😔 Свободного времени у мастеров пока нет.", show_alert=True)
+        return
+    await callback.message.edit_text(
+        f"💅 {data['service_title']}\n\n⚡ Ближайшее свободное время:",
+        reply_markup=any_master_slots_kb(slots),
+    )
+    await callback.answer()
+
+
+@router.callback_query(ClientBooking.choosing_master, F.data.startswith("cl_any:"))
+async def choose_any_slot(callback: CallbackQuery, state: FSMContext, user: dict):
+    # format: cl_any:{master_id}:{YYYYMMDD}:{HHMM}
+    _, master_id, raw_date, raw_time = callback.data.split(":")
+    master_id = int(master_id)
+    date_str = f"{raw_date[:4]}-{raw_date[4:6]}-{raw_date[6:]}"
+    time_str = f"{raw_time[:2]}:{raw_time[2:]}"
+    db = await read_db()
+    master = await repo.get_master_by_id(db, master_id)
+    if not master:
+        await callback.answer("Мастер не найден.", show_alert=True)
+        return
+    data = await state.get_data()
+    duration = await repo.get_effective_duration(db, master_id, data["service_id"])
+    end_time = m2t(t2m(time_str) + duration)
+    if not await _hold_slot(callback, user, master_id, date_str, time_str, end_time):
+        return
+    await transition(
+        state, ClientBooking.entering_name,
+        master_id=master_id,
+        master_name=master["display_name"],
+        service_duration=duration,
+        date_str=date_str,
+        time_str=time_str,
+        end_time=end_time,
+    )
+    await callback.message.edit_text(
+        f"💅 {data['service_title']}\n"
+        f"👤 Мастер: {master['display_name']}\n"
+        f"📅 {fmt_date(date_str)}  🕐 {time_str}–{end_time}\n\n"
+        "✍️ Введите ваше имя:",
+        parse_mode="HTML",
+    )
+
+
+@router.callback_query(ClientBooking.choosing_master, F.data == "cl_back_mst")
+async def back_to_masters(callback: CallbackQuery, state: FSMContext):
+    data = await state.get_data()
+    db = await read_db()
+    masters = await repo.get_masters_for_service(db, data["service_id"])
+    await callback.message.edit_text(
+        f"💅 Услуга: <b>{data['service_title']}</b>\n\n👤 Выберите мастера:",
+        reply_markup=masters_kb(masters),
+        parse_mode="HTML",
+    )
+
+
 @router.callback_query(ClientBooking.choosing_master, F.data.startswith("cl_mst:"))
-async def choose_master(callback: CallbackQuery, state: FSMContext):
+async def choose_master(callback: CallbackQuery, state: FSMContext, user: dict):
     master_id = int(callback.data.split(":")[1])
-    db = await get_db()
+    db = await read_db()
     master = await repo.get_master_by_id(db, master_id)
     if not master:
         await callback.answer("Мастер не найден.", show_alert=True)
@@ -104,18 +197,18 @@ async def choose_master(callback: CallbackQuery, state: FSMContext):
     data = await state.get_data()
     service_id = data["service_id"]
     duration = await repo.get_effective_duration(db, master_id, service_id)
-    await state.update_data(
+    await transition(
+        state, ClientBooking.choosing_date,
         master_id=master_id,
         master_name=master["display_name"],
         service_duration=duration,
     )
-    await state.set_state(ClientBooking.choosing_date)
     y, m = current_ym()
     await callback.message.edit_text(
         f"💅 {data['service_title']}\n"
         f"👤 Мастер: <b>{master['display_name']}</b>\n\n"
         "📅 Выберите дату:",
-        reply_markup=build_calendar(y, m, prefix="cl_cal"),
+        reply_markup=await _booking_calendar(master_id, duration, y, m, user["id"]),
         parse_mode="HTML",
     )
 
@@ -123,7 +216,7 @@ async def choose_master(callback: CallbackQuery, state: FSMContext):
 @router.callback_query(ClientBooking.choosing_master, F.data == "cl_back_svc")
 async def back_to_service(callback: CallbackQuery, state: FSMContext):
     await state.set_state(ClientBooking.choosing_service)
-    db = await get_db()
+    db = await read_db()
     services = await repo.get_all_services(db, active_only=True)
     await callback.message.edit_text("💅 Выберите услугу:", reply_markup=services_kb(services))
 
@@ -131,7 +224,7 @@ async def back_to_service(callback: CallbackQuery, state: FSMContext):
 # ─────────────────── CALENDAR ─────────────────────────────────
 
 @router.callback_query(ClientBooking.choosing_date, F.data.startswith("cl_cal:"))
-async def calendar_action(callback: CallbackQuery, state: FSMContext):
+async def calendar_action(callback: CallbackQuery, state: FSMContext, user: dict):
     parts = callback.data.split(":")
     # format: cl_cal:{action}:{year}:{month}[:{day}]
     action = parts[1]
@@ -140,8 +233,11 @@ async def calendar_action(callback: CallbackQuery, state: FSMContext):
         return
     year, month = int(parts[2]), int(parts[3])
     if action in ("prev", "next"):
+        data = await state.get_data()
         await callback.message.edit_reply_markup(
-            reply_markup=build_calendar(year, month, prefix="cl_cal")
+            reply_markup=await _booking_calendar(
+                data["master_id"], data["service_duration"], year, month, user["id"]
+            )
         )
         await callback.answer()
         return
@@ -149,12 +245,13 @@ async def calendar_action(callback: CallbackQuery, state: FSMContext):
     day = int(parts[4])
     date_str = f"{year:04d}-{month:02d}-{day:02d}"
     data = await state.get_data()
-    slots = await compute_free_slots(data["master_id"], data["service_duration"], date_str)
+    slots = await compute_free_slots(
+        data["master_id"], data["service_duration"], date_str, holder_id=user["id"]
+    )
     if not slots:
         await callback.answer("На этот день нет свободных слотов.", show_alert=True)
         return
-    await state.update_data(date_str=date_str)
-    await state.set_state(ClientBooking.choosing_time)
+    await transition(state, ClientBooking.choosing_time, date_str=date_str)
     await callback.message.edit_text(
         f"💅 {data['service_title']}\n"
         f"👤 Мастер: {data['master_name']}\n"
@@ -165,10 +262,30 @@ async def calendar_action(callback: CallbackQuery, state: FSMContext):
     )
 
 
+@router.callback_query(ClientBooking.choosing_date, F.data == "cl_next")
+async def nearest_slots(callback: CallbackQuery, state: FSMContext, user: dict):
+    data = await state.get_data()
+    now = datetime.now(pytz.timezone(settings.TIMEZONE)).replace(tzinfo=None)
+    slots = await find_next_free_slots(
+        data["master_id"], data["service_duration"], now, holder_id=user["id"]
+    )
+    if not slots:
+        await callback.answer("😔 Свободного времени пока нет.", show_alert=True)
+        return
+    await state.set_state(ClientBooking.choosing_time)
+    await callback.message.edit_text(
+        f"💅 {data['service_title']}\n"
+        f"👤 Мастер: {data['master_name']}\n\n"
+        "⚡ Ближайшее свободное время:",
+        reply_markup=next_slots_kb(slots),
+    )
+    await callback.answer()
+
+
 # ─────────────────── TIME SLOT ────────────────────────────────
 
 @router.callback_query(ClientBooking.choosing_time, F.data.startswith("cl_slot:"))
-async def choose_slot(callback: CallbackQuery, state: FSMContext):
+async def choose_slot(callback: CallbackQuery, state: FSMContext, user: dict):
     # format: cl_slot:{YYYYMMDD}:{HHMM}
     parts = callback.data.split(":")
     raw_date = parts[1]   # YYYYMMDD
@@ -177,12 +294,15 @@ async def choose_slot(callback: CallbackQuery, state: FSMContext):
     time_str = f"{raw_time[:2]}:{raw_time[2:]}"
 
     data = await state.get_data()
-    from services.slots import m2t, t2m
     end_m = t2m(time_str) + data["service_duration"]
     end_time = m2t(end_m)
+    if not await _hold_slot(callback, user, data["master_id"], date_str, time_str, end_time):
+        return
 
-    await state.update_data(time_str=time_str, end_time=end_time)
-    await state.set_state(ClientBooking.entering_name)
+    await transition(
+        state, ClientBooking.entering_name,
+        date_str=date_str, time_str=time_str, end_time=end_time,
+    )
     await callback.message.edit_text(
         f"💅 {data['service_title']}\n"
         f"👤 Мастер: {data['master_name']}\n"
@@ -193,12 +313,15 @@ async def choose_slot(callback: CallbackQuery, state: FSMContext):
 
 
 @router.callback_query(ClientBooking.choosing_time, F.data == "cl_back_date")
-async def back_to_date(callback: CallbackQuery, state: FSMContext):
+async def back_to_date(callback: CallbackQuery, state: FSMContext, user: dict):
     await state.set_state(ClientBooking.choosing_date)
+    data = await state.get_data()
     y, m = current_ym()
     await callback.message.edit_text(
         "📅 Выберите дату:",
-        reply_markup=build_calendar(y, m, prefix="cl_cal"),
+        reply_markup=await _booking_calendar(
+            data["master_id"], data["service_duration"], y, m, user["id"]
+        ),
     )
 
 
@@ -210,8 +333,7 @@ async def enter_name(message: Message, state: FSMContext):
     if not name:
         await message.answer("❗ Введите корректное имя (2–64 символа).")
         return
-    await state.update_data(client_name=name)
-    await state.set_state(ClientBooking.entering_phone)
+    await transition(state, ClientBooking.entering_phone, client_name=name)
     await message.answer("📞 Введите ваш номер телефона (например, +7 999 123-45-67):")
 
 
@@ -226,8 +348,7 @@ async def enter_phone(message: Message, state: FSMContext, user: dict):
     data = await state.get_data()
     db = await get_db()
     await repo.update_user_phone(db, user["id"], phone)
-    await state.update_data(client_phone=phone)
-    await state.set_state(ClientBooking.confirming)
+    await transition(state, ClientBooking.confirming, client_phone=phone)
     summary = (
         f"📋 <b>Подтвердите запись:</b>\n\n"
         f"💅 Услуга:  {data['service_title']}\n"
@@ -245,18 +366,28 @@ async def enter_phone(message: Message, state: FSMContext, user: dict):
 @router.callback_query(ClientBooking.confirming, F.data == "cl_book_ok")
 async def confirm_booking(callback: CallbackQuery, state: FSMContext, user: dict):
     data = await state.get_data()
-    db = await get_db()
-    apt, result = await repo.create_appointment(
-        db,
-        client_id=user["id"],
-        master_id=data["master_id"],
-        service_id=data["service_id"],
-        date_str=data["date_str"],
-        start_time=data["time_str"],
-        end_time=data["end_time"],
-        client_name=data["client_name"],
-        client_phone=data["client_phone"],
-    )
+    # Re-take the hold: it may have expired while the form was filled in,
+    # and then another client may hold the time now
+    if slot_holds.place(
+        user["id"], data["master_id"], data["date_str"],
+        t2m(data["time_str"]), t2m(data["end_time"]),
+    ):
+        db = await get_db()
+        apt, result = await repo.create_appointment(
+            db,
+            client_id=user["id"],
+            master_id=data["master_id"],
+            service_id=data["service_id"],
+            date_str=data["date_str"],
+            start_time=data["time_str"],
+            end_time=data["end_time"],
+            client_name=data["client_name"],
+            client_phone=data["client_phone"],
+        )
+    else:
+        apt, result = None, "overlap"
+    # The appointment (if any) now occupies the time itself
+    slot_holds.release(user["id"])
     await state.clear()
     if result == "overlap":
         await callback.message.edit_text(
@@ -280,7 +411,8 @@ async def confirm_booking(callback: CallbackQuery, state: FSMContext, user: dict
 
 
 @router.callback_query(ClientBooking.confirming, F.data == "cl_book_cancel")
-async def cancel_booking_flow(callback: CallbackQuery, state: FSMContext):
+async def cancel_booking_flow(callback: CallbackQuery, state: FSMContext, user: dict):
+    slot_holds.release(user["id"])
     await state.clear()
     await callback.message.edit_text("Запись отменена.")
     await callback.message.answer("Главное меню:", reply_markup=main_menu_kb())
@@ -288,12 +420,40 @@ async def cancel_booking_flow(callback: CallbackQuery, state: FSMContext):
 
 # ─────────────────── MY APPOINTMENTS ──────────────────────────
 
+# kind → statuses listed; "my" hides finished-off rows, "cancel" shows what can be cancelled
+_CLIENT_LISTS = {
+    "my": ["pending", "confirmed", "reschedule_offered"],
+    "cancel": ["pending", "confirmed"],
+}
+
+
+async def _my_apts_page(
+    user: dict, kind: str, cursor: tuple | None = None, backward: bool = False
+) -> tuple[str, InlineKeyboardMarkup]:
+    db = await read_db()
+    page = await repo.get_appointments_page(
+        db, client_id=user["id"], status_filter=_CLIENT_LISTS[kind],
+        cursor=cursor, backward=backward, newest_first=True,
+        limit=settings.APPOINTMENTS_PAGE_SIZE,
+    )
+    if kind == "my":
+        text = "📅 <b>Ваши записи:</b>" if page["items"] else "📅 У вас нет активных записей."
+    else:
+        text = "❌ Выберите запись для отмены:" if page["items"] else "Нет записей для отмены."
+    return text, my_appointments_kb(page["items"], page_nav_row(page, f"cl_pg:{kind}"))
+
+
 @router.callback_query(F.data.in_({"cl_menu:my", "cl_my_apts"}))
 async def my_appointments(callback: CallbackQuery, user: dict):
-    db = await get_db()
-    apts = await repo.get_appointments_for_client(db, user["id"])
-    kb = my_appointments_kb(apts)
-    text = "📅 <b>Ваши записи:</b>" if apts else "📅 У вас нет активных записей."
+    text, kb = await _my_apts_page(user, "my")
+    await callback.message.edit_text(text, reply_markup=kb, parse_mode="HTML")
+    await callback.answer()
+
+
+@router.callback_query(F.data.startswith("cl_pg:"))
+async def my_appointments_page(callback: CallbackQuery, user: dict):
+    kind, cursor, backward = parse_page_callback(callback.data)
+    text, kb = await _my_apts_page(user, kind, cursor, backward)
     await callback.message.edit_text(text, reply_markup=kb, parse_mode="HTML")
     await callback.answer()
 
@@ -301,7 +461,7 @@ async def my_appointments(callback: CallbackQuery, user: dict):
 @router.callback_query(F.data.startswith("cl_apt:"))
 async def appointment_detail(callback: CallbackQuery, user: dict):
     apt_id = int(callback.data.split(":")[1])
-    db = await get_db()
+    db = await read_db()
     apt = await repo.get_appointment_by_id(db, apt_id)
     if not apt or apt["client_id"] != user["id"]:
         await callback.answer("Запись не найдена.", show_alert=True)
@@ -320,11 +480,7 @@ async def appointment_detail(callback: CallbackQuery, user: dict):
 
 @router.callback_query(F.data == "cl_menu:cancel")
 async def cancel_menu(callback: CallbackQuery, user: dict):
-    db = await get_db()
-    apts = await repo.get_appointments_for_client(db, user["id"])
-    cancellable = [a for a in apts if a["status"] in ("pending", "confirmed")]
-    kb = my_appointments_kb(cancellable)
-    text = "❌ Выберите запись для отмены:" if cancellable else "Нет записей для отмены."
+    text, kb = await _my_apts_page(user, "cancel")
     await callback.message.edit_text(text, reply_markup=kb)
     await callback.answer()
 
@@ -332,7 +488,7 @@ async def cancel_menu(callback: CallbackQuery, user: dict):
 @router.callback_query(F.data.startswith("cl_acancel:"))
 async def initiate_cancel(callback: CallbackQuery, user: dict):
     apt_id = int(callback.data.split(":")[1])
-    db = await get_db()
+    db = await read_db()
     apt = await repo.get_appointment_by_id(db, apt_id)
     if not apt or apt["client_id"] != user["id"]:
         await callback.answer("Запись не найдена.", show_alert=True)
@@ -348,15 +504,12 @@ async def initiate_cancel(callback: CallbackQuery, user: dict):
 async def confirm_cancel(callback: CallbackQuery, user: dict):
     apt_id = int(callback.data.split(":")[1])
     db = await get_db()
-    apt = await repo.get_appointment_by_id(db, apt_id)
-    if not apt or apt["client_id"] != user["id"]:
-        await callback.answer("Запись не найдена.", show_alert=True)
+    apt, result = await appointment_states.apply(db, "cancel", apt_id, client_id=user["id"])
+    if not apt:
+        await callback.answer(TRANSITION_ERRORS[result], show_alert=True)
         return
-    await repo.cancel_appointment(db, apt_id)
-    apt_updated = await repo.get_appointment_by_id(db, apt_id)
     await callback.message.edit_text("🚫 Запись отменена.")
-    if apt_updated:
-        await notify_cancelled(apt_updated)
+    await notify_cancelled(apt)
 
 
 # ─────────────────── RESCHEDULE RESPONSE ──────────────────────
@@ -365,38 +518,29 @@ async def confirm_cancel(callback: CallbackQuery, user: dict):
 async def reschedule_accept(callback: CallbackQuery, user: dict):
     apt_id = int(callback.data.split(":")[1])
     db = await get_db()
-    apt = await repo.get_appointment_by_id(db, apt_id)
-    if not apt or apt["client_id"] != user["id"]:
-        await callback.answer("Запись не найдена.", show_alert=True)
-        return
-    new_apt = await repo.accept_reschedule(db, apt_id)
+    old_apt, new_apt, result = await appointment_states.accept_reschedule(db, apt_id, user["id"])
     if not new_apt:
-        await callback.answer("Не удалось принять перенос — время уже занято.", show_alert=True)
+        await callback.answer(TRANSITION_ERRORS[result], show_alert=True)
         return
-    apt_updated = await repo.get_appointment_by_id(db, apt_id)
     await callback.message.edit_text(
         f"✅ Перенос принят!\n\n"
         f"Новая запись #{new_apt['id']}:\n"
         f"{fmt_appointment(new_apt, show_master=True)}",
         parse_mode="HTML",
     )
-    if apt_updated:
-        await notify_reschedule_accepted(apt_updated, new_apt)
+    await notify_reschedule_accepted(old_apt, new_apt)
 
 
 @router.callback_query(F.data.startswith("cl_rsr_no:"))
 async def reschedule_decline(callback: CallbackQuery, user: dict):
     apt_id = int(callback.data.split(":")[1])
     db = await get_db()
-    apt = await repo.get_appointment_by_id(db, apt_id)
-    if not apt or apt["client_id"] != user["id"]:
-        await callback.answer("Запись не найдена.", show_alert=True)
+    apt, result = await appointment_states.apply(db, "decline_reschedule", apt_id, client_id=user["id"])
+    if not apt:
+        await callback.answer(TRANSITION_ERRORS[result], show_alert=True)
         return
-    await repo.decline_reschedule(db, apt_id)
-    apt_updated = await repo.get_appointment_by_id(db, apt_id)
     await callback.message.edit_text("❌ Вы отказались от переноса.")
-    if apt_updated:
-        await notify_reschedule_declined(apt_updated)
+    await notify_reschedule_declined(apt)
 
 
 # ─────────────────── CONTACTS ─────────────────────────────────
@@ -2,33 +2,41 @@
 Master panel handlers.
 """
 from __future__ import annotations
-from datetime import date, timedelta
+import html
+from datetime import date, datetime, timedelta
 
 import pytz
 from aiogram import Router, F
 from aiogram.fsm.context import FSMContext
 from aiogram.fsm.state import State, StatesGroup
-from aiogram.types import Message, CallbackQuery
+from aiogram.types import Message, CallbackQuery, InlineKeyboardMarkup, InlineKeyboardButton
 
 from config import settings
-from db.database import get_db
+from db.database import get_db, read_db
+from db import appointment_states
 from db import repositories as repo
-from services.slots import compute_free_slots, m2t, t2m
+from storage.sqlite_storage import transition
+from services.slots import compute_free_slots, compute_month_availability, m2t, t2m
+from services.search import find_next_free_slots
 from services.calendar_utils import build_calendar, current_ym
 from services.notifications import (
     notify_confirmed, notify_declined,
     notify_reschedule_offer,
 )
 from services.validation import validate_time, validate_date
+from services.week_schedule import parse_week, format_week
 from keyboards.master_kb import (
     master_menu_kb,
     appointments_list_kb,
+    agenda_kb,
     appointment_actions_kb,
     blocks_list_kb,
     master_schedule_kb,
     reschedule_slot_confirm_kb,
+    reschedule_next_slots_kb,
 )
-from utils.formatting import fmt_date, fmt_appointment
+from utils.formatting import fmt_date, fmt_appointment, TRANSITION_ERRORS
+from utils.paging import page_nav_row, parse_page_callback
 
 router = Router()
 
@@ -48,11 +56,11 @@ class MasterStates(StatesGroup):
     sched_start         = State()
     sched_end           = State()
     sched_step          = State()
+    sched_week          = State()
 
 
 def _tz_today() -> date:
     tz = pytz.timezone(settings.TIMEZONE)
-    from datetime import datetime
     return datetime.now(tz).date()
 
 
@@ -60,6 +68,22 @@ def _require_master(master):
     return master and master["is_active"]
 
 
+async def _reschedule_calendar(apt: dict, year: int, month: int):
+    """Reschedule calendar for `apt` with fully booked days greyed out."""
+    db = await read_db()
+    duration = await repo.get_effective_duration(db, apt["master_id"], apt["service_id"])
+    availability = await compute_month_availability(
+        apt["master_id"], duration, year, month, exclude_apt_id=apt["id"]
+    )
+    kb = build_calendar(
+        year, month, prefix="mres", extra=str(apt["id"]), availability=availability
+    )
+    kb.inline_keyboard.append([InlineKeyboardButton(
+        text="⚡ Ближайшее время", callback_data=f"mres_next:{apt['id']}"
+    )])
+    return kb
+
+
 # ─────────────────── MENU ENTRY POINTS ────────────────────────
 
 @router.callback_query(F.data == "ma_menu:back")
@@ -71,77 +95,71 @@ async def master_back_menu(callback: CallbackQuery, master: dict | None):
     await callback.answer()
 
 
-@router.callback_query(F.data == "ma_menu:today")
-async def today_apts(callback: CallbackQuery, master: dict | None):
-    if not _require_master(master):
-        await callback.answer("⛔ Нет доступа.", show_alert=True)
-        return
-    db = await get_db()
-    today = _tz_today().isoformat()
-    apts = await repo.get_appointments_for_master(
-        db, master["id"], date_str=today,
-        status_filter=["pending", "confirmed", "reschedule_offered"],
-    )
-    await callback.message.edit_text(
-        f"📅 Записи на сегодня ({fmt_date(today)}):",
-        reply_markup=appointments_list_kb(apts),
+_ACTIVE = ["pending", "confirmed", "reschedule_offered"]
+
+
+async def _apts_page(
+    master: dict, kind: str, cursor: tuple | None = None, backward: bool = False
+) -> tuple[str, InlineKeyboardMarkup]:
+    """
+    Title and keyboard for one page of a list: today / tomorrow / pending,
+    or w{N} for the agenda of the next N weeks grouped by day.
+    """
+    today = _tz_today()
+    if kind == "pending":
+        title, filters = "✅ Записи, ожидающие подтверждения:", {"status_filter": ["pending"]}
+    elif kind.startswith("w"):
+        last = today + timedelta(days=7 * int(kind[1:]) - 1)
+        title = f"📅 Записи с {fmt_date(today.isoformat())} по {fmt_date(last.isoformat())}:"
+        filters = {
+            "date_from": today.isoformat(), "date_to": last.isoformat(), "status_filter": _ACTIVE,
+        }
+    else:
+        tomorrow = kind == "tomorrow"
+        day = (today + timedelta(days=1 if tomorrow else 0)).isoformat()
+        title = f"📅 Записи на {'завтра' if tomorrow else 'сегодня'} ({fmt_date(day)}):"
+        filters = {"date_from": day, "date_to": day, "status_filter": _ACTIVE}
+    db = await read_db()
+    page = await repo.get_appointments_page(
+        db, master_id=master["id"], cursor=cursor, backward=backward,
+        limit=settings.APPOINTMENTS_PAGE_SIZE, **filters,
     )
-    await callback.answer()
+    nav = page_nav_row(page, f"ma_pg:{kind}")
+    if kind.startswith("w"):
+        return title, agenda_kb(page["items"], int(kind[1:]), nav)
+    return title, appointments_list_kb(page["items"], nav)
 
 
-@router.callback_query(F.data == "ma_menu:tomorrow")
-async def tomorrow_apts(callback: CallbackQuery, master: dict | None):
+@router.callback_query(F.data.in_({"ma_menu:today", "ma_menu:tomorrow", "ma_menu:pending"}))
+async def apts_list(callback: CallbackQuery, master: dict | None):
     if not _require_master(master):
         await callback.answer("⛔ Нет доступа.", show_alert=True)
         return
-    db = await get_db()
-    tomorrow = (_tz_today() + timedelta(days=1)).isoformat()
-    apts = await repo.get_appointments_for_master(
-        db, master["id"], date_str=tomorrow,
-        status_filter=["pending", "confirmed", "reschedule_offered"],
-    )
-    await callback.message.edit_text(
-        f"📅 Записи на завтра ({fmt_date(tomorrow)}):",
-        reply_markup=appointments_list_kb(apts),
-    )
+    title, kb = await _apts_page(master, callback.data.split(":")[1])
+    await callback.message.edit_text(title, reply_markup=kb)
     await callback.answer()
 
 
-@router.callback_query(F.data == "ma_menu:week")
-async def week_apts(callback: CallbackQuery, master: dict | None):
+@router.callback_query(F.data.startswith("ma_pg:"))
+async def apts_list_page(callback: CallbackQuery, master: dict | None):
     if not _require_master(master):
         await callback.answer("⛔ Нет доступа.", show_alert=True)
         return
-    db = await get_db()
-    apts_all = []
-    today = _tz_today()
-    for i in range(7):
-        d = (today + timedelta(days=i)).isoformat()
-        apts = await repo.get_appointments_for_master(
-            db, master["id"], date_str=d,
-            status_filter=["pending", "confirmed", "reschedule_offered"],
-        )
-        apts_all.extend(apts)
-    await callback.message.edit_text(
-        "📅 Записи на неделю:",
-        reply_markup=appointments_list_kb(apts_all),
-    )
+    kind, cursor, backward = parse_page_callback(callback.data)
+    title, kb = await _apts_page(master, kind, cursor, backward)
+    await callback.message.edit_text(title, reply_markup=kb)
     await callback.answer()
 
 
-@router.callback_query(F.data == "ma_menu:pending")
-async def pending_apts(callback: CallbackQuery, master: dict | None):
+@router.callback_query(F.data == "ma_menu:week")
+@router.callback_query(F.data.startswith("ma_agenda:"))
+async def agenda_apts(callback: CallbackQuery, master: dict | None):
     if not _require_master(master):
         await callback.answer("⛔ Нет доступа.", show_alert=True)
         return
-    db = await get_db()
-    apts = await repo.get_appointments_for_master(
-        db, master["id"], status_filter=["pending"]
-    )
-    await callback.message.edit_text(
-        "✅ Записи, ожидающие подтверждения:",
-        reply_markup=appointments_list_kb(apts),
-    )
+    weeks = int(callback.data.split(":")[1]) if callback.data.startswith("ma_agenda:") else 1
+    title, kb = await _apts_page(master, f"w{weeks}")
+    await callback.message.edit_text(title, reply_markup=kb)
     await callback.answer()
 
 
@@ -153,7 +171,7 @@ async def apt_detail(callback: CallbackQuery, master: dict | None):
         await callback.answer("⛔ Нет доступа.", show_alert=True)
         return
     apt_id = int(callback.data.split(":")[1])
-    db = await get_db()
+    db = await read_db()
     apt = await repo.get_appointment_by_id(db, apt_id)
     if not apt or apt["master_id"] != master["id"]:
         await callback.answer("Запись не найдена.", show_alert=True)
@@ -174,16 +192,8 @@ async def back_to_list(callback: CallbackQuery, master: dict | None):
     if not _require_master(master):
         await callback.answer()
         return
-    db = await get_db()
-    today = _tz_today().isoformat()
-    apts = await repo.get_appointments_for_master(
-        db, master["id"], date_str=today,
-        status_filter=["pending", "confirmed", "reschedule_offered"],
-    )
-    await callback.message.edit_text(
-        f"📅 Записи на сегодня ({fmt_date(today)}):",
-        reply_markup=appointments_list_kb(apts),
-    )
+    title, kb = await _apts_page(master, "today")
+    await callback.message.edit_text(title, reply_markup=kb)
 
 
 # ─────────────────── CONFIRM / DECLINE ────────────────────────
@@ -195,18 +205,15 @@ async def confirm_apt(callback: CallbackQuery, master: dict | None):
         return
     apt_id = int(callback.data.split(":")[1])
     db = await get_db()
-    apt = await repo.get_appointment_by_id(db, apt_id)
-    if not apt or apt["master_id"] != master["id"]:
-        await callback.answer("Запись не найдена.", show_alert=True)
+    apt, result = await appointment_states.apply(db, "confirm", apt_id, master_id=master["id"])
+    if not apt:
+        await callback.answer(TRANSITION_ERRORS[result], show_alert=True)
         return
-    await repo.update_appointment_status(db, apt_id, "confirmed")
-    apt_updated = await repo.get_appointment_by_id(db, apt_id)
     await callback.message.edit_text(
         f"✅ Запись #{apt_id} подтверждена.",
         reply_markup=None,
     )
-    if apt_updated:
-        await notify_confirmed(apt_updated)
+    await notify_confirmed(apt)
 
 
 @router.callback_query(F.data.startswith("ma_decl:"))
@@ -216,15 +223,12 @@ async def decline_apt(callback: CallbackQuery, master: dict | None):
         return
     apt_id = int(callback.data.split(":")[1])
     db = await get_db()
-    apt = await repo.get_appointment_by_id(db, apt_id)
-    if not apt or apt["master_id"] != master["id"]:
-        await callback.answer("Запись не найдена.", show_alert=True)
+    apt, result = await appointment_states.apply(db, "decline", apt_id, master_id=master["id"])
+    if not apt:
+        await callback.answer(TRANSITION_ERRORS[result], show_alert=True)
         return
-    await repo.update_appointment_status(db, apt_id, "declined")
-    apt_updated = await repo.get_appointment_by_id(db, apt_id)
     await callback.message.edit_text(f"❌ Запись #{apt_id} отклонена.", reply_markup=None)
-    if apt_updated:
-        await notify_declined(apt_updated)
+    await notify_declined(apt)
 
 
 # ─────────────────── RESCHEDULE OFFER ─────────────────────────
@@ -235,17 +239,16 @@ async def start_reschedule(callback: CallbackQuery, state: FSMContext, master: d
         await callback.answer("⛔ Нет доступа.", show_alert=True)
         return
     apt_id = int(callback.data.split(":")[1])
-    db = await get_db()
+    db = await read_db()
     apt = await repo.get_appointment_by_id(db, apt_id)
     if not apt or apt["master_id"] != master["id"]:
         await callback.answer("Запись не найдена.", show_alert=True)
         return
-    await state.set_state(MasterStates.reschedule_date)
-    await state.update_data(reschedule_apt_id=apt_id)
+    await transition(state, MasterStates.reschedule_date, reschedule_apt_id=apt_id)
     y, m = current_ym()
     await callback.message.edit_text(
         f"🔁 Предложить перенос записи #{apt_id}\n\n📅 Выберите новую дату:",
-        reply_markup=build_calendar(y, m, prefix="mres", extra=str(apt_id)),
+        reply_markup=await _reschedule_calendar(apt, y, m),
     )
 
 
@@ -260,9 +263,13 @@ async def reschedule_calendar(callback: CallbackQuery, state: FSMContext, master
         await callback.answer()
         return
     if action in ("prev", "next"):
-        apt_id_str = extra
+        apt_id = int(extra) if extra else (await state.get_data()).get("reschedule_apt_id")
+        apt = await repo.get_appointment_by_id(await read_db(), apt_id)
+        if not apt:
+            await callback.answer("Запись не найдена.", show_alert=True)
+            return
         await callback.message.edit_reply_markup(
-            reply_markup=build_calendar(year, month, prefix="mres", extra=apt_id_str)
+            reply_markup=await _reschedule_calendar(apt, year, month)
         )
         await callback.answer()
         return
@@ -273,7 +280,7 @@ async def reschedule_calendar(callback: CallbackQuery, state: FSMContext, master
 
     data = await state.get_data()
     apt_id = data.get("reschedule_apt_id")
-    db = await get_db()
+    db = await read_db()
     apt = await repo.get_appointment_by_id(db, apt_id)
     if not apt:
         await callback.answer("Запись не найдена.", show_alert=True)
@@ -283,9 +290,7 @@ async def reschedule_calendar(callback: CallbackQuery, state: FSMContext, master
     if not slots:
         await callback.answer("На этот день нет свободных слотов.", show_alert=True)
         return
-    await state.update_data(reschedule_date=date_str)
-    await state.set_state(MasterStates.reschedule_time)
-    from aiogram.types import InlineKeyboardMarkup, InlineKeyboardButton
+    await transition(state, MasterStates.reschedule_time, reschedule_date=date_str)
     rows = []
     row = []
     for i, slot in enumerate(slots):
@@ -306,6 +311,28 @@ async def reschedule_calendar(callback: CallbackQuery, state: FSMContext, master
     )
 
 
+@router.callback_query(MasterStates.reschedule_date, F.data.startswith("mres_next:"))
+async def reschedule_nearest(callback: CallbackQuery, state: FSMContext, master: dict | None):
+    apt_id = int(callback.data.split(":")[1])
+    db = await read_db()
+    apt = await repo.get_appointment_by_id(db, apt_id)
+    if not apt or not _require_master(master) or apt["master_id"] != master["id"]:
+        await callback.answer("Запись не найдена.", show_alert=True)
+        return
+    duration = await repo.get_effective_duration(db, apt["master_id"], apt["service_id"])
+    now = datetime.now(pytz.timezone(settings.TIMEZONE)).replace(tzinfo=None)
+    slots = await find_next_free_slots(apt["master_id"], duration, now, exclude_apt_id=apt_id)
+    if not slots:
+        await callback.answer("Свободного времени нет.", show_alert=True)
+        return
+    await state.set_state(MasterStates.reschedule_time)
+    await callback.message.edit_text(
+        f"🔁 Перенос записи #{apt_id}\n\n⚡ Ближайшее свободное время:",
+        reply_markup=reschedule_next_slots_kb(apt_id, slots),
+    )
+    await callback.answer()
+
+
 @router.callback_query(MasterStates.reschedule_time, F.data.startswith("ma_rslot:"))
 async def reschedule_slot_chosen(callback: CallbackQuery, state: FSMContext, master: dict | None):
     # ma_rslot:{apt_id}:{YYYYMMDD}:{HHMM}
@@ -316,7 +343,7 @@ async def reschedule_slot_chosen(callback: CallbackQuery, state: FSMContext, mas
     date_str = f"{raw_date[:4]}-{raw_date[4:6]}-{raw_date[6:]}"
     time_str = f"{raw_time[:2]}:{raw_time[2:]}"
 
-    db = await get_db()
+    db = await read_db()
     apt = await repo.get_appointment_by_id(db, apt_id)
     duration = await repo.get_effective_duration(db, apt["master_id"], apt["service_id"])
     end_time = m2t(t2m(time_str) + duration)
@@ -332,6 +359,9 @@ async def reschedule_slot_chosen(callback: CallbackQuery, state: FSMContext, mas
 
 @router.callback_query(F.data.startswith("ma_rsconf:"))
 async def reschedule_confirm(callback: CallbackQuery, state: FSMContext, master: dict | None):
+    if not _require_master(master):
+        await callback.answer("⛔ Нет доступа.", show_alert=True)
+        return
     # ma_rsconf:{apt_id}:{YYYYMMDD}:{HHMM}
     parts = callback.data.split(":")
     apt_id = int(parts[1])
@@ -340,20 +370,27 @@ async def reschedule_confirm(callback: CallbackQuery, state: FSMContext, master:
     date_str = f"{raw_date[:4]}-{raw_date[4:6]}-{raw_date[6:]}"
     time_str = f"{raw_time[:2]}:{raw_time[2:]}"
 
-    db = await get_db()
+    db = await read_db()
     apt = await repo.get_appointment_by_id(db, apt_id)
+    if not apt or apt["master_id"] != master["id"]:
+        await callback.answer(TRANSITION_ERRORS["not_found"], show_alert=True)
+        return
     duration = await repo.get_effective_duration(db, apt["master_id"], apt["service_id"])
     end_time = m2t(t2m(time_str) + duration)
 
-    await repo.offer_reschedule(db, apt_id, date_str, time_str, end_time)
-    apt_updated = await repo.get_appointment_by_id(db, apt_id)
+    apt, result = await appointment_states.apply(
+        await get_db(), "offer_reschedule", apt_id, master_id=master["id"],
+        date=date_str, start=time_str, end=end_time,
+    )
+    if not apt:
+        await callback.answer(TRANSITION_ERRORS[result], show_alert=True)
+        return
     await state.clear()
     await callback.message.edit_text(
         f"🔁 Перенос предложен клиенту.\n"
         f"📅 {fmt_date(date_str)}  🕐 {time_str}–{end_time}",
     )
-    if apt_updated:
-        await notify_reschedule_offer(apt_updated)
+    await notify_reschedule_offer(apt)
 
 
 # ─────────────────── MY BLOCKS ────────────────────────────────
@@ -363,7 +400,7 @@ async def my_blocks(callback: CallbackQuery, master: dict | None):
     if not _require_master(master):
         await callback.answer("⛔ Нет доступа.", show_alert=True)
         return
-    db = await get_db()
+    db = await read_db()
     blocks = await repo.get_all_blocks(db, master_id=master["id"])
     await callback.message.edit_text(
         "🧱 Ваши блокировки (нажмите для удаления):",
@@ -388,8 +425,7 @@ async def block_date_entered(message: Message, state: FSMContext):
     if not validate_date(message.text or ""):
         await message.answer("❗ Введите дату в формате ГГГГ-ММ-ДД.")
         return
-    await state.update_data(block_date=message.text.strip())
-    await state.set_state(MasterStates.block_start)
+    await transition(state, MasterStates.block_start, block_date=message.text.strip())
     await message.answer("🕐 Введите время начала (ЧЧ:ММ):")
 
 
@@ -398,8 +434,7 @@ async def block_start_entered(message: Message, state: FSMContext):
     if not validate_time(message.text or ""):
         await message.answer("❗ Введите время в формате ЧЧ:ММ.")
         return
-    await state.update_data(block_start=message.text.strip())
-    await state.set_state(MasterStates.block_end)
+    await transition(state, MasterStates.block_end, block_start=message.text.strip())
     await message.answer("🕐 Введите время окончания (ЧЧ:ММ):")
 
 
@@ -408,8 +443,7 @@ async def block_end_entered(message: Message, state: FSMContext):
     if not validate_time(message.text or ""):
         await message.answer("❗ Введите время в формате ЧЧ:ММ.")
         return
-    await state.update_data(block_end=message.text.strip())
-    await state.set_state(MasterStates.block_reason)
+    await transition(state, MasterStates.block_reason, block_end=message.text.strip())
     await message.answer("📝 Укажите причину (или нажмите /skip):")
 
 
@@ -453,7 +487,7 @@ async def my_schedule(callback: CallbackQuery, master: dict | None):
     if not _require_master(master):
         await callback.answer("⛔ Нет доступа.", show_alert=True)
         return
-    db = await get_db()
+    db = await read_db()
     allow = bool(master["allow_personal_schedule"])
     rules = await repo.get_all_master_work_rules(db, master["id"]) if allow else []
     await callback.message.edit_text(
@@ -469,8 +503,7 @@ async def edit_schedule_day(callback: CallbackQuery, state: FSMContext, master:
         await callback.answer("⛔ Нет доступа.", show_alert=True)
         return
     weekday = int(callback.data.split(":")[1])
-    await state.update_data(sched_weekday=weekday)
-    await state.set_state(MasterStates.sched_start)
+    await transition(state, MasterStates.sched_start, sched_weekday=weekday)
     from utils.formatting import WEEKDAY_RU
     await callback.message.edit_text(
         f"📅 {WEEKDAY_RU[weekday]}\n\n🕐 Введите время начала (ЧЧ:ММ) или /dayoff для выходного:"
@@ -489,8 +522,7 @@ async def sched_start_entered(message: Message, state: FSMContext, master: dict
     if not validate_time(message.text or ""):
         await message.answer("❗ Введите время в формате ЧЧ:ММ или /dayoff.")
         return
-    await state.update_data(sched_start=message.text.strip())
-    await state.set_state(MasterStates.sched_end)
+    await transition(state, MasterStates.sched_end, sched_start=message.text.strip())
     await message.answer("🕐 Введите время окончания (ЧЧ:ММ):")
 
 
@@ -499,8 +531,7 @@ async def sched_end_entered(message: Message, state: FSMContext):
     if not validate_time(message.text or ""):
         await message.answer("❗ Введите время в формате ЧЧ:ММ.")
         return
-    await state.update_data(sched_end=message.text.strip())
-    await state.set_state(MasterStates.sched_step)
+    await transition(state, MasterStates.sched_step, sched_end=message.text.strip())
     await message.answer("⏱️ Введите шаг слотов в минутах (например, 30):")
 
 
@@ -525,6 +556,47 @@ async def sched_step_entered(message: Message, state: FSMContext, master: dict |
     )
 
 
+@router.callback_query(F.data == "ma_week")
+async def edit_schedule_week(callback: CallbackQuery, state: FSMContext, master: dict | None):
+    if not _require_master(master) or not master["allow_personal_schedule"]:
+        await callback.answer("⛔ Нет доступа.", show_alert=True)
+        return
+    db = await read_db()
+    current = format_week(
+        await repo.get_all_master_work_rules(db, master["id"]),
+        await repo.get_all_master_breaks(db, master["id"]),
+        personal=True,
+    )
+    await state.set_state(MasterStates.sched_week)
+    await callback.message.edit_text(
+        f"📝 Сейчас:\n<code>{html.escape(current)}</code>\n\n"
+        "Отправьте неделю одним сообщением, например:\n"
+        "<code>Пн-Пт 09:00-19:00/30; перерыв 13:00-14:00\nСб 10:00-16:00\nВс салон</code>\n\n"
+        "/30 — шаг слотов (по умолчанию 30 мин). Дни, которых нет в тексте или "
+        "с пометкой «салон», идут по расписанию салона; день без «перерыв» — "
+        "с перерывами салона.",
+        parse_mode="HTML",
+    )
+    await callback.answer()
+
+
+@router.message(MasterStates.sched_week)
+async def sched_week_entered(message: Message, state: FSMContext, master: dict | None):
+    try:
+        week = parse_week(message.text or "", personal=True)
+    except ValueError as exc:
+        await message.answer(f"❗ {exc}")
+        return
+    db = await get_db()
+    if not await repo.replace_week_schedule(db, week, [master["id"]]):
+        await message.answer("❗ Не удалось сохранить расписание, попробуйте ещё раз.")
+        return
+    await state.clear()
+    await message.answer(
+        f"✅ Неделя сохранена: дней с личными часами {len(week)}.", reply_markup=master_menu_kb()
+    )
+
+
 # ─────────────────── IGNORE ───────────────────────────────────
 
 @router.callback_query(F.data == "ma_ignore")
@@ -107,10 +107,23 @@ def schedule_kb(rules: list[dict]) -> InlineKeyboardMarkup:
             label = f"{WEEKDAY_SHORT[wd]}: выходной"
         rows.append([InlineKeyboardButton(text=label, callback_data=f"ad_sched_wd:{wd}")])
     rows.append([InlineKeyboardButton(text="🍽️ Перерывы", callback_data="ad_breaks_list")])
+    rows.append([InlineKeyboardButton(text="📝 Неделя текстом", callback_data="ad_week")])
     rows.append([InlineKeyboardButton(text="🔙 В меню", callback_data="ad_menu:back")])
     return InlineKeyboardMarkup(inline_keyboard=rows)
 
 
+def week_targets_kb(masters: list[dict]) -> InlineKeyboardMarkup:
+    rows = [
+        [InlineKeyboardButton(text="🏢 Салон", callback_data="ad_week_t:salon")],
+        [InlineKeyboardButton(text="👥 Все мастера с личным расписанием", callback_data="ad_week_t:all")],
+    ]
+    rows += [[InlineKeyboardButton(
+        text=m["display_name"], callback_data=f"ad_week_t:{m['id']}"
+    )] for m in masters]
+    rows.append([InlineKeyboardButton(text="🔙 Назад", callback_data="ad_sched_back")])
+    return InlineKeyboardMarkup(inline_keyboard=rows)
+
+
 def breaks_list_kb(breaks: list[dict]) -> InlineKeyboardMarkup:
     rows = []
     for b in breaks:
@@ -179,7 +192,7 @@ def appointments_filter_kb() -> InlineKeyboardMarkup:
     ])
 
 
-def appointments_list_kb(appointments: list[dict]) -> InlineKeyboardMarkup:
+def appointments_list_kb(appointments: list[dict], nav: list | None = None) -> InlineKeyboardMarkup:
     from utils.formatting import fmt_date, STATUS_LABELS
     rows = []
     for apt in appointments:
@@ -192,6 +205,8 @@ def appointments_list_kb(appointments: list[dict]) -> InlineKeyboardMarkup:
         rows.append([InlineKeyboardButton(text=label, callback_data=f"ad_apt:{apt['id']}")])
     if not rows:
         rows.append([InlineKeyboardButton(text="Записей нет", callback_data="ad_ignore")])
+    if nav:
+        rows.append(nav)
     return InlineKeyboardMarkup(inline_keyboard=rows)
 
 
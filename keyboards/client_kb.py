@@ -27,7 +27,7 @@ def services_kb(services: list[dict]) -> InlineKeyboardMarkup:
 
 
 def masters_kb(masters: list[dict]) -> InlineKeyboardMarkup:
-    rows = []
+    rows = [[InlineKeyboardButton(text="⚡ Любой мастер — ближайшее время", callback_data="cl_mst:any")]]
     for m in masters:
         price = m.get("eff_price") or ""
         dur = m.get("eff_duration") or ""
@@ -41,6 +41,31 @@ def masters_kb(masters: list[dict]) -> InlineKeyboardMarkup:
     return InlineKeyboardMarkup(inline_keyboard=rows)
 
 
+def any_master_slots_kb(slots: list[dict]) -> InlineKeyboardMarkup:
+    from utils.formatting import fmt_date
+    rows = []
+    for s in slots:
+        compact = s["date"].replace("-", "") + ":" + s["time"].replace(":", "")
+        rows.append([InlineKeyboardButton(
+            text=f"{fmt_date(s['date'])} {s['time']} — {s['master_name']}",
+            callback_data=f"cl_any:{s['master_id']}:{compact}",
+        )])
+    rows.append([InlineKeyboardButton(text="🔙 Назад", callback_data="cl_back_mst")])
+    return InlineKeyboardMarkup(inline_keyboard=rows)
+
+
+def next_slots_kb(slots: list[tuple[str, str]]) -> InlineKeyboardMarkup:
+    from utils.formatting import fmt_date
+    rows = []
+    for date_str, slot in slots:
+        compact = date_str.replace("-", "") + ":" + slot.replace(":", "")
+        rows.append([InlineKeyboardButton(
+            text=f"{fmt_date(date_str)} {slot}", callback_data=f"cl_slot:{compact}"
+        )])
+    rows.append([InlineKeyboardButton(text="🔙 Назад", callback_data="cl_back_date")])
+    return InlineKeyboardMarkup(inline_keyboard=rows)
+
+
 def slots_kb(date_str: str, slots: list[str]) -> InlineKeyboardMarkup:
     rows = []
     row = []
@@ -63,7 +88,7 @@ def confirm_booking_kb() -> InlineKeyboardMarkup:
     ]])
 
 
-def my_appointments_kb(appointments: list[dict]) -> InlineKeyboardMarkup:
+def my_appointments_kb(appointments: list[dict], nav: list | None = None) -> InlineKeyboardMarkup:
     from utils.formatting import fmt_date, STATUS_LABELS
     rows = []
     for apt in appointments:
@@ -75,6 +100,8 @@ def my_appointments_kb(appointments: list[dict]) -> InlineKeyboardMarkup:
         rows.append([InlineKeyboardButton(text=label, callback_data=f"cl_apt:{apt['id']}")])
     if not rows:
         rows.append([InlineKeyboardButton(text="Нет записей", callback_data="cl_ignore")])
+    if nav:
+        rows.append(nav)
     return InlineKeyboardMarkup(inline_keyboard=rows)
 
 
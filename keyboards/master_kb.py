@@ -19,7 +19,7 @@ def master_menu_kb() -> InlineKeyboardMarkup:
     ])
 
 
-def appointments_list_kb(appointments: list[dict]) -> InlineKeyboardMarkup:
+def appointments_list_kb(appointments: list[dict], nav: list | None = None) -> InlineKeyboardMarkup:
     from utils.formatting import fmt_date, STATUS_LABELS
     rows = []
     for apt in appointments:
@@ -31,6 +31,38 @@ def appointments_list_kb(appointments: list[dict]) -> InlineKeyboardMarkup:
         rows.append([InlineKeyboardButton(text=label, callback_data=f"ma_apt:{apt['id']}")])
     if not rows:
         rows.append([InlineKeyboardButton(text="Записей нет", callback_data="ma_ignore")])
+    if nav:
+        rows.append(nav)
+    rows.append([InlineKeyboardButton(text="🔙 В меню", callback_data="ma_menu:back")])
+    return InlineKeyboardMarkup(inline_keyboard=rows)
+
+
+AGENDA_WEEKS = (1, 2, 4)
+
+
+def agenda_kb(appointments: list[dict], weeks: int, nav: list | None = None) -> InlineKeyboardMarkup:
+    """Appointments grouped under a header button per day, plus a 1/2/4-week switch."""
+    from itertools import groupby
+    from utils.formatting import fmt_date, STATUS_LABELS
+    rows = []
+    for day, apts in groupby(appointments, key=lambda a: a["date"]):
+        rows.append([InlineKeyboardButton(text=f"— {fmt_date(day)} —", callback_data="ma_ignore")])
+        for apt in apts:
+            label = (
+                f"{apt['start_time']} — {apt.get('service_title','?')} "
+                f"[{STATUS_LABELS.get(apt['status'], apt['status'])}]"
+            )
+            rows.append([InlineKeyboardButton(text=label, callback_data=f"ma_apt:{apt['id']}")])
+    if not rows:
+        rows.append([InlineKeyboardButton(text="Записей нет", callback_data="ma_ignore")])
+    if nav:
+        rows.append(nav)
+    rows.append([
+        InlineKeyboardButton(text=f"• {w} нед. •", callback_data="ma_ignore")
+        if w == weeks else
+        InlineKeyboardButton(text=f"{w} нед.", callback_data=f"ma_agenda:{w}")
+        for w in AGENDA_WEEKS
+    ])
     rows.append([InlineKeyboardButton(text="🔙 В меню", callback_data="ma_menu:back")])
     return InlineKeyboardMarkup(inline_keyboard=rows)
 
@@ -80,6 +112,7 @@ def master_schedule_kb(rules: list[dict], allow_personal: bool) -> InlineKeyboar
         else:
             label = f"{WEEKDAY_SHORT[wd]}: выходной"
         rows.append([InlineKeyboardButton(text=label, callback_data=f"ma_sched:{wd}")])
+    rows.append([InlineKeyboardButton(text="📝 Неделя текстом", callback_data="ma_week")])
     rows.append([InlineKeyboardButton(text="🔙 В меню", callback_data="ma_menu:back")])
     return InlineKeyboardMarkup(inline_keyboard=rows)
 
@@ -93,3 +126,15 @@ def reschedule_slot_confirm_kb(apt_id: int, date_str: str, time_str: str) -> Inl
         ),
         InlineKeyboardButton(text="❌ Отмена", callback_data=f"ma_apt:{apt_id}"),
     ]])
+
+
+def reschedule_next_slots_kb(apt_id: int, slots: list[tuple[str, str]]) -> InlineKeyboardMarkup:
+    from utils.formatting import fmt_date
+    rows = []
+    for date_str, slot in slots:
+        compact = date_str.replace("-", "") + ":" + slot.replace(":", "")
+        rows.append([InlineKeyboardButton(
+            text=f"{fmt_date(date_str)} {slot}", callback_data=f"ma_rslot:{apt_id}:{compact}"
+        )])
+    rows.append([InlineKeyboardButton(text="🔙 Отмена", callback_data=f"ma_apt:{apt_id}")])
+    return InlineKeyboardMarkup(inline_keyboard=rows)
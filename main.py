@@ -14,6 +14,7 @@ from db.database import init_db, close_db
 from storage.sqlite_storage import SqliteStorage
 from middlewares.auth import AuthMiddleware
 from services import notifications
+from services.archive import archive_forever
 from handlers import common, client, master, admin
 
 
@@ -50,11 +51,27 @@ async def main() -> None:
     dp.include_router(master.router)
     dp.include_router(admin.router)
 
+    # ── Background jobs ──────────────────────────────────────
+    jobs = [
+        asyncio.create_task(storage.gc_forever()),
+        asyncio.create_task(archive_forever()),
+    ]
+
+    async def stop_jobs() -> None:
+        # Wait for a running batch to unwind so nothing touches the DB after close_db()
+        for job in jobs:
+            job.cancel()
+        await asyncio.gather(*jobs, return_exceptions=True)
+
+    # The dispatcher flushes the FSM storage (storage.close) on shutdown itself
+    dp.shutdown.register(stop_jobs)
+
     # ── Start polling ────────────────────────────────────────
     log.info("Bot started. Press Ctrl+C to stop.")
     try:
         await dp.start_polling(bot, allowed_updates=["message", "callback_query"])
     finally:
+        await stop_jobs()  # no-op after a normal shutdown
         await close_db()
         await bot.session.close()
         log.info("Bot stopped.")
@@ -1,6 +1,7 @@
 """
 Middleware that:
- 1. Registers / refreshes the user in the DB on every update.
+ 1. Registers / refreshes the user in the DB (through the identity cache,
+    so unchanged profiles cost no queries).
  2. Injects `user`, `is_admin`, `master` into handler data.
 """
 from __future__ import annotations
@@ -10,8 +11,7 @@ from aiogram import BaseMiddleware
 from aiogram.types import TelegramObject, Update
 
 from config import settings
-from db.database import get_db
-from db import repositories as repo
+from services.identity_cache import identity_cache
 
 
 class AuthMiddleware(BaseMiddleware):
@@ -31,14 +31,11 @@ class AuthMiddleware(BaseMiddleware):
                 from_user = event.callback_query.from_user
 
         if from_user:
-            db = await get_db()
-            user = await repo.get_or_create_user(
-                db,
+            user, master = await identity_cache.resolve(
                 from_user.id,
                 from_user.username,
                 from_user.full_name,
             )
-            master = await repo.get_master_by_tg_id(db, from_user.id)
             data["user"] = user
             data["is_admin"] = from_user.id in settings.admin_ids
             data["master"] = master  # None if not a master
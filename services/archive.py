@@ -0,0 +1,48 @@
+"""
+Moves finished appointments out of the hot `appointments` table.
+
+Rows dated more than ARCHIVE_AFTER_DAYS ago go to `appointments_archive`
+in ARCHIVE_BATCH-row transactions, so the writer is never held for long and
+the hot table stays proportional to current bookings.
+"""
+from __future__ import annotations
+import asyncio
+import logging
+from datetime import datetime, timedelta
+
+import pytz
+
+from config import settings
+
+log = logging.getLogger(__name__)
+
+
+async def archive_old_appointments(
+    after_days: int = settings.ARCHIVE_AFTER_DAYS,
+    batch_size: int = settings.ARCHIVE_BATCH,
+) -> int:
+    """Archive everything older than `after_days`; returns the number of rows moved."""
+    from db import repositories as repo
+    from db.database import write_db
+
+    today = datetime.now(pytz.timezone(settings.TIMEZONE)).date()
+    before = (today - timedelta(days=after_days)).isoformat()
+    db = await write_db()
+    total = 0
+    while True:
+        moved = await repo.archive_appointments(db, before, batch_size)
+        total += moved
+        if moved < batch_size:
+            return total
+        await asyncio.sleep(0)  # let handlers in between batches
+
+
+async def archive_forever(interval_sec: float = settings.ARCHIVE_INTERVAL_SEC) -> None:
+    while True:
+        try:
+            moved = await archive_old_appointments()
+            if moved:
+                log.info("Archived %d appointments", moved)
+        except Exception:
+            log.exception("Appointment archiving failed")
+        await asyncio.sleep(interval_sec)
@@ -0,0 +1,80 @@
+"""
+In-process cache of free start minutes per (master, date, duration).
+
+Entries hold the slot engine's result *before* the "today" cutoff, so the
+cutoff is still applied on every read.  Repository change events drop
+exactly the entries a mutation can affect: an appointment or a personal
+block only touches one master's day, a global block touches one date for
+every master, and schedule changes drop a master (or everything).
+The least recently used entries are evicted beyond AVAILABILITY_CACHE_SIZE.
+"""
+from __future__ import annotations
+from collections import OrderedDict, defaultdict
+
+from config import settings
+from db import events
+
+# (master_id, date, duration, exclude_apt_id)
+Key = tuple[int, str, int, int | None]
+
+
+class AvailabilityCache:
+    def __init__(self, max_size: int):
+        self._max_size = max_size
+        self._entries: OrderedDict[Key, tuple[int, ...]] = OrderedDict()
+        self._days: dict[tuple[int, str], set[Key]] = defaultdict(set)
+        # Bumped on every invalidation; a result computed from data read
+        # before the bump must not be stored
+        self.generation = 0
+        events.subscribe(events.APPOINTMENTS, self._on_day_changed)
+        events.subscribe(events.BLOCKS, self._on_day_changed)
+        events.subscribe(events.SCHEDULE, self._on_master_changed)
+        events.subscribe(events.MASTERS, self._on_master_changed)
+
+    def get(self, key: Key) -> tuple[int, ...] | None:
+        starts = self._entries.get(key)
+        if starts is not None:
+            self._entries.move_to_end(key)
+        return starts
+
+    def put(self, key: Key, starts: tuple[int, ...], generation: int) -> None:
+        if generation != self.generation:
+            return
+        self._entries[key] = starts
+        self._entries.move_to_end(key)
+        self._days[key[:2]].add(key)
+        while len(self._entries) > self._max_size:
+            self._discard(next(iter(self._entries)))
+
+    def _discard(self, key: Key) -> None:
+        self._entries.pop(key, None)
+        day = self._days.get(key[:2])
+        if day is not None:
+            day.discard(key)
+            if not day:
+                del self._days[key[:2]]
+
+    def _drop(self, match) -> None:
+        self.generation += 1
+        for day in [d for d in self._days if match(*d)]:
+            for key in list(self._days[day]):
+                self._discard(key)
+
+    def _on_day_changed(self, master_id: int | None, date: str, **_) -> None:
+        if master_id is None:
+            self._drop(lambda m, d: d == date)
+        else:
+            self.generation += 1
+            for key in list(self._days.get((master_id, date), ())):
+                self._discard(key)
+
+    def _on_master_changed(self, master_id: int | None = None, **_) -> None:
+        if master_id is None:
+            self.generation += 1
+            self._entries.clear()
+            self._days.clear()
+        else:
+            self._drop(lambda m, d: m == master_id)
+
+
+availability_cache = AvailabilityCache(settings.AVAILABILITY_CACHE_SIZE)
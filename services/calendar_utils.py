@@ -18,20 +18,28 @@ MONTHS_RU = {
 }
 
 
+def booking_window() -> tuple[date, date]:
+    """First and last day that can be booked."""
+    today = date.today()
+    return today, today + timedelta(days=30)
+
+
 def build_calendar(
     year: int,
     month: int,
     prefix: str = "cal",
     extra: str = "",
+    availability: dict[str, bool] | None = None,
 ) -> InlineKeyboardMarkup:
     """
-    prefix  – callback prefix, e.g. 'cal' or 'mres'
-    extra   – appended as last part of callback (e.g. appointment id)
+    prefix       – callback prefix, e.g. 'cal' or 'mres'
+    extra        – appended as last part of callback (e.g. appointment id)
+    availability – optional {YYYY-MM-DD: has_free_slots}; days without free
+                   slots are shown as ✖ and are not clickable
     Callback format:  {prefix}:{action}:{year}:{month}:{day}[:{extra}]
     """
     tz = pytz.timezone(settings.TIMEZONE)
-    today = date.today()
-    max_date = today + timedelta(days=30)
+    today, max_date = booking_window()
 
     def cb(action: str, y: int = 0, m: int = 0, d: int = 0) -> str:
         base = f"{prefix}:{action}:{y}:{m}:{d}"
@@ -62,6 +70,8 @@ def build_calendar(
                 d = date(year, month, day)
                 if d < today or d > max_date:
                     row.append(InlineKeyboardButton(text="·", callback_data=cb("ignore")))
+                elif availability is not None and not availability.get(d.isoformat(), True):
+                    row.append(InlineKeyboardButton(text="✖", callback_data=cb("ignore")))
                 else:
                     row.append(
                         InlineKeyboardButton(
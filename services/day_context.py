@@ -0,0 +1,86 @@
+"""
+Schedule inputs for the slot engine, loaded in two round trips.
+
+`load_day_contexts` returns one immutable `DayContext` per date of a range
+(None for a day off), with every time in minutes from midnight as stored
+in the integer start_min / end_min columns.
+"""
+from __future__ import annotations
+from collections import defaultdict
+from dataclasses import dataclass
+from datetime import date, timedelta
+
+Interval = tuple[int, int]
+
+
+@dataclass(frozen=True)
+class DayContext:
+    date: str
+    work_start: int
+    work_end: int
+    step: int
+    breaks: tuple[Interval, ...]
+    blocks: tuple[Interval, ...]
+    appointments: tuple[tuple[int, int, int], ...]   # (apt_id, start, end)
+
+
+def _interval(row: dict) -> Interval:
+    return row["start_min"], row["end_min"]
+
+
+async def load_day_contexts(
+    master_id: int, date_from: str, date_to: str
+) -> dict[str, DayContext | None]:
+    """Day contexts for every date in [date_from, date_to]."""
+    from db import repositories as repo
+    from db.database import read_db
+
+    db = await read_db()
+    schedule = await repo.get_schedule_rows(db, master_id)
+    master = next((r for r in schedule if r["kind"] == "master"), None)
+    d0, d1 = date.fromisoformat(date_from), date.fromisoformat(date_to)
+    dates = [(d0 + timedelta(days=i)) for i in range((d1 - d0).days + 1)]
+    if master is None:
+        return {d.isoformat(): None for d in dates}
+    personal = bool(master["step"])
+
+    rules: dict[str, dict[int, dict]] = defaultdict(dict)
+    breaks: dict[str, dict[int, list[Interval]]] = defaultdict(lambda: defaultdict(list))
+    for r in schedule:
+        if r["kind"] in ("rule", "master_rule"):
+            rules[r["kind"]][r["weekday"]] = r
+        elif r["kind"] in ("break", "master_break"):
+            breaks[r["kind"]][r["weekday"]].append(_interval(r))
+
+    busy = await repo.get_busy_rows(db, master_id, date_from, date_to)
+    blocks: dict[str, list[Interval]] = defaultdict(list)
+    apts: dict[str, list[tuple[int, int, int]]] = defaultdict(list)
+    for r in busy:
+        if r["kind"] == "block":
+            blocks[r["date"]].append(_interval(r))
+        else:
+            apts[r["date"]].append((r["id"], *_interval(r)))
+
+    result: dict[str, DayContext | None] = {}
+    for d in dates:
+        ds, wd = d.isoformat(), d.weekday()
+        # Personal rule/breaks win when allowed and present, as before
+        rule = (personal and rules["master_rule"].get(wd)) or rules["rule"].get(wd)
+        if not rule:
+            result[ds] = None  # day off
+            continue
+        day_breaks = (personal and breaks["master_break"].get(wd)) or breaks["break"].get(wd, [])
+        result[ds] = DayContext(
+            date=ds,
+            work_start=rule["start_min"],
+            work_end=rule["end_min"],
+            step=rule["step"],
+            breaks=tuple(sorted(day_breaks)),
+            blocks=tuple(sorted(blocks[ds])),
+            appointments=tuple(sorted(apts[ds], key=lambda a: a[1])),
+        )
+    return result
+
+
+async def load_day_context(master_id: int, date_str: str) -> DayContext | None:
+    return (await load_day_contexts(master_id, date_str, date_str))[date_str]
@@ -0,0 +1,73 @@
+"""
+Streaming CSV export of appointments.
+
+Rows come from one reader cursor in EXPORT_BATCH-row batches and each batch
+is written to a file on disk from a worker thread, so the event loop only
+ever holds one batch and never formats or writes CSV itself.  The caller
+uploads the file from disk and removes it afterwards.
+"""
+from __future__ import annotations
+import asyncio
+import csv
+import os
+import tempfile
+from typing import Awaitable, Callable
+
+from config import settings
+
+HEADER = ["ID", "Дата", "Начало", "Конец", "Клиент", "Телефон", "Мастер", "Услуга", "Статус", "Создано"]
+
+
+def _csv_row(apt: dict) -> list:
+    return [
+        apt["id"], apt["date"], apt["start_time"], apt["end_time"],
+        apt.get("client_name") or apt.get("client_full_name", ""),
+        apt.get("client_phone") or apt.get("client_phone_u", ""),
+        apt.get("master_display_name", ""),
+        apt.get("service_title", ""),
+        apt["status"],
+        apt.get("created_at", ""),
+    ]
+
+
+def _open_temp() -> tuple[str, object]:
+    fd, path = tempfile.mkstemp(prefix="appointments-", suffix=".csv")
+    # utf-8-sig: Excel needs the BOM to detect UTF-8
+    return path, open(fd, "w", newline="", encoding="utf-8-sig")
+
+
+async def export_appointments_csv(
+    date_from: str | None = None,
+    date_to: str | None = None,
+    master_id: int | None = None,
+    status: str | None = None,
+    on_progress: Callable[[int], Awaitable[None]] | None = None,
+) -> tuple[str, int]:
+    """
+    Write matching appointments (archive included) to a temporary CSV file.
+    Returns (path, row_count); the caller must delete the file.
+    `on_progress(rows_so_far)` is awaited after every batch.
+    """
+    from db import repositories as repo
+    from db.database import read_db
+
+    path, f = await asyncio.to_thread(_open_temp)
+    total = 0
+    try:
+        writer = csv.writer(f)
+        await asyncio.to_thread(writer.writerow, HEADER)
+        db = await read_db()
+        async for batch in repo.iter_appointments(
+            db, date_from, date_to, master_id, status,
+            include_archive=True, batch_size=settings.EXPORT_BATCH,
+        ):
+            await asyncio.to_thread(writer.writerows, [_csv_row(a) for a in batch])
+            total += len(batch)
+            if on_progress:
+                await on_progress(total)
+    except BaseException:
+        await asyncio.to_thread(f.close)
+        await asyncio.to_thread(os.unlink, path)
+        raise
+    await asyncio.to_thread(f.close)
+    return path, total
@@ -0,0 +1,81 @@
+"""
+In-process cache of user / master identities for AuthMiddleware.
+
+A cached profile is only written back when the Telegram username or full
+name actually changed, and the master check is a set lookup of master
+tg_ids instead of a JOIN per update.  Entries expire after
+USER_CACHE_TTL_SEC and the least recently used ones are evicted beyond
+USER_CACHE_SIZE.  Repository change events keep the cache coherent.
+"""
+from __future__ import annotations
+import time
+from collections import OrderedDict
+from dataclasses import dataclass
+
+from config import settings
+from db import events
+from db import repositories as repo
+from db.database import get_db, read_db
+
+
+@dataclass
+class _Entry:
+    user: dict
+    master: dict | None
+    loaded_at: float
+
+
+class IdentityCache:
+    def __init__(self, ttl_sec: int, max_size: int):
+        self._ttl = ttl_sec
+        self._max_size = max_size
+        self._entries: OrderedDict[int, _Entry] = OrderedDict()   # tg_id → entry
+        self._master_tg_ids: set[int] | None = None
+        events.subscribe(events.USERS, self._on_user_changed)
+        events.subscribe(events.MASTERS, self._on_masters_changed)
+
+    async def resolve(
+        self, tg_id: int, username: str | None, full_name: str | None
+    ) -> tuple[dict, dict | None]:
+        """Return (user, master_or_None) for a Telegram user."""
+        entry = self._entries.get(tg_id)
+        if entry is not None and time.monotonic() - entry.loaded_at > self._ttl:
+            del self._entries[tg_id]
+            entry = None
+
+        if entry is None:
+            db = await get_db()
+            user = await repo.get_or_create_user(db, tg_id, username, full_name)
+            master = await self._load_master(tg_id)
+            entry = _Entry(user, master, time.monotonic())
+        elif (entry.user["username"], entry.user["full_name"]) != (username, full_name):
+            db = await get_db()
+            await repo.update_user_profile(db, entry.user["id"], username, full_name)
+            entry.user = {**entry.user, "username": username, "full_name": full_name}
+
+        self._entries[tg_id] = entry
+        self._entries.move_to_end(tg_id)
+        while len(self._entries) > self._max_size:
+            self._entries.popitem(last=False)
+        return entry.user, entry.master
+
+    async def _load_master(self, tg_id: int) -> dict | None:
+        db = await read_db()
+        if self._master_tg_ids is None:
+            self._master_tg_ids = await repo.get_master_tg_ids(db)
+        if tg_id not in self._master_tg_ids:
+            return None
+        return await repo.get_master_by_tg_id(db, tg_id)
+
+    def _on_user_changed(self, user_id: int, **_) -> None:
+        for tg_id, entry in list(self._entries.items()):
+            if entry.user["id"] == user_id:
+                del self._entries[tg_id]
+
+    def _on_masters_changed(self, **_) -> None:
+        # Masters change rarely; start over instead of patching entries
+        self._master_tg_ids = None
+        self._entries.clear()
+
+
+identity_cache = IdentityCache(settings.USER_CACHE_TTL_SEC, settings.USER_CACHE_SIZE)
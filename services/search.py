@@ -0,0 +1,110 @@
+"""
+Earliest free slot search across the booking window.
+
+Days are scanned forward in chunks through `get_free_starts`, so every
+chunk is one range load (or a cache hit) and the scan stops as soon as
+enough starts are found.  The "any master" search runs one scan per
+master concurrently and merges the per-master results by time.
+"""
+from __future__ import annotations
+import asyncio
+import heapq
+from datetime import date, datetime, timedelta
+
+from services.slots import apply_cutoff, get_free_starts, m2t
+
+_CHUNK_DAYS = 7
+
+
+async def _earliest_starts(
+    master_id: int,
+    duration: int,
+    date_from: date,
+    date_to: date,
+    limit: int,
+    exclude_apt_id: int | None = None,
+    min_start: int = 0,
+    holder_id: int | None = None,
+) -> list[tuple[str, int]]:
+    """
+    Up to `limit` (date, start minute) pairs in [date_from, date_to], in order.
+    On `date_from` itself only starts at or after `min_start` count.
+    """
+    found: list[tuple[str, int]] = []
+    first_ds = date_from.isoformat()
+    lo = date_from
+    while lo <= date_to and len(found) < limit:
+        hi = min(lo + timedelta(days=_CHUNK_DAYS - 1), date_to)
+        days = await get_free_starts(
+            master_id, duration, lo.isoformat(), hi.isoformat(), exclude_apt_id, holder_id
+        )
+        for ds, starts in days.items():
+            found.extend(
+                (ds, t) for t in apply_cutoff(ds, list(starts))
+                if ds != first_ds or t >= min_start
+            )
+            if len(found) >= limit:
+                break
+        lo = hi + timedelta(days=1)
+    return found[:limit]
+
+
+async def find_next_free_slots(
+    master_id: int,
+    duration: int,
+    from_datetime: datetime,
+    limit: int = 8,
+    exclude_apt_id: int | None = None,
+    holder_id: int | None = None,
+) -> list[tuple[str, str]]:
+    """
+    The first `limit` free (YYYY-MM-DD, HH:MM) starts at or after
+    `from_datetime`, up to the end of the booking window.
+    """
+    from services.calendar_utils import booking_window
+
+    first, last = booking_window()
+    day = max(from_datetime.date(), first)
+    min_start = from_datetime.hour * 60 + from_datetime.minute if day == from_datetime.date() else 0
+    starts = await _earliest_starts(
+        master_id, duration, day, last, limit, exclude_apt_id, min_start, holder_id
+    )
+    return [(ds, m2t(t)) for ds, t in starts]
+
+
+async def find_earliest_any_master(
+    service_id: int, limit: int = 8, holder_id: int | None = None
+) -> list[dict]:
+    """
+    Earliest free starts for `service_id` over every master offering it.
+
+    Returns up to `limit` dicts {master_id, master_name, duration, date, time},
+    ordered by date and time.
+    """
+    from db import repositories as repo
+    from db.database import read_db
+    from services.calendar_utils import booking_window
+
+    db = await read_db()
+    masters = await repo.get_masters_for_service(db, service_id)
+    first, last = booking_window()
+    per_master = await asyncio.gather(*(
+        _earliest_starts(m["id"], m["eff_duration"], first, last, limit, holder_id=holder_id)
+        for m in masters
+    ))
+    merged = heapq.merge(*(
+        [(ds, t, i) for ds, t in starts] for i, starts in enumerate(per_master)
+    ))
+    result = []
+    for ds, t, i in merged:
+        m = masters[i]
+        result.append({
+            "master_id": m["id"],
+            "master_name": m["display_name"],
+            "duration": m["eff_duration"],
+            "date": ds,
+            "time": m2t(t),
+        })
+        if len(result) == limit:
+            break
+    return result
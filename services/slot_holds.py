@@ -0,0 +1,102 @@
+"""
+Short-lived slot holds for the booking flow.
+
+Picking a time places a hold for SLOT_HOLD_SEC while the client types a
+name and phone.  Other clients do not see held times, so the slot is
+still free when the client confirms; confirmation re-checks the hold and
+the appointment replaces it.  A client has at most one hold; abandoned
+holds simply expire.
+
+Holds live in process memory next to the availability cache.  They are
+applied on top of the cached free starts, so placing or releasing a hold
+never invalidates the cache.
+"""
+from __future__ import annotations
+import time
+from collections import defaultdict
+from dataclasses import dataclass
+
+from config import settings
+
+
+@dataclass
+class Hold:
+    holder_id: int
+    master_id: int
+    date: str
+    start: int   # minutes from midnight
+    end: int
+    expires_at: float
+
+
+class SlotHolds:
+    def __init__(self, ttl_sec: int):
+        self._ttl = ttl_sec
+        self._by_holder: dict[int, Hold] = {}
+        self._by_day: dict[tuple[int, str], list[Hold]] = defaultdict(list)
+
+    def _day(self, master_id: int, date: str) -> list[Hold]:
+        """Live holds on a master's day; expired ones are dropped on the way."""
+        key = (master_id, date)
+        holds = self._by_day.get(key)
+        if not holds:
+            return []
+        now = time.monotonic()
+        live = [h for h in holds if h.expires_at > now]
+        if len(live) != len(holds):
+            for h in holds:
+                if h.expires_at <= now and self._by_holder.get(h.holder_id) is h:
+                    del self._by_holder[h.holder_id]
+            if live:
+                self._by_day[key] = live
+            else:
+                del self._by_day[key]
+        return live
+
+    def place(self, holder_id: int, master_id: int, date: str, start: int, end: int) -> bool:
+        """
+        Hold [start, end) for `holder_id`, replacing the holder's previous
+        hold (or refreshing it).  False if another client holds an
+        overlapping interval.
+        """
+        if any(
+            h.holder_id != holder_id and h.start < end and start < h.end
+            for h in self._day(master_id, date)
+        ):
+            return False
+        self.release(holder_id)
+        hold = Hold(holder_id, master_id, date, start, end, time.monotonic() + self._ttl)
+        self._by_holder[holder_id] = hold
+        self._by_day[(master_id, date)].append(hold)
+        return True
+
+    def release(self, holder_id: int) -> None:
+        hold = self._by_holder.pop(holder_id, None)
+        if hold is None:
+            return
+        key = (hold.master_id, hold.date)
+        holds = [h for h in self._by_day.get(key, ()) if h is not hold]
+        if holds:
+            self._by_day[key] = holds
+        else:
+            self._by_day.pop(key, None)
+
+    def exclude(
+        self,
+        master_id: int,
+        date: str,
+        duration: int,
+        starts: tuple[int, ...],
+        holder_id: int | None = None,
+    ) -> tuple[int, ...]:
+        """`starts` without those overlapping a hold of anyone but `holder_id`."""
+        held = [(h.start, h.end) for h in self._day(master_id, date) if h.holder_id != holder_id]
+        if not held:
+            return starts
+        return tuple(
+            t for t in starts
+            if not any(s < t + duration and t < e for s, e in held)
+        )
+
+
+slot_holds = SlotHolds(settings.SLOT_HOLD_SEC)
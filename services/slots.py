@@ -2,12 +2,16 @@
 Free-slot calculation.
 """
 from __future__ import annotations
-from datetime import datetime, date as date_type
+from datetime import datetime, date as date_type, timedelta
+from typing import TYPE_CHECKING
 
 import pytz
 
 from config import settings
 
+if TYPE_CHECKING:
+    from services.day_context import DayContext
+
 
 def t2m(t: str) -> int:
     """HH:MM → minutes from midnight."""
@@ -25,72 +29,165 @@ def overlaps(s1: str, e1: str, s2: str, e2: str) -> bool:
     return t2m(s1) < t2m(e2) and t2m(s2) < t2m(e1)
 
 
+def _busy(ctx: DayContext, exclude_apt_id: int | None) -> list[tuple[int, int]]:
+    return [
+        *ctx.breaks,
+        *ctx.blocks,
+        *((s, e) for apt_id, s, e in ctx.appointments if apt_id != exclude_apt_id),
+    ]
+
+
+def free_starts_reference(
+    ctx: DayContext, service_duration: int, exclude_apt_id: int | None = None
+) -> list[int]:
+    """
+    Straightforward implementation: test every candidate start against every
+    busy interval.  Kept as the reference for `free_starts`.
+    """
+    busy = _busy(ctx, exclude_apt_id)
+    starts: list[int] = []
+    t = ctx.work_start
+    while t + service_duration <= ctx.work_end:
+        end = t + service_duration
+        if not any(s < end and t < e for s, e in busy):
+            starts.append(t)
+        t += ctx.step
+    return starts
+
+
+def free_starts(
+    ctx: DayContext, service_duration: int, exclude_apt_id: int | None = None
+) -> list[int]:
+    """
+    Free start minutes in a single pass.
+
+    A busy interval [s, e) rules out exactly the starts t with
+    s - duration < t < e.  Those forbidden ranges are sorted and merged once,
+    then the candidate starts are walked together with the ranges, jumping
+    over each blocked range instead of testing it slot by slot.
+    Returns the same result as `free_starts_reference`.
+    """
+    d = service_duration
+    forbidden: list[list[int]] = []
+    for lo, hi in sorted((s - d + 1, e - 1) for s, e in _busy(ctx, exclude_apt_id)):
+        if lo > hi:
+            continue
+        if forbidden and lo <= forbidden[-1][1] + 1:
+            forbidden[-1][1] = max(forbidden[-1][1], hi)
+        else:
+            forbidden.append([lo, hi])
+
+    starts: list[int] = []
+    first, step, last = ctx.work_start, ctx.step, ctx.work_end - d
+    t, i = first, 0
+    while t <= last:
+        while i < len(forbidden) and forbidden[i][1] < t:
+            i += 1
+        if i < len(forbidden) and forbidden[i][0] <= t:
+            # Jump to the first candidate past the blocked range
+            hi = forbidden[i][1]
+            t = first + ((hi - first) // step + 1) * step
+            continue
+        starts.append(t)
+        t += step
+    return starts
+
+
+def apply_cutoff(date_str: str, starts: list[int]) -> list[int]:
+    """Drop starts that are already (nearly) past when `date_str` is today."""
+    date_obj = datetime.strptime(date_str, "%Y-%m-%d").date()
+    tz = pytz.timezone(settings.TIMEZONE)
+    now = datetime.now(tz)
+    if date_obj == now.date():
+        cutoff = now.hour * 60 + now.minute + 30  # 30-min buffer
+        return [t for t in starts if t >= cutoff]
+    return starts
+
+
+async def get_free_starts(
+    master_id: int,
+    service_duration: int,
+    date_from: str,
+    date_to: str,
+    exclude_apt_id: int | None = None,
+    holder_id: int | None = None,
+) -> dict[str, tuple[int, ...]]:
+    """
+    {YYYY-MM-DD: free start minutes} for every date in [date_from, date_to],
+    before the "today" cutoff.  Served from the availability cache; the days
+    that are missing are computed from one range load and cached.  Times
+    held by clients other than `holder_id` are left out.
+    """
+    from services.availability_cache import availability_cache
+    from services.day_context import load_day_contexts
+    from services.slot_holds import slot_holds
+
+    d0, d1 = date_type.fromisoformat(date_from), date_type.fromisoformat(date_to)
+    dates = [(d0 + timedelta(days=i)).isoformat() for i in range((d1 - d0).days + 1)]
+    result: dict[str, tuple[int, ...]] = {}
+    missing: list[str] = []
+    for ds in dates:
+        starts = availability_cache.get((master_id, ds, service_duration, exclude_apt_id))
+        if starts is None:
+            missing.append(ds)
+        else:
+            result[ds] = starts
+
+    if missing:
+        generation = availability_cache.generation
+        contexts = await load_day_contexts(master_id, missing[0], missing[-1])
+        for ds in missing:
+            ctx = contexts[ds]
+            starts = tuple(free_starts(ctx, service_duration, exclude_apt_id)) if ctx else ()
+            availability_cache.put(
+                (master_id, ds, service_duration, exclude_apt_id), starts, generation
+            )
+            result[ds] = starts
+    return {
+        ds: slot_holds.exclude(master_id, ds, service_duration, result[ds], holder_id)
+        for ds in dates
+    }
+
+
 async def compute_free_slots(
     master_id: int,
     service_duration: int,
     date_str: str,
     exclude_apt_id: int | None = None,
+    holder_id: int | None = None,
 ) -> list[str]:
     """
     Returns list of HH:MM start times that are free for the given master
     to perform a service of `service_duration` minutes on `date_str`.
     """
-    from db import repositories as repo
-    from db.database import get_db
-
-    db = await get_db()
-    date_obj = datetime.strptime(date_str, "%Y-%m-%d").date()
-    weekday = date_obj.weekday()  # 0=Mon … 6=Sun
-
-    master = await repo.get_master_by_id(db, master_id)
-    if not master:
-        return []
-
-    # ── Work rule ────────────────────────────────────────────
-    work_rule = None
-    if master["allow_personal_schedule"]:
-        work_rule = await repo.get_master_work_rule(db, master_id, weekday)
-    if not work_rule:
-        work_rule = await repo.get_work_rule(db, weekday)
-    if not work_rule:
-        return []  # day off
-
-    # ── Breaks ───────────────────────────────────────────────
-    breaks = []
-    if master["allow_personal_schedule"]:
-        breaks = await repo.get_master_breaks(db, master_id, weekday)
-    if not breaks:
-        breaks = await repo.get_breaks(db, weekday)
-
-    # ── Blocks (global + master-specific) ────────────────────
-    blocks = await repo.get_blocks_for_date(db, date_str, master_id)
-
-    # ── Existing active appointments ──────────────────────────
-    appointments = await repo.get_active_appointments_for_master_on_date(db, master_id, date_str)
-    if exclude_apt_id:
-        appointments = [a for a in appointments if a["id"] != exclude_apt_id]
-
-    start_m = t2m(work_rule["start_time"])
-    end_m = t2m(work_rule["end_time"])
-    step = work_rule["slot_step_min"]
-
-    slots: list[str] = []
-    t = start_m
-    while t + service_duration <= end_m:
-        slot_s = m2t(t)
-        slot_e = m2t(t + service_duration)
-
-        if not any(overlaps(slot_s, slot_e, b["start_time"], b["end_time"]) for b in breaks):
-            if not any(overlaps(slot_s, slot_e, b["start_time"], b["end_time"]) for b in blocks):
-                if not any(overlaps(slot_s, slot_e, a["start_time"], a["end_time"]) for a in appointments):
-                    slots.append(slot_s)
-        t += step
+    days = await get_free_starts(
+        master_id, service_duration, date_str, date_str, exclude_apt_id, holder_id
+    )
+    return [m2t(t) for t in apply_cutoff(date_str, list(days[date_str]))]
 
-    # Filter past slots when date is today
-    tz = pytz.timezone(settings.TIMEZONE)
-    now = datetime.now(tz)
-    if date_obj == now.date():
-        cutoff = now.hour * 60 + now.minute + 30  # 30-min buffer
-        slots = [s for s in slots if t2m(s) >= cutoff]
 
-    return slots
+async def compute_month_availability(
+    master_id: int,
+    service_duration: int,
+    year: int,
+    month: int,
+    exclude_apt_id: int | None = None,
+    holder_id: int | None = None,
+) -> dict[str, bool]:
+    """
+    {YYYY-MM-DD: has_free_slots} for every bookable day of the month,
+    computed from a single range load instead of one query set per day.
+    """
+    import calendar
+    from services.calendar_utils import booking_window
+
+    first, last = booking_window()
+    month_first = date_type(year, month, 1)
+    month_last = date_type(year, month, calendar.monthrange(year, month)[1])
+    lo, hi = max(first, month_first), min(last, month_last)
+    if lo > hi:
+        return {}
+    days = await get_free_starts(
+        master_id, service_duration, lo.isoformat(), hi.isoformat(), exclude_apt_id, holder_id
+    )
+    return {ds: bool(apply_cutoff(ds, list(starts))) for ds, starts in days.items()}
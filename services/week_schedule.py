@@ -0,0 +1,124 @@
+"""
+Compact text format for a whole week of work rules and breaks.
+
+    Пн-Пт 09:00-19:00/30; перерыв 13:00-14:00
+    Сб 10:00-16:00
+    Вс выходной
+
+Clauses are separated by ";" or new lines.  A day clause names days (Пн…Вс
+or Mon…Sun, ranges with "-", lists with ",") followed by HH:MM-HH:MM and an
+optional /step in minutes (30 by default), or "выходной" / "off".  A break
+clause ("перерыв" / "break") applies to the days of the day clause before
+it.  Days that are not mentioned are days off: the text replaces the week.
+
+A master's personal week only overrides the salon: a day without a
+personal rule follows the salon's hours and a day without personal breaks
+gets the salon's breaks.  There it is written "салон" / "salon" instead of
+"выходной", which a personal week cannot express.
+"""
+from __future__ import annotations
+import re
+
+from services.validation import validate_time
+from utils.formatting import WEEKDAY_SHORT
+
+DEFAULT_STEP = 30
+
+_DAY_NAMES = {
+    **{name.lower(): i for i, name in enumerate(WEEKDAY_SHORT)},
+    **{name: i for i, name in enumerate(("mon", "tue", "wed", "thu", "fri", "sat", "sun"))},
+}
+_OFF_WORDS = {"выходной", "off"}
+_SALON_WORDS = {"салон", "salon"}
+_BREAK_WORDS = {"перерыв", "break"}
+_HOURS_RE = re.compile(r"^(\d{2}:\d{2})-(\d{2}:\d{2})(?:/(\d+))?$")
+
+
+def _parse_days(text: str) -> list[int]:
+    days: list[int] = []
+    for part in text.lower().split(","):
+        first, _, last = part.strip().partition("-")
+        if first not in _DAY_NAMES or (last and last not in _DAY_NAMES):
+            raise ValueError(f"Неизвестный день: {part.strip()}")
+        lo, hi = _DAY_NAMES[first], _DAY_NAMES[last or first]
+        if hi < lo:
+            raise ValueError(f"Неверный диапазон дней: {part.strip()}")
+        days.extend(range(lo, hi + 1))
+    return days
+
+
+def _parse_hours(text: str) -> tuple[str, str, int | None]:
+    match = _HOURS_RE.match(text.replace(" ", ""))
+    if not match or not (validate_time(match[1]) and validate_time(match[2])):
+        raise ValueError(f"Ожидалось ЧЧ:ММ-ЧЧ:ММ: {text}")
+    start, end, step = match[1], match[2], match[3]
+    if start >= end:
+        raise ValueError(f"Начало должно быть раньше конца: {text}")
+    if step is not None and not 5 <= int(step) <= 120:
+        raise ValueError(f"Шаг должен быть от 5 до 120 минут: {text}")
+    return start, end, int(step) if step else None
+
+
+def parse_week(text: str, personal: bool = False) -> dict[int, dict]:
+    """
+    {weekday: {"start", "end", "step", "breaks": [(start, end), …]}} for the
+    working days of the week (`personal`: the days with personal hours).
+    Raises ValueError with a user-facing message.
+    """
+    week: dict[int, dict] = {}
+    current: list[int] = []
+    for clause in re.split(r"[;\n]", text):
+        clause = clause.strip()
+        if not clause:
+            continue
+        head, _, rest = clause.partition(" ")
+        rest = rest.strip()
+        if head.lower() in _BREAK_WORDS:
+            if not current:
+                raise ValueError(f"Перерыв без дней перед ним: {clause}")
+            start, end, step = _parse_hours(rest)
+            if step is not None:
+                raise ValueError(f"У перерыва не бывает шага: {clause}")
+            for wd in current:
+                day = week[wd]
+                if not (day["start"] <= start and end <= day["end"]):
+                    raise ValueError(f"Перерыв вне рабочего времени: {clause}")
+                day["breaks"].append((start, end))
+            continue
+        days = _parse_days(head)
+        if rest.lower() in _OFF_WORDS and personal:
+            raise ValueError(
+                f"Личный выходной задать нельзя: день без личных часов идёт "
+                f"по расписанию салона, напишите «салон»: {clause}"
+            )
+        if rest.lower() in _SALON_WORDS and not personal:
+            raise ValueError(f"«салон» бывает только в личном расписании: {clause}")
+        if rest.lower() in _OFF_WORDS | _SALON_WORDS:
+            for wd in days:
+                week.pop(wd, None)
+            current = []
+            continue
+        start, end, step = _parse_hours(rest)
+        for wd in days:
+            week[wd] = {"start": start, "end": end, "step": step or DEFAULT_STEP, "breaks": []}
+        current = days
+    return dict(sorted(week.items()))
+
+
+def format_week(rules: list[dict], breaks: list[dict], personal: bool = False) -> str:
+    """Render work rules and breaks in the format `parse_week` accepts."""
+    by_day = {r["weekday"]: r for r in rules}
+    breaks_by_day: dict[int, list[tuple[str, str]]] = {}
+    for b in breaks:
+        breaks_by_day.setdefault(b["weekday"], []).append((b["start_time"], b["end_time"]))
+    lines = []
+    for wd in range(7):
+        rule = by_day.get(wd)
+        if not rule:
+            lines.append(f"{WEEKDAY_SHORT[wd]} {'салон' if personal else 'выходной'}")
+            continue
+        line = f"{WEEKDAY_SHORT[wd]} {rule['start_time']}-{rule['end_time']}/{rule['slot_step_min']}"
+        for start, end in sorted(breaks_by_day.get(wd, [])):
+            line += f"; перерыв {start}-{end}"
+        lines.append(line)
+    return "\n".join(lines)
@@ -2,72 +2,336 @@ from __future__ import annotations
 """
 Persistent FSM storage backed by SQLite.
 Survives bot restarts.
+
+Records are kept in an in-memory LRU in front of `fsm_data`:
+  • write_through – every change is written (and committed) immediately,
+                    reads are served from memory;
+  • write_back    – changes only mark the record dirty; dirty records are
+                    flushed every FSM_FLUSH_INTERVAL_SEC and on close().
+
+`update_data` and `update_state_and_data` merge into the stored JSON with a
+single statement (SQLite JSON1 `json_set`) instead of read + rewrite, and
+`transition()` lets handlers change state and data with one commit.
+
+Every row carries `updated_at` (unix time of the last write).  A cleared
+record deletes its row, and `collect_garbage()` removes rows untouched for
+FSM_TTL_HOURS in bounded batches.
 """
+import asyncio
+import copy
 import json
+import logging
+import time
+from collections import OrderedDict
+from dataclasses import dataclass, field
 from typing import Any, Dict, Optional
 
+from aiogram.fsm.context import FSMContext
 from aiogram.fsm.storage.base import BaseStorage, StorageKey
 
-from db.database import get_db
+from config import settings
+from db.database import get_db, read_db
+from db.coalescer import commit
+
+log = logging.getLogger(__name__)
+
+WRITE_THROUGH = "write_through"
+WRITE_BACK = "write_back"
+
+_UPSERT = """INSERT INTO fsm_data (storage_key, state, data, updated_at)
+             VALUES (?, ?, ?, ?)
+             ON CONFLICT(storage_key)
+             DO UPDATE SET state=excluded.state, data=excluded.data,
+                           updated_at=excluded.updated_at"""
+_DELETE = "DELETE FROM fsm_data WHERE storage_key=?"
+_GC_RETURNING = """RETURNING length(storage_key) + COALESCE(length(state), 0)
+                             + COALESCE(length(data), 0) AS size"""
+# Two statements so each batch seeks an index: an OR of both conditions
+# can use neither and scans the whole table every time
+_GC_STALE = f"""DELETE FROM fsm_data WHERE rowid IN (
+                    SELECT rowid FROM fsm_data WHERE updated_at < ? LIMIT ?)
+                {_GC_RETURNING}"""   # idx_fsm_data_updated
+_GC_EMPTY = f"""DELETE FROM fsm_data WHERE rowid IN (
+                    SELECT rowid FROM fsm_data
+                    WHERE state IS NULL AND COALESCE(data, '') IN ('', '{{}}')
+                    LIMIT ?)
+                {_GC_RETURNING}"""   # partial index idx_fsm_data_empty
+
+
+def _merge_sql(keys: list[str], set_state: bool) -> str | None:
+    """
+    Upsert that shallow-merges `keys` into the stored JSON (dict.update
+    semantics: json(?) makes objects replace, not deep-merge, and keeps
+    nulls).  None if a key cannot be used in a JSON path.
+    """
+    if any(c in k for k in keys for c in "\\\"'"):
+        return None
+    paths = "".join(f", '$.\"{k}\"', json(?)" for k in keys)
+    state_sql = "state=excluded.state, " if set_state else ""
+    return f"""INSERT INTO fsm_data (storage_key, state, data, updated_at)
+               VALUES (?, ?, ?, ?)
+               ON CONFLICT(storage_key)
+               DO UPDATE SET {state_sql}updated_at=excluded.updated_at,
+                   data=json_set(COALESCE(NULLIF(fsm_data.data, ''), '{{}}'){paths})
+               RETURNING state, data, updated_at"""
 
 
 def _key(k: StorageKey) -> str:
     return f"{k.bot_id}:{k.chat_id}:{k.user_id}:{k.destiny}"
 
 
+@dataclass
+class _Record:
+    state: Optional[str] = None
+    data: Dict[str, Any] = field(default_factory=dict)
+    written_at: int = 0   # unix time of the last write (fsm_data.updated_at)
+
+    @property
+    def empty(self) -> bool:
+        return self.state is None and not self.data
+
+
+def _row_params(k: str, r: _Record) -> tuple:
+    return (k, r.state, json.dumps(r.data, ensure_ascii=False), r.written_at)
+
+
+def _decode(raw: str | None) -> Dict[str, Any]:
+    if raw:
+        try:
+            return json.loads(raw)
+        except Exception:
+            return {}
+    return {}
+
+
 class SqliteStorage(BaseStorage):
+    def __init__(
+        self,
+        durability: str = settings.FSM_DURABILITY,
+        cache_size: int = settings.FSM_CACHE_SIZE,
+        flush_interval: float = settings.FSM_FLUSH_INTERVAL_SEC,
+    ) -> None:
+        if durability not in (WRITE_THROUGH, WRITE_BACK):
+            raise ValueError(f"Unknown FSM durability mode: {durability!r}")
+        self._durability = durability
+        self._cache_size = cache_size
+        self._flush_interval = flush_interval
+        self._cache: OrderedDict[str, _Record] = OrderedDict()
+        # Records changed since the last flush; outlives LRU eviction
+        self._dirty: dict[str, _Record] = {}
+        self._flush_task: asyncio.Task | None = None
+
+    # ── cache ────────────────────────────────────────────────
+
+    def _remember(self, k: str, record: _Record) -> _Record:
+        self._cache[k] = record
+        self._cache.move_to_end(k)
+        while len(self._cache) > self._cache_size:
+            self._cache.popitem(last=False)
+        return record
+
+    async def _load(self, k: str) -> _Record:
+        record = self._cache.get(k) or self._dirty.get(k)
+        if record is not None:
+            return self._remember(k, record)
+        db = await read_db()
+        cur = await db.execute(
+            "SELECT state, data, updated_at FROM fsm_data WHERE storage_key=?", (k,)
+        )
+        row = await cur.fetchone()
+        # A concurrent write may have created the record while we waited
+        record = self._cache.get(k) or self._dirty.get(k)
+        if record is None:
+            record = (
+                _Record(row["state"], _decode(row["data"]), row["updated_at"])
+                if row else _Record()
+            )
+        return self._remember(k, record)
+
+    async def _store(self, k: str, record: _Record) -> None:
+        record.written_at = int(time.time())
+        if self._durability == WRITE_THROUGH:
+            db = await get_db()
+            if record.empty:
+                await db.execute(_DELETE, (k,))
+            else:
+                await db.execute(_UPSERT, _row_params(k, record))
+            await commit(db)
+            return
+        self._dirty[k] = record
+        if self._flush_task is None:
+            self._flush_task = asyncio.create_task(self._flush_loop())
+
+    # ── flushing ─────────────────────────────────────────────
+
+    async def _flush_loop(self) -> None:
+        while True:
+            await asyncio.sleep(self._flush_interval)
+            try:
+                await self.flush()
+            except Exception:
+                log.exception("FSM flush failed; will retry")
+
+    async def flush(self) -> None:
+        """Write all dirty records to `fsm_data` in one transaction."""
+        if not self._dirty:
+            return
+        pending, self._dirty = self._dirty, {}
+        # Serialise before awaiting so later changes land in the next flush
+        upserts = [_row_params(k, r) for k, r in pending.items() if not r.empty]
+        deletes = [(k,) for k, r in pending.items() if r.empty]
+        try:
+            db = await get_db()
+            if upserts:
+                await db.executemany(_UPSERT, upserts)
+            if deletes:
+                await db.executemany(_DELETE, deletes)
+            await commit(db)
+        except Exception:
+            for k, r in pending.items():
+                self._dirty.setdefault(k, r)
+            raise
+
+    # ── garbage collection ───────────────────────────────────
+
+    async def collect_garbage(
+        self,
+        ttl_sec: int = settings.FSM_TTL_HOURS * 3600,
+        batch_size: int = settings.FSM_GC_BATCH,
+    ) -> tuple[int, int]:
+        """
+        Delete rows not written for `ttl_sec` and rows with neither state nor
+        data, `batch_size` rows per transaction.
+        Returns (rows_deleted, bytes_reclaimed).
+        """
+        cutoff = int(time.time()) - ttl_sec
+        for k, record in list(self._cache.items()):
+            if record.written_at < cutoff and k not in self._dirty:
+                del self._cache[k]
+        db = await get_db()
+        rows = size = 0
+        for sql, params in ((_GC_STALE, (cutoff, batch_size)), (_GC_EMPTY, (batch_size,))):
+            while True:
+                cur = await db.execute(sql, params)
+                batch = await cur.fetchall()
+                await commit(db)
+                rows += len(batch)
+                size += sum(r["size"] for r in batch)
+                if len(batch) < batch_size:
+                    break
+                await asyncio.sleep(0)  # let updates in between batches
+        return rows, size
+
+    async def gc_forever(
+        self, interval_sec: float = settings.FSM_GC_INTERVAL_SEC
+    ) -> None:
+        while True:
+            try:
+                rows, size = await self.collect_garbage()
+                if rows:
+                    log.info("FSM GC: removed %d rows, %d bytes", rows, size)
+            except Exception:
+                log.exception("FSM GC failed")
+            await asyncio.sleep(interval_sec)
+
+    # ── BaseStorage API ──────────────────────────────────────
+
     async def set_state(
         self, key: StorageKey, state=None
     ) -> None:
-        db = await get_db()
         k = _key(key)
         # aiogram may pass a State object — convert it to its string form
         if state is not None and not isinstance(state, str):
             state = state.state
-        await db.execute(
-            """INSERT INTO fsm_data (storage_key, state)
-               VALUES (?, ?)
-               ON CONFLICT(storage_key)
-               DO UPDATE SET state=excluded.state""",
-            (k, state),
-        )
-        await db.commit()
+        record = await self._load(k)
+        record.state = state
+        await self._store(k, record)
 
     async def get_state(self, key: StorageKey) -> Optional[str]:
-        db = await get_db()
-        cur = await db.execute(
-            "SELECT state FROM fsm_data WHERE storage_key=?", (_key(key),)
-        )
-        row = await cur.fetchone()
-        return row["state"] if row else None
+        return (await self._load(_key(key))).state
 
     async def set_data(
         self, key: StorageKey, data: Dict[str, Any]
     ) -> None:
-        db = await get_db()
         k = _key(key)
-        await db.execute(
-            """INSERT INTO fsm_data (storage_key, data)
-               VALUES (?, ?)
-               ON CONFLICT(storage_key)
-               DO UPDATE SET data=excluded.data""",
-            (k, json.dumps(data, ensure_ascii=False)),
-        )
-        await db.commit()
+        record = await self._load(k)
+        record.data = copy.deepcopy(dict(data))
+        await self._store(k, record)
 
     async def get_data(self, key: StorageKey) -> Dict[str, Any]:
+        return copy.deepcopy((await self._load(_key(key))).data)
+
+    async def update_data(
+        self, key: StorageKey, data: Dict[str, Any]
+    ) -> Dict[str, Any]:
+        return await self._merge(_key(key), data)
+
+    async def update_state_and_data(
+        self, key: StorageKey, state, data: Dict[str, Any]
+    ) -> Dict[str, Any]:
+        """`update_data` + `set_state` as one operation."""
+        if state is not None and not isinstance(state, str):
+            state = state.state
+        return await self._merge(_key(key), data, state=state, set_state=True)
+
+    async def set_state_and_data(
+        self, key: StorageKey, state, data: Dict[str, Any]
+    ) -> None:
+        """`set_state` + `set_data` as one upsert."""
+        k = _key(key)
+        if state is not None and not isinstance(state, str):
+            state = state.state
+        record = self._cache.get(k) or self._dirty.get(k) or _Record()
+        record.state = state
+        record.data = copy.deepcopy(dict(data))
+        self._remember(k, record)
+        await self._store(k, record)
+
+    async def _merge(
+        self, k: str, data: Dict[str, Any], state: Optional[str] = None, set_state: bool = False
+    ) -> Dict[str, Any]:
+        data = copy.deepcopy(dict(data))
+        sql = _merge_sql(list(data), set_state) if data else None
+        if self._durability == WRITE_BACK or sql is None:
+            record = await self._load(k)
+            record.data.update(data)
+            if set_state:
+                record.state = state
+            await self._store(k, record)
+            return copy.deepcopy(record.data)
+
         db = await get_db()
+        values = [json.dumps(v, ensure_ascii=False) for v in data.values()]
         cur = await db.execute(
-            "SELECT data FROM fsm_data WHERE storage_key=?", (_key(key),)
+            sql,
+            (k, state, json.dumps(data, ensure_ascii=False), int(time.time()), *values),
         )
         row = await cur.fetchone()
-        if row and row["data"]:
-            try:
-                return json.loads(row["data"])
-            except Exception:
-                return {}
-        return {}
+        await commit(db)
+        record = self._remember(
+            k, _Record(row["state"], _decode(row["data"]), row["updated_at"])
+        )
+        return copy.deepcopy(record.data)
 
     async def close(self) -> None:
-        from db.database import close_db
-        await close_db()
+        """
+        Flush buffered state.  Runs as the dispatcher's first shutdown step;
+        the shared connection is closed by main once background jobs stopped.
+        """
+        if self._flush_task is not None:
+            self._flush_task.cancel()
+            self._flush_task = None
+        await self.flush()
+
+
+async def transition(state: FSMContext, new_state, **data: Any) -> Dict[str, Any]:
+    """
+    `state.update_data(**data)` followed by `state.set_state(new_state)`,
+    done as a single storage write when the storage supports it.
+    """
+    storage = state.storage
+    if isinstance(storage, SqliteStorage):
+        return await storage.update_state_and_data(state.key, new_state, data)
+    merged = await state.update_data(**data)
+    await state.set_state(new_state)
+    return merged
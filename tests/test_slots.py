@@ -0,0 +1,43 @@
+"""free_starts must agree with the nested-loop free_starts_reference."""
+import os
+import random
+
+os.environ.setdefault("BOT_TOKEN", "0:test")
+
+from services.day_context import DayContext  # noqa: E402
+from services.slots import free_starts, free_starts_reference  # noqa: E402
+
+
+def _intervals(rng: random.Random, n: int) -> tuple[tuple[int, int], ...]:
+    # Includes zero-length and inverted intervals, and ones outside the day
+    result = []
+    for _ in range(n):
+        s = rng.randrange(0, 24 * 60)
+        result.append((s, s + rng.randrange(-30, 240)))
+    return tuple(sorted(result))
+
+
+def _random_context(rng: random.Random) -> DayContext:
+    work_start = rng.randrange(0, 14 * 60)
+    return DayContext(
+        date="2030-01-01",
+        work_start=work_start,
+        work_end=work_start + rng.randrange(0, 12 * 60),
+        step=rng.choice((5, 10, 15, 20, 30, 45, 60)),
+        breaks=_intervals(rng, rng.randrange(0, 3)),
+        blocks=_intervals(rng, rng.randrange(0, 3)),
+        appointments=tuple(
+            (i, s, e) for i, (s, e) in enumerate(_intervals(rng, rng.randrange(0, 10)))
+        ),
+    )
+
+
+def test_free_starts_matches_reference():
+    rng = random.Random(20260101)
+    for _ in range(30_000):
+        ctx = _random_context(rng)
+        duration = rng.choice((15, 30, 45, 60, 90, 120))
+        exclude = rng.choice((None, 0, 1))
+        assert free_starts(ctx, duration, exclude) == free_starts_reference(
+            ctx, duration, exclude
+        ), (ctx, duration, exclude)
@@ -21,6 +21,14 @@ STATUS_LABELS = {
     "rescheduled":        "📆 Перенесена",
 }
 
+# Why an appointment_states transition was refused, for callback alerts
+TRANSITION_ERRORS = {
+    "not_found": "Запись не найдена.",
+    "conflict":  "Статус записи уже изменился — обновите список.",
+    "overlap":   "Не удалось принять перенос — время уже занято.",
+    "error":     "Не удалось сохранить, попробуйте ещё раз.",
+}
+
 
 def fmt_date(date_str: str) -> str:
     """'2024-03-15' → '15 марта (Пт)'"""
@@ -0,0 +1,41 @@
+"""
+Keyset page cursors in callback data.
+
+A cursor is the (date, start_time, id) key of a row on the current page,
+packed as YYYYMMDD:HHMM:id.  Page buttons carry
+"{prefix}:{direction}:{cursor}" where direction is "n" (next) or "p" (prev),
+which keeps them far below Telegram's 64-byte callback data limit.
+"""
+from __future__ import annotations
+
+from aiogram.types import InlineKeyboardButton
+
+
+def encode_cursor(key: tuple[str, str, int]) -> str:
+    date_str, time_str, apt_id = key
+    return f"{date_str.replace('-', '')}:{time_str.replace(':', '')}:{apt_id}"
+
+
+def decode_cursor(raw: str) -> tuple[str, str, int]:
+    raw_date, raw_time, apt_id = raw.split(":")
+    return (
+        f"{raw_date[:4]}-{raw_date[4:6]}-{raw_date[6:]}",
+        f"{raw_time[:2]}:{raw_time[2:]}",
+        int(apt_id),
+    )
+
+
+def parse_page_callback(data: str) -> tuple[str, tuple[str, str, int], bool]:
+    """"{prefix}:{kind}:{direction}:{cursor}" → (kind, cursor, backward)."""
+    _, kind, direction, raw = data.split(":", 3)
+    return kind, decode_cursor(raw), direction == "p"
+
+
+def page_nav_row(page: dict, prefix: str) -> list[InlineKeyboardButton]:
+    """◀️ / ▶️ buttons for a repo.get_appointments_page result; empty on a single page."""
+    row = []
+    if page["prev"]:
+        row.append(InlineKeyboardButton(text="◀️", callback_data=f"{prefix}:p:{encode_cursor(page['prev'])}"))
+    if page["next"]:
+        row.append(InlineKeyboardButton(text="▶️", callback_data=f"{prefix}:n:{encode_cursor(page['next'])}"))
+    return row